@@ -8,11 +8,11 @@ from streamlit_folium import st_folium
 
 #IMPORTING FUNCTIONS AND CONSTANTS
 from recommender import (
-    get_vacation_recommendations, 
-    get_emigration_recommendations, 
+    RecommendationSession,
     WEATHER_SCALE, 
     ALL_ATTRACTION_GROUPS
 )
+from chatbot import get_chatbot_response, load_top_attractions
 
 #WELCOME PAGE
 st.set_page_config(page_title="Travel Recommender", page_icon="✈️", layout="wide")
@@ -58,16 +58,19 @@ def load_data():
     """Loads all necessary data from the database once."""
     try:
         conn = sqlite3.connect("travel_recommendation_final.db")
-        df_dest = pd.read_sql_query("SELECT * FROM destinations", conn)
-        df_attr = pd.read_sql_query("SELECT * FROM attractions", conn)
+        #DESTINATIONS WITH THE STATISTICS OF THEIR COUNTRY (A VIEW, OLDER DATABASES HAVE THEM IN THE destinations TABLE)
+        has_details = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'destination_details'").fetchone()
+        df_dest = pd.read_sql_query("SELECT * FROM destination_details" if has_details else "SELECT * FROM destinations", conn)
         conn.close()
+        #THE CHATBOT ONLY NEEDS THE MOST VOTED ATTRACTION OF EVERY DESTINATION
+        top_attractions = load_top_attractions("travel_recommendation_final.db")
         # Handle the different possible names for the 'Country' column
         country_col_name = 'Country_x' if 'Country_x' in df_dest.columns else 'Country'
         df_dest.rename(columns={country_col_name: 'Country'}, inplace=True, errors='ignore')
-        return df_dest, df_attr
+        return df_dest, top_attractions
     except Exception as e:
         st.error(f"FATAL ERROR: Could not load data from the database. Please ensure 'travel_recommendation_final.db' exists. Error: {e}")
-        return pd.DataFrame(), pd.DataFrame()
+        return pd.DataFrame(), {}
 
 @st.cache_data
 def get_language_list(data):
@@ -87,103 +90,6 @@ def get_countries_and_destinations(data):
         return countries, destinations
     return ['STH WENT WRONG', 'STH WENT WRONG'], ['STH WENT WRONG', 'STH WENT WRONG']
 
-# --- Chatbot Logic ---
-def find_entity_in_question(question, entity_list):
-    """Finds a known entity (destination or country) in the user's question."""
-    question_lower = question.lower()
-    for entity in sorted(entity_list, key=len, reverse=True):
-        if entity.lower() in question_lower:
-            return entity
-    return None
-
-def get_chatbot_response(question, dest_data, attr_data, all_destinations, all_countries, all_months):
-    """The main chatbot logic function."""
-    question_lower = question.lower().strip()
-    raw_destinations = [d.split(' - ')[-1] for d in all_destinations]
-    destination = find_entity_in_question(question, raw_destinations)
-    country = find_entity_in_question(question, all_countries) if not destination else None
-    
-    # Rule 1: Greetings
-    if any(word in question_lower for word in ["hello", "hi", "hey"]):
-        return "Hello, welcome to Travel Recommender! Ask me about a destination, the model, flights, or whatever you want! If you are not sure, please type **'help'**!"
-
-    # Rule 2: Help Command
-    if "help" in question_lower:
-        return """
-        I can help you with a few things. Try asking:
-        - **Find data**: "What is the HDI for Germany?" or "Weather in Rome in May?". I can find data for any metric used in the model.
-        - **Explain concepts**: "How do weights work?", "How does the model work?", or "What is HDI?".
-        - **Find top attractions**: "What is the most popular attraction in London?".
-        - **Get a summary**: "Tell me about Warsaw".
-        - **Find deals & info**: "Show me flights to Paris" or "Find hotels in Barcelona".
-        """
-    
-    # First, check for an entity (destination or country)
-    entity = destination if destination else country
-    if entity:
-        if destination: entity_data = dest_data[dest_data['Destination'] == entity]
-        else: entity_data = dest_data[dest_data['Country'] == entity]
-        if entity_data.empty: return f"Sorry, I couldn't find any data for {entity}."
-
-        # Rule 5: Most popular attraction
-        if "most popular" in question_lower and "attraction" in question_lower:
-            if destination and not attr_data.empty:
-                top_attraction = attr_data[attr_data['Destination'] == destination].sort_values(by='No_votes', ascending=False).iloc[0]
-                name = top_attraction['Name']
-                url = f"https://www.google.com/search?q={name.replace(' ', '+')}"
-                return f"The most popular attraction in **{destination}** (based on number of votes) is **{name}**.\n\n[Search for more info here]({url})"
-            else:
-                return "Sorry, I can only find the most popular attraction for a specific destination, not an entire country."
-        
-        # Rule 4: "Tell me about"
-        if "tell me about" in question_lower:
-            data_row = entity_data.iloc[0]
-            info = f"### Summary for **{entity}**:\n"
-            info += f"- **Safety Index:** {data_row.get('Safety_Index', 'N/A')}\n"
-            info += f"- **Cost of Living + Rent Index:** {data_row.get('CostofLivingPlusRentIndex', 'N/A')}\n"
-            info += f"- **Purchasing Power Index:** {data_row.get('LocalPurchasingPowerIndex', 'N/A')}\n"
-            info += f"- **Cuisine Rank:** {data_row.get('Cuisine_Rank', 'N/A')}\n"
-            url = f"https://en.wikipedia.org/wiki/{entity.replace(' ', '_')}"
-            info += f"\n[Read more on Wikipedia]({url})"
-            return info
-
-        # Rule 1: Data lookup from the database
-        data_keywords = {"hdi": ("HDI_Value_Latest", ".3f"),"safety": ("Safety_Index", ".2f"),"cost of living": ("CostofLivingPlusRentIndex", ".2f"),"purchasing power": ("LocalPurchasingPowerIndex", ".2f"),"unemployment": ("Unemployment_Rate_National_Latest_Pct", ".2f"),"inflation": ("Inflation_Rate_National_Latest_Pct", ".2f"),"life expectancy": ("Life_Expectancy", ".2f"),"cuisine rank": ("Cuisine_Rank", ".0f")}
-        for keyword, (col, fmt) in data_keywords.items():
-            if keyword in question_lower and col in entity_data.columns:
-                value = pd.to_numeric(entity_data[col], errors='coerce').mean()
-                return f"The average {keyword.replace('_', ' ')} for **{entity}** is: **{value:{fmt}}**."
-        if "weather" in question_lower:
-            for month in all_months:
-                if month.lower() in question_lower:
-                    month_abbr = month[:3].capitalize()
-                    if month_abbr in entity_data.columns:
-                        weather = entity_data[month_abbr].iloc[0]
-                        return f"The weather in **{entity}** in {month} is typically **{weather}**."
-            return "Please specify a month to get the weather forecast (e.g., 'weather in Paris in July')."
-        
-        # Rule 1: Link generation
-        if "flight" in question_lower:
-            url = f"https://www.google.com/flights?q=flights+from+Lodz+to+{entity.replace(' ', '+')}"
-            return f"Sure, here is a link to search for flights to {entity}:\n[Click here for flights]({url})"
-        if "hotel" in question_lower:
-            url = f"https://www.booking.com/searchresults.html?ss={entity.replace(' ', '+')}"
-            return f"Of course, here is a link to search for hotels in {entity}:\n[Click here for hotels]({url})"
-        if "wikipedia" in question_lower:
-            url = f"https://en.wikipedia.org/wiki/{entity.replace(' ', '_')}"
-            return f"Here is the Wikipedia page for {entity}:\n[Read more on Wikipedia]({url})"
-            
-    # Rule 3: Explanations (checked only if no entity was found)
-    if "how do weights work" in question_lower:
-        return "The weights are like sliders on a DJ's mixing console. A higher weight gives a factor more influence on the final recommendation score, allowing you to tailor the results to what's most important to you."
-    if "how does the model work" in question_lower:
-        return "The model uses a Weighted Scoring System. For each destination, it calculates a score (from 0 to 1) for various factors like weather, budget, and safety. Each score is then multiplied by its user-defined weight. The final score is the sum of all these weighted scores, and the top 10 destinations are recommended."
-    if "what is hdi" in question_lower:
-        return "The **Human Development Index (HDI)** is a summary measure of average achievement in key dimensions of human development: a long and healthy life, being knowledgeable and having a decent standard of living."
-        
-    # Default response
-    return "Sorry, I don't understand that question. Try asking 'help' to see what I can do."
-
 def display_recommendations(recommendations_df, all_data_df):
     """Formats and displays the recommendation dataframe and a map."""
     if recommendations_df is not None and not recommendations_df.empty:
@@ -229,7 +135,7 @@ def display_recommendations(recommendations_df, all_data_df):
 
 # --- Main App ---
 st.title('Personal Travel Recommender')
-main_df, attr_df = load_data()
+main_df, top_attractions = load_data()
 if not main_df.empty:
     st.sidebar.header('Define Your Preferences')
     language_options = get_language_list(main_df)
@@ -282,13 +188,16 @@ if not main_df.empty:
 
         if 'vacation_recs' not in st.session_state:
             st.session_state.vacation_recs = None
+        #THE SESSION KEEPS THE FACTOR SCORES, SO MOVING ONE SLIDER ONLY UPDATES THAT FACTOR
+        if 'vacation_session' not in st.session_state:
+            st.session_state.vacation_session = RecommendationSession('vacation')
         if st.button('Find my perfect vacation!'):
             if not attraction_pref: st.sidebar.error("Please select at least one attraction type (or 'everything').")
             else:
                 vacation_preferences = {'month': month_pref,'weather': weather_pref,'budget': budget_pref,'attractions': attraction_pref,'known_languages': known_languages_pref,'excluded_places': final_excluded_list}
                 vacation_weights = {'weather': w_weather, 'budget': w_budget, 'attractions_quantity': w_attr_quantity, 'attractions_quality': w_attr_quality, 'safety': w_safety, 'attractions_popularity': w_attr_pop, 'english_level': w_eng_level, 'known_languages': w_known_lang, 'distance': w_distance, 'cuisine_quality': w_cuisine}
                 with st.spinner('Thinking...'):
-                    recommendations = get_vacation_recommendations(vacation_preferences, vacation_weights)
+                    recommendations = st.session_state.vacation_session.recommend(vacation_preferences, vacation_weights)
                     st.session_state.vacation_recs = recommendations
                 st.success('Done!')
         if st.session_state.vacation_recs is not None:
@@ -317,11 +226,13 @@ if not main_df.empty:
         
         if 'emigration_recs' not in st.session_state:
             st.session_state.emigration_recs = None
+        if 'emigration_session' not in st.session_state:
+            st.session_state.emigration_session = RecommendationSession('emigration')
         if st.button('Find the best place to live!'):
             emigration_preferences = {'weather': weather_pref_em, 'known_languages': known_languages_pref_em,'excluded_places': final_excluded_list}
             emigration_weights = {'cost_of_living': w_cost_living, 'purchasing_power': w_purchasing_power, 'safety': w_safety_em, 'english_level': w_eng_level_em, 'hdi': w_hdi, 'unemployment': w_unemployment, 'inflation': w_inflation, 'life_expectancy': w_life_exp, 'distance': w_distance_em,'weather': w_weather_em, 'known_languages': w_known_lang_em}
             with st.spinner('Thinking...'):
-                recommendations = get_emigration_recommendations(emigration_preferences, emigration_weights)
+                recommendations = st.session_state.emigration_session.recommend(emigration_preferences, emigration_weights)
                 st.session_state.emigration_recs = recommendations
             st.success('Done!')
         
@@ -345,7 +256,7 @@ if not main_df.empty:
             st.markdown(prompt)
         with st.spinner("Thinking..."):
             raw_destination_names = [d.split(' - ')[-1] for d in destination_options]
-            response = get_chatbot_response(prompt, main_df, attr_df, raw_destination_names, country_options, month_options)
+            response = get_chatbot_response(prompt, main_df, top_attractions, raw_destination_names, country_options, month_options)
             st.session_state.messages.append({"role": "assistant", "content": response})
             with st.chat_message("assistant"):
                 st.markdown(response)
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+from incremental import insert_rows
+from recommender import POPULARITY_RANK_TIERS, attraction_popularity_scores
+
+#PER-DESTINATION ATTRACTION AGGREGATES AND POPULARITY RANK THRESHOLDS, SO THE RECOMMENDER DOES NOT HAVE TO GROUP ALL ATTRACTIONS
+#ON EVERY REQUEST. WRITTEN BY database_creator.py AND BY synthetic_catalog.py, BOTH ADD THEM UP A CHUNK OF ATTRACTIONS AT A TIME
+#AN INCREMENTAL BUILD RECOMPUTES ONLY THE DESTINATIONS WHOSE ATTRACTIONS (OR THEIR POPULARITY SCORES) CHANGED
+
+
+def add_partial_sums(total, partial):
+    """Running per-destination sums, destinations in order of their first appearance."""
+    return partial if total is None else pd.concat([total, partial]).groupby(level=0, sort=False).sum()
+
+
+class VoteRanks:
+    """Popularity ranks from the vote histogram (number of attractions with every vote count).
+
+    The rank of a vote count is the number of attractions with at least as many votes.
+    """
+
+    def __init__(self, vote_histogram, n_attractions):
+        self.vote_histogram = vote_histogram.sort_index()
+        self.n_attractions = n_attractions
+        self._vote_values = self.vote_histogram.index.to_numpy(dtype=float)
+        self._votes_below = np.concatenate([[0], np.cumsum(self.vote_histogram.to_numpy())])
+        self.max_rank = float(self._votes_below[-1]) if self._votes_below[-1] else np.nan
+
+    def ranks(self, votes):
+        votes = votes.to_numpy(dtype=float)
+        ranks = self._votes_below[-1] - self._votes_below[np.searchsorted(self._vote_values, votes, side='left')]
+        return np.where(np.isnan(votes), np.nan, ranks)
+
+    def votes_needed(self, rank):
+        """The lowest vote count which at least `rank` attractions reach."""
+        rank = int(min(rank, self.n_attractions))
+        if rank < 1:
+            return None
+        reached = np.flatnonzero(self._votes_below[-1] - self._votes_below[:-1] >= rank)
+        return self.vote_histogram.index[reached[-1]] if len(reached) else np.nan
+
+
+def stored_vote_ranks(conn):
+    """VoteRanks of the attractions already in SQLite, counted over the votes index."""
+    vote_histogram = pd.read_sql_query("SELECT No_votes, count(*) AS Attractions FROM attractions WHERE No_votes IS NOT NULL GROUP BY No_votes", conn)
+    n_attractions = conn.execute("SELECT count(*) FROM attractions").fetchone()[0]
+    return VoteRanks(vote_histogram.set_index('No_votes')['Attractions'], n_attractions)
+
+
+def top_votes_threshold(conn, top_n):
+    """The fewest votes among the `top_n` attractions in SQLite with the most votes, None if no attraction has votes."""
+    return conn.execute("SELECT min(No_votes) FROM (SELECT No_votes FROM attractions WHERE No_votes IS NOT NULL ORDER BY No_votes DESC LIMIT ?)", (top_n,)).fetchone()[0]
+
+
+def changed_score_votes(old_vote_ranks, new_vote_ranks):
+    """Vote counts whose popularity score differs between two VoteRanks (ranks move with every inserted or deleted vote count)."""
+    votes = pd.Series(old_vote_ranks.vote_histogram.index.union(new_vote_ranks.vote_histogram.index), dtype=float)
+    old_scores = attraction_popularity_scores(old_vote_ranks.ranks(votes), old_vote_ranks.max_rank)
+    new_scores = attraction_popularity_scores(new_vote_ranks.ranks(votes), new_vote_ranks.max_rank)
+    return votes[old_scores != new_scores].tolist()
+
+
+def _temp_values(conn, table, column, values):
+    """A temporary one-column table of `values`, to select rows by them in SQLite."""
+    conn.execute(f'DROP TABLE IF EXISTS temp."{table}"')
+    conn.execute(f'CREATE TEMP TABLE "{table}" ("{column}" PRIMARY KEY)')
+    conn.executemany(f'INSERT INTO temp."{table}" VALUES (?)', [(value,) for value in values])
+    return f'SELECT "{column}" FROM temp."{table}"'
+
+
+def destinations_with_votes(conn, votes):
+    """destination_id of every attraction in SQLite (of a known destination) with one of the vote counts."""
+    selected = _temp_values(conn, 'selected_votes', 'No_votes', votes)
+    return {row[0] for row in conn.execute(f"SELECT DISTINCT destination_id FROM attractions WHERE No_votes IN ({selected}) AND destination_id IS NOT NULL")}
+
+
+def destination_popularity(conn, destination_names):
+    """Popularity_TripAdvisor_Count (votes of all attractions with the name) of every destination name which has attractions in SQLite."""
+    selected = _temp_values(conn, 'selected_destinations', 'Destination', destination_names)
+    return pd.read_sql_query(f"SELECT Destination, coalesce(sum(No_votes), 0) AS Popularity_TripAdvisor_Count FROM attractions WHERE Destination IN ({selected}) GROUP BY Destination", conn)
+
+
+def destination_sums(attractions_chunk, vote_ranks, group_columns):
+    """Attraction count, popularity, rating x votes and votes (overall and per group) of every destination in one chunk of the attractions table."""
+    attraction_stats = attractions_chunk[['destination_id']].copy()
+    attraction_stats['Attraction_Count'] = 1
+    attraction_stats['Attraction_Popularity_Score'] = attraction_popularity_scores(vote_ranks.ranks(attractions_chunk['No_votes']), vote_ranks.max_rank)
+    attraction_stats['Rating_x_Votes_Sum'] = (attractions_chunk['Avg_rating'] * attractions_chunk['No_votes']).fillna(0)
+    attraction_stats['Votes_Sum'] = attractions_chunk['No_votes']
+    #GROUP COUNTS, AND RATING X VOTES / VOTES OF EVERY GROUP (A USER CHOOSING ONE GROUP GETS ITS QUALITY STRAIGHT FROM HERE)
+    for group in group_columns:
+        in_group = attractions_chunk[group] > 0
+        attraction_stats[group] = attractions_chunk[group]
+        attraction_stats[group + '_Rating_x_Votes_Sum'] = attraction_stats['Rating_x_Votes_Sum'].where(in_group, 0)
+        attraction_stats[group + '_Votes_Sum'] = attraction_stats['Votes_Sum'].where(in_group, 0)
+    return attraction_stats.groupby('destination_id', sort=False).sum()
+
+
+def destination_attraction_stats(conn, vote_ranks, group_columns, destination_names, chunk_rows):
+    """The destination_attraction_stats table, from a pass over the attractions already in SQLite (attractions of unknown destinations are left out).
+
+    `destination_names` maps destination_id to Destination.
+    """
+    return _destination_stats(conn, "SELECT * FROM attractions ORDER BY rowid", vote_ranks, group_columns, destination_names, chunk_rows)
+
+
+def _destination_stats(conn, query, vote_ranks, group_columns, destination_names, chunk_rows):
+    sums = None
+    for attractions_chunk in pd.read_sql_query(query, conn, chunksize=chunk_rows):
+        sums = add_partial_sums(sums, destination_sums(attractions_chunk, vote_ranks, group_columns))
+    if sums is None:
+        return None
+    sums = sums.reset_index()
+    sums['destination_id'] = sums['destination_id'].astype('int64')
+    sums.insert(1, 'Destination', sums['destination_id'].map(destination_names))
+    return sums
+
+
+def update_destination_attraction_stats(conn, vote_ranks, group_columns, destination_names, destination_ids, chunk_rows):
+    """Recomputes the rows of destination_attraction_stats of `destination_ids` only, from their attractions in SQLite (an incremental build).
+
+    Returns (rows, inserted, updated, deleted).
+    """
+    selected = _temp_values(conn, 'selected_destination_ids', 'destination_id', sorted(destination_ids))
+    old = pd.read_sql_query(f"SELECT * FROM destination_attraction_stats WHERE destination_id IN ({selected})", conn).set_index('destination_id')
+    new = _destination_stats(conn, f"SELECT * FROM attractions WHERE destination_id IN ({selected}) ORDER BY rowid", vote_ranks, group_columns, destination_names, chunk_rows)
+    new = new.set_index('destination_id') if new is not None else old.iloc[:0]
+    kept = old.index.intersection(new.index)
+    old_kept, new_kept = old.loc[kept, new.columns], new.loc[kept]
+    updated = int((~((old_kept == new_kept) | (old_kept.isna() & new_kept.isna())).all(axis=1)).sum())
+    conn.execute(f"DELETE FROM destination_attraction_stats WHERE destination_id IN ({selected})")
+    insert_rows(conn, 'main."destination_attraction_stats"', new.reset_index())
+    rows = conn.execute("SELECT count(*) FROM destination_attraction_stats").fetchone()[0]
+    return (rows, len(new.index.difference(old.index)), updated, len(old.index.difference(new.index)))
+
+
+def rank_thresholds(vote_ranks, top_n, top_n_threshold):
+    """The attraction_rank_thresholds table: the popularity rank tiers and the Top_200_Popular flag, with the number of votes needed to reach each of them."""
+    max_rank = vote_ranks.max_rank
+    rows = [('Popularity', highest_rank, points, vote_ranks.votes_needed(highest_rank)) for highest_rank, points in POPULARITY_RANK_TIERS]
+    rows.append(('Popularity', max_rank / 2, 0.1, vote_ranks.votes_needed(max_rank / 2)))
+    rows.append(('Popularity', max_rank, 0.05, vote_ranks.votes_needed(max_rank)))
+    rows.append(('Top_200_Popular', top_n, None, top_n_threshold))
+    return pd.DataFrame(rows, columns=['Threshold', 'Rank', 'Score', 'Min_Votes'])
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import recommender
+import synthetic_catalog
+from microbatch import MicroBatcher
+from recommender import ALL_ATTRACTION_GROUPS, MONTH_COLUMNS, WEATHER_SCALE, RecommenderEngine
+
+#SCALING BENCHMARKS OF THE RECOMMENDERS AND THE ETL ON SYNTHETIC CATALOGS
+#python benchmark.py --sizes 1000 10000 100000 --requests 200 --etl
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+#THE SAME WEIGHT PRESETS AS IN app.py
+VACATION_WEIGHTS = [
+    {'weather': 0.25, 'budget': 0.15, 'attractions_quantity': 0.10, 'attractions_quality': 0.15, 'safety': 0.10, 'attractions_popularity': 0.05, 'english_level': 0.05, 'known_languages': 0.05, 'distance': 0.05, 'cuisine_quality': 0.10},
+    {'weather': 0.4, 'budget': 0.5, 'attractions_quantity': 0.1, 'attractions_quality': 0.05, 'safety': 0.1, 'attractions_popularity': 0.0, 'english_level': 0.0, 'known_languages': 0.0, 'distance': 0.1, 'cuisine_quality': 0.05},
+    {'weather': 0.3, 'budget': 0.1, 'attractions_quantity': 0.3, 'attractions_quality': 0.1, 'safety': 0.3, 'attractions_popularity': -0.5, 'english_level': 0.0, 'known_languages': 0.0, 'distance': 0.1, 'cuisine_quality': 0.0},
+]
+EMIGRATION_WEIGHTS = [
+    {'cost_of_living': 0.20, 'purchasing_power': 0.20, 'safety': 0.10, 'english_level': 0.10, 'hdi': 0.10, 'unemployment': 0.10, 'inflation': 0.05, 'life_expectancy': 0.05, 'distance': 0.05, 'weather': 0.05, 'known_languages': 0.0},
+    {'cost_of_living': 0.2, 'purchasing_power': 0.1, 'safety': 0.3, 'english_level': 0.05, 'hdi': 0.2, 'unemployment': 0.05, 'inflation': 0.1, 'life_expectancy': 0.2, 'distance': 0.0, 'weather': 0.0, 'known_languages': 0.0},
+]
+
+
+def random_vacation_profile(rng):
+    preferences = {
+        'month': MONTH_COLUMNS[rng.integers(12)], 'weather': WEATHER_SCALE[rng.integers(len(WEATHER_SCALE))],
+        'budget': ['Budget', 'MidRange', 'Luxury'][rng.integers(3)],
+        'attractions': list(rng.choice(ALL_ATTRACTION_GROUPS, rng.integers(1, 4), replace=False)),
+        'known_languages': ['German'] if rng.random() < 0.3 else [],
+        #SOME USERS EXCLUDE A COUNTRY, WHICH FORCES RE-NORMALISATION
+        'excluded_places': ['Country 00000'] if rng.random() < 0.2 else [],
+    }
+    return preferences, VACATION_WEIGHTS[rng.integers(len(VACATION_WEIGHTS))]
+
+
+def random_emigration_profile(rng):
+    preferences = {'weather': WEATHER_SCALE[rng.integers(len(WEATHER_SCALE))], 'known_languages': [], 'excluded_places': []}
+    return preferences, EMIGRATION_WEIGHTS[rng.integers(len(EMIGRATION_WEIGHTS))]
+
+
+def latency_summary(seconds):
+    milliseconds = np.asarray(seconds) * 1000
+    return {
+        'p50_ms': float(np.percentile(milliseconds, 50)), 'p95_ms': float(np.percentile(milliseconds, 95)),
+        'p99_ms': float(np.percentile(milliseconds, 99)), 'max_ms': float(milliseconds.max()),
+        'throughput_per_s': float(len(milliseconds) / (milliseconds.sum() / 1000)),
+    }
+
+
+def peak_memory(function, *args):
+    """Result of the call and the peak Python/NumPy memory it allocated, in MB."""
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak / 2 ** 20
+
+
+def has_attraction_stats(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'destination_attraction_stats'").fetchone() is not None
+    finally:
+        conn.close()
+
+
+def benchmark_recommenders(db_path, requests, seed=0):
+    """Load time, latency percentiles, throughput and peak memory of both recommenders for one database."""
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    RecommenderEngine(db_path, snapshot=False)
+    load_seconds = time.perf_counter() - start
+    #MEMORY IS MEASURED IN SEPARATE RUNS, TRACEMALLOC SLOWS EVERYTHING DOWN
+    engine, load_peak_mb = peak_memory(RecommenderEngine, db_path, False)
+    results = {'load_s': load_seconds, 'load_peak_mb': load_peak_mb}
+    #COLD START FROM THE MEMORY-MAPPED SNAPSHOT
+    engine.save_snapshot()
+    start = time.perf_counter()
+    RecommenderEngine(db_path)
+    results['snapshot_load_s'] = time.perf_counter() - start
+
+    #THE PUBLIC FUNCTIONS (RESULT CACHE, TRACING, DATABASE CHANGE CHECK) AND THE ENGINE METHODS THEY CALL ON A CACHE MISS,
+    #EACH WITH ITS OWN RANDOM PROFILES (REPEATED PROFILES ARE ANSWERED FROM THE RESULT CACHE BY THE PUBLIC FUNCTIONS)
+    recommender.use_engine(engine)
+    for public, method, profile in [
+        (recommender.get_vacation_recommendations, engine.recommend_vacation, random_vacation_profile),
+        (recommender.get_emigration_recommendations, engine.recommend_emigration, random_emigration_profile),
+    ]:
+        for function in (public, method):
+            profiles = [profile(rng) for _ in range(requests)]
+            function(*profiles[0])
+            latencies = []
+            for preferences, weights in profiles:
+                start = time.perf_counter()
+                function(preferences, weights)
+                latencies.append(time.perf_counter() - start)
+            summary = latency_summary(latencies)
+            _, summary['peak_mb'] = peak_memory(function, *profile(rng))
+            results[function.__name__] = summary
+    results['result_cache'] = recommender.recommendation_cache_stats()
+
+    #THE SAME PROFILES SCORED AS ONE BATCH
+    profiles = [random_vacation_profile(rng) for _ in range(requests)]
+    start = time.perf_counter()
+    engine.recommend_vacation_batch(profiles)
+    results['vacation_batch_profiles_per_s'] = requests / (time.perf_counter() - start)
+    #THE SAME PROFILES AS CONCURRENT REQUESTS THROUGH THE MICRO-BATCHING FRONT END
+    results['vacation_microbatch'] = benchmark_microbatch(engine, profiles)
+    return results
+
+
+def benchmark_microbatch(engine, profiles, concurrency=64):
+    """Latency and throughput of `concurrency` clients sending the profiles through one MicroBatcher."""
+    async def run():
+        batcher = MicroBatcher(engine)
+        slots = asyncio.Semaphore(concurrency)
+        latencies = []
+        async def client(preferences, weights):
+            async with slots:
+                start = time.perf_counter()
+                await batcher.vacation(preferences, weights)
+                latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await asyncio.gather(*(client(preferences, weights) for preferences, weights in profiles))
+        elapsed = time.perf_counter() - start
+        await batcher.close()
+        summary = latency_summary(latencies)
+        #CLIENTS WAIT FOR EACH OTHER, SO THROUGHPUT IS REQUESTS OVER WALL TIME AND NOT OVER THE SUM OF LATENCIES
+        summary['throughput_per_s'] = len(profiles) / elapsed
+        summary['average_batch'] = batcher.stats()['average_batch']
+        return summary
+    return asyncio.run(run())
+
+
+def benchmark_etl(n_destinations, per_destination, seed=0, chunk_rows=None):
+    """Runs database_creator.py on synthetic source files (with --chunk-rows if given), returns its wall time and peak RSS."""
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic_catalog.write_source_csvs(directory, n_destinations, per_destination, seed)
+        #THE ETL RUNS IN ITS OWN PROCESS, SO ITS PEAK RSS IS NOT MIXED WITH THIS ONE
+        script = (
+            "import resource, runpy, sys, time; sys.path.insert(0, %r); sys.argv = %r; start = time.perf_counter(); "
+            "runpy.run_path(%r, run_name='__main__'); "
+            "print('BENCHMARK', time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+        ) % (REPO_DIR, ['database_creator.py'] + (['--chunk-rows', str(chunk_rows)] if chunk_rows else []), os.path.join(REPO_DIR, 'database_creator.py'))
+        output = subprocess.run([sys.executable, '-c', script], cwd=directory, capture_output=True, text=True, check=True).stdout
+    _, seconds, max_rss_kb = output.strip().splitlines()[-1].split()
+    return {'etl_s': float(seconds), 'etl_peak_rss_mb': int(max_rss_kb) / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recommenders and the ETL on synthetic catalogs.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="numbers of destinations")
+    parser.add_argument('--attractions-per-destination', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--etl', action='store_true', help="also benchmark database_creator.py")
+    parser.add_argument('--etl-chunk-rows', type=int, default=None, help="attractions database_creator.py processes at a time")
+    parser.add_argument('--data-dir', default=None, help="keep the generated databases here and reuse them")
+    parser.add_argument('--json', default=None, help="write all results to this file")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='travel_benchmark_')
+    os.makedirs(data_dir, exist_ok=True)
+    all_results = []
+    for size in args.sizes:
+        db_path = os.path.join(data_dir, f"synthetic_{size}_{args.attractions_per_destination}.db")
+        #DATABASES GENERATED BEFORE THEY HAD THE PER-DESTINATION AGGREGATES ARE GENERATED AGAIN
+        if not os.path.exists(db_path) or not has_attraction_stats(db_path):
+            print(f"Generating {size} destinations x {args.attractions_per_destination} attractions...")
+            synthetic_catalog.write_database(db_path, size, args.attractions_per_destination)
+        results = {'destinations': size, 'attractions': size * args.attractions_per_destination}
+        results.update(benchmark_recommenders(db_path, args.requests))
+        if args.etl:
+            results.update(benchmark_etl(size, args.attractions_per_destination, chunk_rows=args.etl_chunk_rows))
+        all_results.append(results)
+
+        print(f"\n--- {size} destinations ---")
+        print(f"engine load: {results['load_s']:.2f} s, peak {results['load_peak_mb']:.1f} MB, from snapshot {results['snapshot_load_s'] * 1000:.1f} ms")
+        for name in ('get_vacation_recommendations', 'recommend_vacation', 'get_emigration_recommendations', 'recommend_emigration'):
+            summary = results[name]
+            print(f"{name}: p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms, p99 {summary['p99_ms']:.2f} ms, "
+                  f"{summary['throughput_per_s']:.0f} requests/s, peak {summary['peak_mb']:.1f} MB")
+        cache = results['result_cache']
+        print(f"result cache of the get_* functions: {cache['hits']} hits, {cache['misses']} misses")
+        print(f"vacation batch: {results['vacation_batch_profiles_per_s']:.0f} profiles/s")
+        summary = results['vacation_microbatch']
+        print(f"vacation micro-batching, 64 clients: {summary['throughput_per_s']:.0f} requests/s, p50 {summary['p50_ms']:.2f} ms, "
+              f"p99 {summary['p99_ms']:.2f} ms, {summary['average_batch']:.1f} requests per batch")
+        if args.etl:
+            print(f"database_creator.py: {results['etl_s']:.2f} s, peak RSS {results['etl_peak_rss_mb']:.0f} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import pandas as pd
+
+from schema import connect_database
+
+#RULE-BASED TRAVEL ASSISTANT, USED BY app.py AND BY THE RECOMMENDATION SERVER (server.py)
+#top_attractions MAPS EVERY DESTINATION TO ITS MOST VOTED ATTRACTION, IT IS BUILT ONCE WHEN THE DATA IS LOADED,
+#SO ANSWERING A QUESTION NEVER READS THE DATABASE
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+
+def chatbot_context(dest_data, top_attractions):
+    """Arguments of get_chatbot_response besides the question, built the same way app.py builds them."""
+    country_col_name = 'Country_x' if 'Country_x' in dest_data.columns else 'Country'
+    dest_data = dest_data.rename(columns={country_col_name: 'Country'})
+    pairs = dest_data[['Destination', 'Country']].dropna().drop_duplicates()
+    return dest_data, top_attractions, sorted(pairs['Destination'].unique()), sorted(pairs['Country'].unique()), MONTH_NAMES
+
+
+def most_voted_attractions(attr_data):
+    """Destination -> name of its most voted attraction, from a table with Destination, Name and No_votes (the first one on a tie)."""
+    ranked = attr_data.sort_values(by='No_votes', ascending=False, kind='stable').drop_duplicates('Destination')
+    return dict(zip(ranked['Destination'], ranked['Name']))
+
+
+def load_top_attractions(db_path):
+    """most_voted_attractions of the database, without loading the attractions of a database with integer keys."""
+    conn = connect_database(db_path)
+    try:
+        attraction_columns = {row[1] for row in conn.execute('PRAGMA table_info("attractions")')}
+        if 'destination_id' in attraction_columns:
+            #ONE SEARCH OF THE attractions_destination_votes INDEX PER DESTINATION
+            attr_data = pd.read_sql_query(
+                "SELECT d.Destination, a.Name, a.No_votes FROM destinations d JOIN attractions a ON a.rowid = ("
+                "SELECT top.rowid FROM attractions top WHERE top.destination_id = d.destination_id ORDER BY top.No_votes DESC, top.rowid LIMIT 1) "
+                "ORDER BY d.destination_id", conn)
+        else:
+            attr_data = pd.read_sql_query("SELECT Destination, Name, No_votes FROM attractions", conn)
+    finally:
+        conn.close()
+    return most_voted_attractions(attr_data)
+
+
+def find_entity_in_question(question, entity_list):
+    """Finds a known entity (destination or country) in the user's question."""
+    question_lower = question.lower()
+    for entity in sorted(entity_list, key=len, reverse=True):
+        if entity.lower() in question_lower:
+            return entity
+    return None
+
+def get_chatbot_response(question, dest_data, top_attractions, all_destinations, all_countries, all_months):
+    """The main chatbot logic function."""
+    question_lower = question.lower().strip()
+    raw_destinations = [d.split(' - ')[-1] for d in all_destinations]
+    destination = find_entity_in_question(question, raw_destinations)
+    country = find_entity_in_question(question, all_countries) if not destination else None
+    
+    # Rule 1: Greetings
+    if any(word in question_lower for word in ["hello", "hi", "hey"]):
+        return "Hello, welcome to Travel Recommender! Ask me about a destination, the model, flights, or whatever you want! If you are not sure, please type **'help'**!"
+
+    # Rule 2: Help Command
+    if "help" in question_lower:
+        return """
+        I can help you with a few things. Try asking:
+        - **Find data**: "What is the HDI for Germany?" or "Weather in Rome in May?". I can find data for any metric used in the model.
+        - **Explain concepts**: "How do weights work?", "How does the model work?", or "What is HDI?".
+        - **Find top attractions**: "What is the most popular attraction in London?".
+        - **Get a summary**: "Tell me about Warsaw".
+        - **Find deals & info**: "Show me flights to Paris" or "Find hotels in Barcelona".
+        """
+    
+    # First, check for an entity (destination or country)
+    entity = destination if destination else country
+    if entity:
+        if destination: entity_data = dest_data[dest_data['Destination'] == entity]
+        else: entity_data = dest_data[dest_data['Country'] == entity]
+        if entity_data.empty: return f"Sorry, I couldn't find any data for {entity}."
+
+        # Rule 5: Most popular attraction
+        if "most popular" in question_lower and "attraction" in question_lower:
+            if destination:
+                name = top_attractions.get(destination)
+                if name is None:
+                    return f"Sorry, I couldn't find any attractions in {destination}."
+                url = f"https://www.google.com/search?q={name.replace(' ', '+')}"
+                return f"The most popular attraction in **{destination}** (based on number of votes) is **{name}**.\n\n[Search for more info here]({url})"
+            else:
+                return "Sorry, I can only find the most popular attraction for a specific destination, not an entire country."
+        
+        # Rule 4: "Tell me about"
+        if "tell me about" in question_lower:
+            data_row = entity_data.iloc[0]
+            info = f"### Summary for **{entity}**:\n"
+            info += f"- **Safety Index:** {data_row.get('Safety_Index', 'N/A')}\n"
+            info += f"- **Cost of Living + Rent Index:** {data_row.get('CostofLivingPlusRentIndex', 'N/A')}\n"
+            info += f"- **Purchasing Power Index:** {data_row.get('LocalPurchasingPowerIndex', 'N/A')}\n"
+            info += f"- **Cuisine Rank:** {data_row.get('Cuisine_Rank', 'N/A')}\n"
+            url = f"https://en.wikipedia.org/wiki/{entity.replace(' ', '_')}"
+            info += f"\n[Read more on Wikipedia]({url})"
+            return info
+
+        # Rule 1: Data lookup from the database
+        data_keywords = {"hdi": ("HDI_Value_Latest", ".3f"),"safety": ("Safety_Index", ".2f"),"cost of living": ("CostofLivingPlusRentIndex", ".2f"),"purchasing power": ("LocalPurchasingPowerIndex", ".2f"),"unemployment": ("Unemployment_Rate_National_Latest_Pct", ".2f"),"inflation": ("Inflation_Rate_National_Latest_Pct", ".2f"),"life expectancy": ("Life_Expectancy", ".2f"),"cuisine rank": ("Cuisine_Rank", ".0f")}
+        for keyword, (col, fmt) in data_keywords.items():
+            if keyword in question_lower and col in entity_data.columns:
+                value = pd.to_numeric(entity_data[col], errors='coerce').mean()
+                return f"The average {keyword.replace('_', ' ')} for **{entity}** is: **{value:{fmt}}**."
+        if "weather" in question_lower:
+            for month in all_months:
+                if month.lower() in question_lower:
+                    month_abbr = month[:3].capitalize()
+                    if month_abbr in entity_data.columns:
+                        weather = entity_data[month_abbr].iloc[0]
+                        return f"The weather in **{entity}** in {month} is typically **{weather}**."
+            return "Please specify a month to get the weather forecast (e.g., 'weather in Paris in July')."
+        
+        # Rule 1: Link generation
+        if "flight" in question_lower:
+            url = f"https://www.google.com/flights?q=flights+from+Lodz+to+{entity.replace(' ', '+')}"
+            return f"Sure, here is a link to search for flights to {entity}:\n[Click here for flights]({url})"
+        if "hotel" in question_lower:
+            url = f"https://www.booking.com/searchresults.html?ss={entity.replace(' ', '+')}"
+            return f"Of course, here is a link to search for hotels in {entity}:\n[Click here for hotels]({url})"
+        if "wikipedia" in question_lower:
+            url = f"https://en.wikipedia.org/wiki/{entity.replace(' ', '_')}"
+            return f"Here is the Wikipedia page for {entity}:\n[Read more on Wikipedia]({url})"
+            
+    # Rule 3: Explanations (checked only if no entity was found)
+    if "how do weights work" in question_lower:
+        return "The weights are like sliders on a DJ's mixing console. A higher weight gives a factor more influence on the final recommendation score, allowing you to tailor the results to what's most important to you."
+    if "how does the model work" in question_lower:
+        return "The model uses a Weighted Scoring System. For each destination, it calculates a score (from 0 to 1) for various factors like weather, budget, and safety. Each score is then multiplied by its user-defined weight. The final score is the sum of all these weighted scores, and the top 10 destinations are recommended."
+    if "what is hdi" in question_lower:
+        return "The **Human Development Index (HDI)** is a summary measure of average achievement in key dimensions of human development: a long and healthy life, being knowledgeable and having a decent standard of living."
+        
+    # Default response
+    return "Sorry, I don't understand that question. Try asking 'help' to see what I can do."
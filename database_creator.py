@@ -1,7 +1,30 @@
+import argparse
+import heapq
+import os
+import numpy as np
 import pandas as pd
 import sqlite3
 import re
 
+from attraction_aggregates import (VoteRanks, add_partial_sums, changed_score_votes, destination_attraction_stats, destination_popularity, destinations_with_votes,
+                                   rank_thresholds, stored_vote_ranks, top_votes_threshold, update_destination_attraction_stats)
+from incremental import (SOURCE_HASHES, SOURCE_KEYS, SYNC_KEYS, RowHashes, apply_changes, apply_source_rows, changed_source_rows, has_row_hashes,
+                         insert_rows, last_build, record_full_build, replace_rows, replaced_rows, sources_sha256, sync_table)
+from recommender import RecommenderEngine
+from schema import BUILD_PRAGMAS, connect_database, create_destination_details, create_indexes, create_table
+from snapshot import snapshot_path
+
+#ATTRACTIONS ARE STREAMED IN CHUNKS: READ, MAPPED AND APPENDED TO SQLITE A CHUNK AT A TIME, SO THE MEMORY OF THE BUILD
+#DEPENDS ON THE CHUNK SIZE AND THE NUMBER OF DESTINATIONS, NOT ON THE SIZE OF THE ATTRACTIONS EXPORT
+#WITH --incremental THE LIVE DATABASE IS NOT REPLACED: ONLY THE CHANGED ATTRACTIONS ARE MAPPED AND WRITTEN, AND ONLY THE AGGREGATES OF THE
+#DESTINATIONS THEY TOUCH RECOMPUTED (SEE incremental.py)
+#python database_creator.py --chunk-rows 20000
+#python database_creator.py --incremental
+parser = argparse.ArgumentParser(description="Builds the travel recommendation database from the source CSV files.")
+parser.add_argument('--chunk-rows', type=int, default=100000, help="attractions processed at a time (bounds the memory of the build)")
+parser.add_argument('--incremental', action='store_true', help="apply only inserted, updated and deleted rows to the existing database")
+args = parser.parse_args()
+
 print("DATA PROCESSING - START")
 
 #IMPORTING CSV FILES, AND CREATING DATABASE
@@ -10,15 +33,32 @@ file_country_stats = "destinations_important_14_07_wersja_python_1.xlsx - Countr
 file_dest_stats = "destinations_important_14_07_wersja_python_1.xlsx - Destination_Statistics.csv"
 file_attractions = "destinations_important_14_07_wersja_python_1.xlsx - Attractions.csv"
 db_name = "travel_recommendation_final.db"
+#THE DATABASE IS BUILT UNDER THIS NAME AND RENAMED WHEN IT IS COMPLETE, SO NOBODY READS A HALF-WRITTEN ONE
+building_db_name = db_name + ".building"
+TOP_200 = 200
+DEFAULT_TOP_200_THRESHOLD = 14000
 
-##PROBABLY USELESS, CHECK AND DELETE LATER
-try:
-    temp_df = pd.read_csv(file_attractions, encoding='latin-1', sep=';', usecols=['No_votes'])
-    TOP_200_THRESHOLD = temp_df['No_votes'].nlargest(200).min()
-    print(f"Threshold for Top 200 attractions set to: {TOP_200_THRESHOLD} votes.")
-except Exception as e:
-    print(f"Could not determine popularity threshold, using default value. Error: {e}")
-    TOP_200_THRESHOLD = 14000
+#AN INCREMENTAL BUILD NEEDS THE ROW HASHES OF A PREVIOUS BUILD, AND IS NOT NEEDED AT ALL IF NOTHING WAS CHANGED SINCE
+#THE MAPPING AND AGGREGATION CODE IS PART OF THE BUILD: UNCHANGED SOURCE ROWS ARE NOT MAPPED AGAIN, SO A CHANGE IN IT NEEDS A FULL BUILD
+build_code = [os.path.abspath(__file__), os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attraction_aggregates.py')]
+code = sources_sha256(build_code)
+sources = sources_sha256([file_dest_countries, file_country_stats, file_dest_stats, file_attractions] + build_code)
+incremental = False
+if args.incremental:
+    last_sources = last_code = None
+    if os.path.exists(db_name):
+        live_conn = sqlite3.connect(db_name)
+        if has_row_hashes(live_conn):
+            last_sources, last_code = last_build(live_conn)
+        live_conn.close()
+    if last_sources == sources:
+        print(f"Source files unchanged since the last build of {db_name}, nothing to do.")
+        exit()
+    incremental = last_code == code
+    if last_code is None:
+        print(f"No row hashes of a previous build in {db_name}, building it from scratch.")
+    elif not incremental:
+        print(f"The build code changed since the last build of {db_name}, building it from scratch.")
 
 #MAPPING CATEGORIES
 definitive_mapping = {
@@ -88,64 +128,56 @@ try:
     df_dest_countries = pd.read_csv(file_dest_countries, encoding='latin-1', sep=';')
     df_country_stats = pd.read_csv(file_country_stats, encoding='latin-1', sep=';')
     df_dest_stats = pd.read_csv(file_dest_stats, encoding='latin-1', sep=';')
-    df_attractions = pd.read_csv(file_attractions, encoding='latin-1', sep=';')
+    #THE ATTRACTIONS ARE READ IN CHUNKS LATER, ONLY THEIR COLUMNS NOW
+    attraction_header = pd.read_csv(file_attractions, encoding='latin-1', sep=';', nrows=0).columns
     print("Files loaded successfully.")
 
     ##PROBABLY USELESS, CHECK AND DELETE LATER
     def clean_name_func(name):
         return str(name).strip().replace('Finlandia', 'Finland').replace('Czech Republic', 'Czechia')
     ##PROBABLY USELESS, CHECK AND DELETE LATER
-    for df in [df_dest_countries, df_country_stats, df_dest_stats, df_attractions]:
+    def clean_names(df):
         for col in ['Destination', 'Country']:
             if col in df.columns:
                 df[col] = df[col].apply(clean_name_func)
-    ###PROBABLY USELESS, CHECK AND DELETE LATER
-    popularity_counts = df_attractions.groupby('Destination')['No_votes'].sum().reset_index()
-    popularity_counts.rename(columns={'No_votes': 'Popularity_TripAdvisor_Count'}, inplace=True)
+    for df in [df_dest_countries, df_country_stats, df_dest_stats]:
+        clean_names(df)
 except Exception as e:
     print(f"Error during loading or basic data cleaning: {e}")
     exit()
 
 #ATTRACTION TYPES
-print("Grouping attraction categories...")
 final_group_columns = [
     'Historic_Heritage', 'Religion', 'Nature_Recreation', 'Culture_Art', 'Museums',
     'Entertainment_Leisure', 'Shopping_Urban', 'Food_Drink', 'Winter_Sports',
     'Scenic_Transport', 'Science_Technology', 'Beach', 'Mountains_and_trails',
     'Landmark', 'Top_200_Popular'
 ]
-grouped_features = pd.DataFrame(0, index=df_attractions.index, columns=final_group_columns)
-#SHOULD BE NOTHING, SO POSSIBLY DELETE IT
-df_attractions.dropna(subset=['Attraction type'], inplace=True)
-df_attractions['Attraction type'] = df_attractions['Attraction type'].astype(str)
-
-for index, row in df_attractions.iterrows():
-    if row['Attraction type'] == '#N/A':
-        continue
-        
-    detailed_types = row['Attraction type'].split('\x95')
-    
-    for detailed_type in detailed_types:
-        cleaned_detailed_type = detailed_type.strip()
-        
-        if cleaned_detailed_type in definitive_mapping:
-            groups_to_assign = definitive_mapping[cleaned_detailed_type]
-            for group in groups_to_assign:
-                if group in grouped_features.columns:
-                    grouped_features.loc[index, group] = 1
-##PROBABLY USELESS, CHECK AND DELETE LATER
-print("Applying popularity rule for 'Top_200_Popular'...")
-landmark_indices = df_attractions[df_attractions['No_votes'] >= TOP_200_THRESHOLD].index
-grouped_features.loc[landmark_indices, 'Top_200_Popular'] = 1
-##PROBABLY USELESS, CHECK AND DELETE LATER
-df_attractions_processed = pd.concat([df_attractions.drop('Attraction type', axis=1), grouped_features], axis=1)
-print("Grouping finished.")
-
-#FINAL MERGING
-print("Preparing final tables...")
-df_main_destinations = pd.merge(df_dest_countries, df_country_stats, on='Country', how='left')
-df_main_destinations = pd.merge(df_main_destinations, df_dest_stats, on=['Destination', 'Country'], how='left')
-df_main_destinations = pd.merge(df_main_destinations, popularity_counts, on='Destination', how='left')
+#THE MAPPING COMPILED ONCE INTO A LOOKUP TABLE: ONE ROW OF 0/1 GROUP FLAGS PER DETAILED TYPE
+category_lookup = pd.DataFrame(0, index=pd.Index(list(definitive_mapping)), columns=final_group_columns, dtype='int8')
+for detailed_type, groups in definitive_mapping.items():
+    category_lookup.loc[detailed_type, [group for group in groups if group in final_group_columns]] = 1
+
+def group_attractions(df_attractions):
+    """Group flags of one chunk of attractions (Top_200_Popular is set once all attractions are known) and its unknown detailed types."""
+    grouped_features = pd.DataFrame(0, index=df_attractions.index, columns=final_group_columns)
+    #SHOULD BE NOTHING, SO POSSIBLY DELETE IT
+    df_attractions = df_attractions.dropna(subset=['Attraction type'])
+    df_attractions['Attraction type'] = df_attractions['Attraction type'].astype(str)
+    #EVERY DISTINCT 'Attraction type' STRING IS SPLIT ONCE: ONE ROW PER (STRING, DETAILED TYPE), ALL LOOKED UP AT ONCE
+    attraction_types = df_attractions.loc[df_attractions['Attraction type'] != '#N/A', 'Attraction type']
+    type_string_codes, type_strings = pd.factorize(attraction_types)
+    detailed_types = pd.Series(type_strings).str.split('\x95').explode().str.strip()
+    type_codes = category_lookup.index.get_indexer(detailed_types)
+    known_type = type_codes >= 0
+    unknown = detailed_types[~known_type & (detailed_types != '')]
+    unknown_types = pd.Series(np.bincount(type_string_codes, minlength=len(type_strings))[unknown.index], index=unknown.to_numpy(), dtype='int64')
+    #GROUP FLAGS OF EVERY DISTINCT STRING, THEN COPIED TO ITS ATTRACTIONS
+    type_flags = pd.DataFrame(category_lookup.to_numpy()[type_codes[known_type]], index=detailed_types.index[known_type])
+    type_flags = type_flags.groupby(level=0).max().reindex(range(len(type_strings)), fill_value=0)
+    grouped_features.loc[attraction_types.index, final_group_columns] = type_flags.to_numpy()[type_string_codes]
+    ##PROBABLY USELESS, CHECK AND DELETE LATER
+    return pd.concat([df_attractions.drop('Attraction type', axis=1), grouped_features], axis=1), unknown_types
 
 #CREATING SQL FROM CSV
 def make_sql_safe_col_names(df_to_clean):
@@ -153,27 +185,280 @@ def make_sql_safe_col_names(df_to_clean):
     df_to_clean.columns = [re.sub(r'[^a-zA-Z0-9_]', '', str(col)) for col in df_to_clean.columns]
     return df_to_clean
 
-df_main_destinations = make_sql_safe_col_names(df_main_destinations)
-df_attractions_processed_safe = make_sql_safe_col_names(df_attractions_processed.copy())
+#COLUMNS OF THE ATTRACTIONS TABLE, SQL-SAFE NAME -> ORIGINAL NAME (THE CSV OUTPUT KEEPS THE ORIGINAL NAMES)
+attraction_columns = ['destination_id'] + [col for col in attraction_header if col != 'Attraction type'] + final_group_columns
+attraction_columns = dict(zip(make_sql_safe_col_names(pd.DataFrame(columns=attraction_columns)).columns, attraction_columns))
+
+def assign_ids(keys, known):
+    """Integer ids (from 1) of every row of `keys`, rows with the same keys get the same id.
+
+    Keys which already had an id in `known` (the same columns plus the id, from the previous build) keep it,
+    so an incremental build does not renumber rows which did not change. New keys get ids after the largest one.
+    """
+    distinct = keys.drop_duplicates()
+    ids = pd.Series(np.nan, index=distinct.index)
+    if known is not None and len(known):
+        ids[:] = distinct.merge(known, on=list(keys.columns), how='left').iloc[:, -1].to_numpy()
+    new = ids.isna()
+    first_id = int(np.nanmax(ids)) + 1 if (~new).any() else 1
+    ids[new] = np.arange(first_id, first_id + new.sum())
+    distinct = distinct.assign(id=ids.astype('int64'))
+    return keys.merge(distinct, on=list(keys.columns), how='left')['id'].to_numpy()
+
+#INTEGER KEYS: A DESTINATION IS ONE (Destination, Country) PAIR, ATTRACTIONS POINT TO IT WITH destination_id
+#AND DESTINATIONS TO THEIR COUNTRY WITH country_id. AN INCREMENTAL BUILD KEEPS THE IDS OF THE DATABASE IT UPDATES
+known_destination_ids = known_country_ids = None
+if incremental:
+    live_conn = sqlite3.connect(db_name)
+    live_columns = lambda table: [row[1] for row in live_conn.execute(f'PRAGMA table_info("{table}")')]
+    #CHANGED ATTRACTIONS ARE WRITTEN INTO THE LIVE TABLE, WHICH NEEDS THE COLUMNS OF THIS BUILD
+    if live_columns('attractions') != list(attraction_columns):
+        print(f"The attraction columns of {db_name} changed, building it from scratch.")
+        incremental = False
+    elif {'destination_id', 'country_id'} <= set(live_columns('destinations')):
+        known_destination_ids = pd.read_sql_query("SELECT Destination, Country, destination_id FROM destinations", live_conn)
+        country_source = 'countries' if 'country_id' in live_columns('countries') else 'destinations'
+        known_country_ids = pd.read_sql_query(f"SELECT DISTINCT Country, country_id FROM {country_source}", live_conn).drop_duplicates('Country')
+    live_conn.close()
+
+#COUNTRY STATISTICS ARE STORED ONCE PER COUNTRY, IN THEIR OWN TABLE (EVERY COUNTRY OF A DESTINATION HAS A ROW, WITH OR WITHOUT STATISTICS)
+duplicated_countries = df_country_stats['Country'].duplicated()
+if duplicated_countries.any():
+    print(f"Country statistics listed more than once, the first row is kept: {sorted(df_country_stats.loc[duplicated_countries, 'Country'].unique())}")
+df_countries = pd.merge(pd.concat([df_dest_countries[['Country']], df_country_stats[['Country']]]).drop_duplicates(), df_country_stats[~duplicated_countries], on='Country', how='left')
+df_countries.insert(0, 'country_id', assign_ids(df_countries[['Country']], known_country_ids))
+df_countries = make_sql_safe_col_names(df_countries)
+
+df_main_destinations = pd.merge(df_dest_countries, df_dest_stats, on=['Destination', 'Country'], how='left')
+df_main_destinations.insert(0, 'destination_id', assign_ids(df_main_destinations[['Destination', 'Country']], known_destination_ids))
+df_main_destinations.insert(1, 'country_id', df_main_destinations[['Country']].merge(df_countries[['Country', 'country_id']], how='left')['country_id'].to_numpy())
+destination_ids = df_main_destinations[['Destination', 'Country', 'destination_id']].drop_duplicates(['Destination', 'Country'])
+
+def read_attractions():
+    return pd.read_csv(file_attractions, encoding='latin-1', sep=';', chunksize=args.chunk_rows)
+
+def map_attractions(chunk):
+    """One chunk of (cleaned) source attractions in the columns of the attractions table, and its unknown detailed types."""
+    processed, chunk_unknown_types = group_attractions(chunk)
+    #ATTRACTIONS OF UNKNOWN DESTINATIONS HAVE NO destination_id
+    processed.insert(0, 'destination_id', pd.array(processed[['Destination', 'Country']].merge(destination_ids, how='left')['destination_id'], dtype='Int64'))
+    return make_sql_safe_col_names(processed), chunk_unknown_types
+
+def print_unknown_types(unknown_types):
+    if unknown_types is not None and len(unknown_types):
+        unknown_types = unknown_types.sort_values(ascending=False, kind='stable')
+        print(f"{len(unknown_types)} attraction types are not in the mapping ({unknown_types.sum()} occurrences), most common: {unknown_types.head(10).to_dict()}")
+
+def update_live_database(conn):
+    """The incremental build, run by incremental.apply_changes in its transaction on the live database. Returns table -> (rows, inserted, updated, deleted)."""
+    #EVERY SOURCE ROW IS STILL READ AND HASHED AS IT IS (THE SOURCE DOES NOT SAY WHAT CHANGED), BUT ONLY THE CHANGED ONES ARE CLEANED
+    #AND MAPPED, PICKED OUT OF A SECOND READ OF THE SOURCE AND STAGED IN new UNDER THEIR ROW NUMBER
+    print("Hashing the source attractions...")
+    source_hashes = RowHashes(conn, SOURCE_HASHES, SOURCE_KEYS)
+    for chunk in read_attractions():
+        source_hashes.add(chunk)
+    attraction_changes = source_hashes.diff()
+    changed_rows = pd.Index(changed_source_rows(conn))
+    print(f"Grouping the categories of {len(changed_rows)} new and changed attractions...")
+    conn.execute('CREATE TABLE new."attractions" AS SELECT * FROM main."attractions" WHERE 0')
+    unknown_types = None
+    first_row = 1
+    for chunk in read_attractions() if len(changed_rows) else []:
+        row_ids = pd.RangeIndex(first_row, first_row + len(chunk))
+        first_row += len(chunk)
+        changed = row_ids.isin(changed_rows)
+        if changed.any():
+            chunk = chunk[changed]
+            clean_names(chunk)
+            processed, chunk_unknown_types = map_attractions(chunk)
+            unknown_types = add_partial_sums(unknown_types, chunk_unknown_types.groupby(level=0).sum())
+            insert_rows(conn, 'new."attractions"', processed, row_ids[changed].tolist())
+    print_unknown_types(unknown_types)
+
+    #DESTINATIONS WHOSE AGGREGATES ARE RECOMPUTED: THOSE OF THE OLD AND THE NEW VERSIONS OF THE CHANGED ATTRACTIONS, AND THOSE FOUND BELOW
+    changed_attractions = pd.concat([replaced_rows(conn, 'attractions', ['destination_id', 'Destination']),
+                                     pd.read_sql_query('SELECT destination_id, Destination FROM new."attractions"', conn)])
+    touched_ids = set(changed_attractions['destination_id'].dropna().astype('int64').tolist())
+    touched_names = set(changed_attractions['Destination'].dropna())
+    old_vote_ranks = stored_vote_ranks(conn)
+    old_top_200_threshold = top_votes_threshold(conn, TOP_200)
+    written = apply_source_rows(conn, 'attractions')
+
+    #COUNTRIES AND DESTINATIONS ARE BUILT WHOLE (ONE ROW EACH), ONLY THEIR CHANGED ROWS ARE WRITTEN. THE POPULARITY OF A DESTINATION NAME
+    #IS RECOUNTED IF ONE OF ITS ATTRACTIONS CHANGED OR IF IT IS NEW, OTHER DESTINATIONS KEEP THEIRS
+    live_popularity = pd.read_sql_query("SELECT Destination, Popularity_TripAdvisor_Count FROM destinations", conn).drop_duplicates('Destination')
+    touched_names |= set(df_main_destinations['Destination']) - set(live_popularity['Destination'])
+    popularity_counts = pd.concat([live_popularity[~live_popularity['Destination'].isin(touched_names)], destination_popularity(conn, touched_names)])
+    destinations = make_sql_safe_col_names(pd.merge(df_main_destinations, popularity_counts, on='Destination', how='left'))
+    create_table(conn, 'countries', df_countries, primary_key='country_id', schema='new')
+    insert_rows(conn, 'new."countries"', df_countries)
+    create_table(conn, 'destinations', destinations, primary_key='destination_id', foreign_keys={'country_id': ('countries', 'country_id')}, schema='new')
+    insert_rows(conn, 'new."destinations"', destinations)
+    changes = {table: sync_table(conn, table, args.chunk_rows) for table in SYNC_KEYS}
+    create_destination_details(conn, destinations.columns, df_countries.columns)
+
+    #ATTRACTIONS OF REMOVED DESTINATIONS LOSE THEIR destination_id, THOSE OF NEW ONES (UNTIL NOW OF AN UNKNOWN DESTINATION) GET IT
+    live_ids = set(known_destination_ids['destination_id'].tolist()) if known_destination_ids is not None else set()
+    new_ids = set(destination_ids['destination_id'].tolist())
+    rewritten = []
+    if live_ids - new_ids:
+        removed = ', '.join(str(destination_id) for destination_id in sorted(live_ids - new_ids))
+        rewritten += conn.execute(f"UPDATE attractions SET destination_id = NULL WHERE destination_id IN ({removed}) RETURNING rowid").fetchall()
+    if new_ids - live_ids:
+        rewritten += conn.execute("UPDATE attractions SET destination_id = d.destination_id FROM destinations d WHERE attractions.destination_id IS NULL "
+                                  "AND d.Destination = attractions.Destination AND d.Country = attractions.Country RETURNING rowid").fetchall()
+    touched_ids |= live_ids ^ new_ids
+
+    #ONLY ATTRACTIONS WITH AT LEAST THE LOWER OF THE OLD AND THE NEW TOP 200 THRESHOLDS CAN CHANGE THEIR FLAG
+    top_200_threshold = top_votes_threshold(conn, TOP_200)
+    if top_200_threshold is not None:
+        print(f"Threshold for Top 200 attractions set to: {top_200_threshold} votes.")
+    else:
+        print("Could not determine popularity threshold, using default value.")
+        top_200_threshold = DEFAULT_TOP_200_THRESHOLD
+    lowest = min(top_200_threshold, DEFAULT_TOP_200_THRESHOLD if old_top_200_threshold is None else old_top_200_threshold)
+    flipped = conn.execute("UPDATE attractions SET Top_200_Popular = (No_votes >= :threshold) WHERE No_votes >= :lowest AND Top_200_Popular != (No_votes >= :threshold) "
+                           "RETURNING rowid, destination_id", {'threshold': top_200_threshold, 'lowest': lowest}).fetchall()
+    rewritten += flipped
+    touched_ids |= {destination_id for _, destination_id in flipped if destination_id is not None}
+    inserted, updated, deleted = attraction_changes[1:]
+    changes['attractions'] = (attraction_changes[0], inserted, updated + len({row[0] for row in rewritten} - written), deleted)
+
+    #POPULARITY RANKS MOVE WITH EVERY INSERTED OR DELETED VOTE COUNT: DESTINATIONS WITH AN ATTRACTION WHOSE SCORE CHANGED ARE RECOMPUTED TOO
+    vote_ranks = stored_vote_ranks(conn)
+    touched_ids |= destinations_with_votes(conn, changed_score_votes(old_vote_ranks, vote_ranks))
+    print(f"Aggregating the attractions of {len(touched_ids)} destinations...")
+    changes['destination_attraction_stats'] = update_destination_attraction_stats(conn, vote_ranks, final_group_columns, destination_ids.set_index('destination_id')['Destination'],
+                                                                                  touched_ids, args.chunk_rows)
+    changes['attraction_rank_thresholds'] = replace_rows(conn, 'attraction_rank_thresholds', rank_thresholds(vote_ranks, TOP_200, top_200_threshold))
+    return changes
+
+if not incremental:
+    if os.path.exists(building_db_name):
+        os.remove(building_db_name)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(building_db_name + suffix):
+            os.remove(building_db_name + suffix)
+    conn = connect_database(building_db_name, BUILD_PRAGMAS)
+
+    #ONE PASS OVER THE ATTRACTIONS: GROUPS MAPPED AND EVERY CHUNK APPENDED TO SQLITE IN ITS OWN TRANSACTION,
+    #WHILE THE 200 HIGHEST VOTE COUNTS (A HEAP), THE NUMBER OF ATTRACTIONS WITH EVERY VOTE COUNT AND THE VOTES PER DESTINATION ARE COLLECTED
+    #THE SOURCE ROWS ARE HASHED AS THEY ARE READ (BEFORE THEY ARE CLEANED), FOR THE NEXT INCREMENTAL BUILD
+    print(f"Grouping attraction categories ({args.chunk_rows} attractions at a time)...")
+    try:
+        source_hashes = RowHashes(conn, SOURCE_HASHES, SOURCE_KEYS)
+        top_votes = []
+        vote_histogram = None
+        popularity_counts = None
+        unknown_types = None
+        n_attractions = 0
+        for chunk in read_attractions():
+            source_hashes.add(chunk)
+            clean_names(chunk)
+            votes = chunk['No_votes'].dropna()
+            for vote in votes.nlargest(TOP_200).tolist():
+                if len(top_votes) < TOP_200:
+                    heapq.heappush(top_votes, vote)
+                elif vote > top_votes[0]:
+                    heapq.heapreplace(top_votes, vote)
+            vote_histogram = add_partial_sums(vote_histogram, votes.value_counts())
+            ###PROBABLY USELESS, CHECK AND DELETE LATER
+            popularity_counts = add_partial_sums(popularity_counts, chunk.groupby('Destination')['No_votes'].sum())
+            processed, chunk_unknown_types = map_attractions(chunk)
+            unknown_types = add_partial_sums(unknown_types, chunk_unknown_types.groupby(level=0).sum())
+            with conn:
+                if n_attractions == 0:
+                    create_table(conn, 'attractions', processed, foreign_keys={'destination_id': ('destinations', 'destination_id')})
+                processed.to_sql('attractions', conn, if_exists='append', index=False)
+            n_attractions += len(processed)
+    except Exception as e:
+        print(f"Error during loading or grouping the attractions: {e}")
+        conn.close()
+        exit()
+    print_unknown_types(unknown_types)
+
+    ##PROBABLY USELESS, CHECK AND DELETE LATER
+    if top_votes:
+        TOP_200_THRESHOLD = min(top_votes)
+        print(f"Threshold for Top 200 attractions set to: {TOP_200_THRESHOLD} votes.")
+    else:
+        print("Could not determine popularity threshold, using default value.")
+        TOP_200_THRESHOLD = DEFAULT_TOP_200_THRESHOLD
+    print("Applying popularity rule for 'Top_200_Popular'...")
+    with conn:
+        #INDEXED ONCE ALL ATTRACTIONS ARE IN, WHICH IS FASTER THAN KEEPING THE INDEXES UP TO DATE ON EVERY CHUNK
+        create_indexes(conn)
+        conn.execute("UPDATE attractions SET Top_200_Popular = 1 WHERE No_votes >= ?", (TOP_200_THRESHOLD,))
+    print("Grouping finished.")
+
+    #FINAL MERGING
+    print("Preparing final tables...")
+    popularity_counts = popularity_counts.rename('Popularity_TripAdvisor_Count').rename_axis('Destination').reset_index()
+    df_main_destinations = pd.merge(df_main_destinations, popularity_counts, on='Destination', how='left')
+    df_main_destinations = make_sql_safe_col_names(df_main_destinations)
+
+    #POPULARITY RANKS FROM THE VOTE HISTOGRAM: THE RANK OF A VOTE COUNT IS THE NUMBER OF ATTRACTIONS WITH AT LEAST AS MANY VOTES
+    vote_ranks = VoteRanks(vote_histogram, n_attractions)
+
+    #PER-DESTINATION ATTRACTION AGGREGATES, SO THE RECOMMENDER DOES NOT HAVE TO GROUP ALL ATTRACTIONS ON EVERY REQUEST
+    #A SECOND PASS, OVER THE ATTRACTIONS ALREADY IN SQLITE, ALSO IN CHUNKS (ATTRACTIONS OF UNKNOWN DESTINATIONS ARE LEFT OUT)
+    print("Aggregating attractions per destination...")
+    df_destination_attraction_stats = destination_attraction_stats(conn, vote_ranks, final_group_columns, destination_ids.set_index('destination_id')['Destination'], args.chunk_rows)
+
+    #RANK THRESHOLDS USED ABOVE, WITH THE NUMBER OF VOTES NEEDED TO REACH EACH OF THEM
+    df_rank_thresholds = rank_thresholds(vote_ranks, TOP_200, TOP_200_THRESHOLD)
 
 try:
-    print(f"Saving data to database: {db_name}...")
-    conn = sqlite3.connect(db_name)
-    df_main_destinations.to_sql('destinations', conn, if_exists='replace', index=False)
-    df_attractions_processed_safe.to_sql('attractions', conn, if_exists='replace', index=False)
-    conn.commit()
-    conn.close()
+    if incremental:
+        print(f"Updating database: {db_name}...")
+        changes = apply_changes(db_name, sources, code, update_live_database)
+    else:
+        print(f"Saving data to database: {db_name}...")
+        with conn:
+            create_table(conn, 'countries', df_countries, primary_key='country_id')
+            df_countries.to_sql('countries', conn, if_exists='append', index=False)
+            create_table(conn, 'destinations', df_main_destinations, primary_key='destination_id', foreign_keys={'country_id': ('countries', 'country_id')})
+            df_main_destinations.to_sql('destinations', conn, if_exists='append', index=False)
+            create_table(conn, 'destination_attraction_stats', df_destination_attraction_stats, primary_key='destination_id', foreign_keys={'destination_id': ('destinations', 'destination_id')})
+            df_destination_attraction_stats.to_sql('destination_attraction_stats', conn, if_exists='append', index=False)
+            df_rank_thresholds.to_sql('attraction_rank_thresholds', conn, if_exists='replace', index=False)
+            create_indexes(conn)
+            create_destination_details(conn, df_main_destinations.columns, df_countries.columns)
+        with conn:
+            changes = record_full_build(conn, sources, code, source_hashes, args.chunk_rows)
+        conn.close()
+        os.replace(building_db_name, db_name)
+    for table, (rows, inserted, updated, deleted) in changes.items():
+        print(f"  {table}: {rows} rows, {inserted} inserted, {updated} updated, {deleted} deleted")
     print("Saving to database successful.")
+    #BINARY SNAPSHOT OF THE RECOMMENDER ARRAYS AND THE SIMILARITY INDEX, MEMORY-MAPPED BY recommender.py INSTEAD OF READING THE DATABASE
+    print(f"Saving recommender snapshot: {snapshot_path(db_name)}...")
+    RecommenderEngine(db_name, snapshot=False, chunk_rows=args.chunk_rows).save_snapshot()
     #WE WILL HAVE TWO FILES, DESTINATIONS AND ATTRACTIONS
     output_dest_csv = "final_destinations.csv"
     output_attr_csv = "final_attractions.csv"
-    
-    print(f"Saving processed data to CSV file: {output_dest_csv}...")
-    df_main_destinations.to_csv(output_dest_csv, index=False, sep=';', encoding='utf-8-sig')
-    
-    print(f"Saving processed data to CSV file: {output_attr_csv}...")
-    df_attractions_processed.to_csv(output_attr_csv, index=False, sep=';', encoding='utf-8-sig')
+    #AN INCREMENTAL BUILD REWRITES ONLY THE EXPORTS OF TABLES WITH CHANGED ROWS
+    #ROWS ARE EXPORTED IN THE ORDER OF THEIR KEYS, NOT OF THEIR ROWIDS (AN INCREMENTAL BUILD APPENDS NEW ROWS), SO BOTH BUILDS EXPORT THE SAME FILES
+    def export_changed(tables, path):
+        return not incremental or any(sum(changes[table][1:]) for table in tables) or not os.path.exists(path)
+
+    if export_changed(['destinations', 'countries'], output_dest_csv):
+        print(f"Saving processed data to CSV file: {output_dest_csv}...")
+        #THE EXPORT KEEPS ONE FLAT ROW PER DESTINATION, WITH THE STATISTICS OF ITS COUNTRY
+        conn = sqlite3.connect(db_name)
+        pd.read_sql_query("SELECT * FROM destination_details ORDER BY Destination, Country", conn).to_csv(output_dest_csv, index=False, sep=';', encoding='utf-8-sig')
+        conn.close()
+
+    if export_changed(['attractions'], output_attr_csv):
+        print(f"Saving processed data to CSV file: {output_attr_csv}...")
+        #COPIED FROM THE DATABASE IN CHUNKS, THROUGH ONE FILE HANDLE SO THE BYTE ORDER MARK IS WRITTEN ONCE
+        #ATTRACTIONS WITH THE SAME KEY KEEP THEIR ORDER IN THE SOURCE (WHICH IS THEIR ROWID ORDER IN BOTH BUILDS)
+        conn = sqlite3.connect(db_name)
+        with open(output_attr_csv, 'w', encoding='utf-8-sig', newline='') as f:
+            for i, attractions_chunk in enumerate(pd.read_sql_query("SELECT * FROM attractions ORDER BY Destination, Name, rowid", conn, chunksize=args.chunk_rows)):
+                attractions_chunk.rename(columns=attraction_columns).to_csv(f, index=False, sep=';', header=i == 0)
+        conn.close()
     
     print("Saving to CSV files successful!")
 except Exception as e:
-    print(f"Error during save operation: {e}")
\ No newline at end of file
+    print(f"Error during save operation: {e}")
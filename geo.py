@@ -0,0 +1,98 @@
+import numpy as np
+
+#GREAT-CIRCLE DISTANCES AND A GRID INDEX OVER THE DESTINATION COORDINATES (Latitude / Longitude COLUMNS)
+
+EARTH_RADIUS_KM = 6371.0
+#SIDE OF ONE GRID CELL IN DEGREES, ABOUT 110 KM
+GRID_CELL_DEGREES = 1.0
+#CITIES USERS TRAVEL FROM, AN ORIGIN CAN ALSO BE ANY (LATITUDE, LONGITUDE) PAIR OR A DESTINATION OF THE CATALOG
+ORIGIN_CITIES = {
+    'Lodz': (51.7592, 19.4560), 'Warsaw': (52.2297, 21.0122), 'Krakow': (50.0647, 19.9450), 'Wroclaw': (51.1079, 17.0385),
+    'Poznan': (52.4064, 16.9252), 'Gdansk': (54.3520, 18.6466), 'Szczecin': (53.4285, 14.5528), 'Katowice': (50.2649, 19.0238),
+    'Lublin': (51.2465, 22.5684), 'Bialystok': (53.1325, 23.1688), 'Berlin': (52.5200, 13.4050), 'Prague': (50.0755, 14.4378),
+    'Vienna': (48.2082, 16.3738), 'London': (51.5074, -0.1278), 'Paris': (48.8566, 2.3522), 'Amsterdam': (52.3676, 4.9041),
+}
+
+
+def haversine_km(latitude, longitude, origin_latitude, origin_longitude):
+    """Great-circle distances in km from one origin to arrays of coordinates (degrees), NaN where a coordinate is missing."""
+    lat1, lon1 = np.radians(origin_latitude), np.radians(origin_longitude)
+    lat2, lon2 = np.radians(latitude), np.radians(longitude)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def unit_vectors(latitude, longitude):
+    """Coordinates (degrees) as points on the unit sphere (rows x 3), computed once so distances need no trigonometry per point."""
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def great_circle_km(points, origin_latitude, origin_longitude):
+    """Great-circle distances in km from one origin to the `unit_vectors` points, NaN where a coordinate is missing."""
+    origin = unit_vectors(origin_latitude, origin_longitude)[0]
+    #THE CHORD BETWEEN TWO UNIT VECTORS GIVES THE ANGLE: CHORD^2 = 2 - 2 * DOT PRODUCT
+    half_chord = np.sqrt(np.clip((1 - points @ origin) / 2, 0, 1))
+    return 2 * EARTH_RADIUS_KM * np.arcsin(half_chord)
+
+
+class SpatialGrid:
+    """Points bucketed into GRID_CELL_DEGREES cells, for radius and k-nearest queries without measuring every point."""
+
+    def __init__(self, latitude, longitude, cell_degrees=GRID_CELL_DEGREES):
+        self.latitude = np.asarray(latitude, dtype=float)
+        self.longitude = np.asarray(longitude, dtype=float)
+        self.cell_degrees = cell_degrees
+        self.n_lon_cells = int(np.ceil(360 / cell_degrees))
+        known = np.flatnonzero(~(np.isnan(self.latitude) | np.isnan(self.longitude)))
+        cells = self._cells(self.latitude[known], self.longitude[known])
+        order = np.argsort(cells, kind='stable')
+        self._points = known[order]
+        self._cell_ids, starts = np.unique(cells[order], return_index=True)
+        self._starts = np.append(starts, len(order))
+
+    def _cells(self, latitude, longitude):
+        row = np.floor((np.clip(latitude, -90, 90) + 90) / self.cell_degrees).astype(np.int64)
+        column = np.floor(((longitude + 180) % 360) / self.cell_degrees).astype(np.int64)
+        return row * self.n_lon_cells + column
+
+    def _candidates(self, latitude, longitude, radius_km):
+        """Points in the cells of the bounding box of the circle, a superset of the points inside it."""
+        lat_span = np.degrees(radius_km / EARTH_RADIUS_KM)
+        lowest, highest = latitude - lat_span, latitude + lat_span
+        cos_lat = np.cos(np.radians(max(abs(lowest), abs(highest))))
+        if highest >= 90 or lowest <= -90 or cos_lat <= 0 or lat_span / cos_lat >= 180:
+            return self._points
+        lon_span = lat_span / cos_lat
+        rows = np.arange(np.floor((lowest + 90) / self.cell_degrees), np.floor((highest + 90) / self.cell_degrees) + 1, dtype=np.int64)
+        first = np.floor(((longitude - lon_span + 180) % 360) / self.cell_degrees)
+        n_columns = min(int(np.ceil(2 * lon_span / self.cell_degrees)) + 2, self.n_lon_cells)
+        columns = (first + np.arange(n_columns, dtype=np.int64)) % self.n_lon_cells
+        wanted = (rows[:, None] * self.n_lon_cells + columns[None, :]).ravel()
+        position = np.searchsorted(self._cell_ids, wanted)
+        found = position < len(self._cell_ids)
+        found[found] = self._cell_ids[position[found]] == wanted[found]
+        position = position[found]
+        if not len(position):
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([self._points[self._starts[i]:self._starts[i + 1]] for i in position])
+
+    def within(self, latitude, longitude, radius_km):
+        """Points within `radius_km` of the origin and their distances, nearest first."""
+        candidates = self._candidates(latitude, longitude, radius_km)
+        distances = haversine_km(self.latitude[candidates], self.longitude[candidates], latitude, longitude)
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.lexsort((candidates, distances))
+        return candidates[order], distances[order]
+
+    def nearest(self, latitude, longitude, k):
+        """The k points nearest to the origin and their distances, nearest first."""
+        k = min(k, len(self._points))
+        radius_km = self.cell_degrees * 111.0
+        while True:
+            points, distances = self.within(latitude, longitude, radius_km)
+            #EVERY POINT CLOSER THAN THE RADIUS IS FOUND, SO K OF THEM INSIDE IT ARE THE K NEAREST
+            if len(points) >= k or radius_km >= np.pi * EARTH_RADIUS_KM:
+                return points[:k], distances[:k]
+            radius_km *= 2
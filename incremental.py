@@ -0,0 +1,294 @@
+import datetime
+import hashlib
+
+import pandas as pd
+
+from schema import WRITE_PRAGMAS, connect_database, create_indexes
+from snapshot import file_sha256
+
+#INCREMENTAL BUILDS UPDATE THE LIVE DATABASE IN ONE TRANSACTION (READERS SEE EITHER THE OLD OR THE NEW TABLES, NEVER AN EMPTY ONE),
+#WRITING ONLY ITS INSERTED, UPDATED AND DELETED ROWS. ROWS ARE MATCHED BY THE HASH OF THEIR KEY, AND CHANGED ROWS FOUND BY THE HASH
+#OF THEIR CONTENT, BOTH KEPT IN row_hashes
+#THE ATTRACTIONS ARE HASHED AS THEY ARE READ FROM THE SOURCE, BEFORE THEY ARE MAPPED, SO database_creator.py MAPS AND WRITES ONLY THE
+#CHANGED ONES. THE COUNTRIES AND DESTINATIONS (ONE ROW PER COUNTRY / DESTINATION) ARE BUILT WHOLE INTO new, AN ATTACHED IN-MEMORY
+#DATABASE, AND DIFFED BY THE HASHES OF THEIR ROWS
+#EVERY BUILD ADDS ONE ROW PER TABLE TO build_manifest
+
+#TABLES DIFFED BY THE HASHES OF THEIR ROWS, WITH THE COLUMNS WHICH IDENTIFY A ROW
+SYNC_KEYS = {
+    'countries': ['Country'],
+    'destinations': ['Destination', 'Country'],
+}
+#THE HASHES OF THE SOURCE ROWS OF THE ATTRACTIONS ARE KEPT UNDER THIS NAME (Row_id IS THE ROWID OF THE ATTRACTION), WITH THE COLUMNS WHICH IDENTIFY ONE
+SOURCE_HASHES = 'attractions_source'
+SOURCE_KEYS = ['Destination', 'Name']
+BUILD_TABLES = ['countries', 'destinations', 'attractions', 'destination_attraction_stats', 'attraction_rank_thresholds']
+HASH_TABLE = 'row_hashes'
+MANIFEST_TABLE = 'build_manifest'
+HASH_CHUNK_ROWS = 100000
+#THE DIFF SORTS THE HASHES OF ALL ROWS OF A TABLE TWICE, A LARGER PAGE CACHE KEEPS THOSE SORTS IN MEMORY
+INCREMENTAL_PRAGMAS = WRITE_PRAGMAS + (('cache_size', -64 * 1024),)
+
+
+def sources_sha256(paths):
+    """One checksum of all source files (and the code that builds from them)."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(file_sha256(path).encode())
+    return digest.hexdigest()
+
+
+def table_columns(conn, table, schema='main'):
+    """(name, declared type) of every column, empty if there is no such table."""
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+
+def has_rowid_key(conn, table, schema='main'):
+    """Whether the table has an INTEGER PRIMARY KEY, which is its rowid (e.g. destinations.destination_id)."""
+    keys = [row for row in conn.execute(f'PRAGMA {schema}.table_info("{table}")') if row[5]]
+    return len(keys) == 1 and keys[0][2].upper() == 'INTEGER'
+
+
+def has_row_hashes(conn):
+    """Whether the database has the source row hashes and the manifest of a previous build."""
+    if 'Code_sha256' not in dict(table_columns(conn, MANIFEST_TABLE)) or not table_columns(conn, HASH_TABLE):
+        return False
+    return conn.execute(f'SELECT 1 FROM "{HASH_TABLE}" WHERE Table_name = ? LIMIT 1', (SOURCE_HASHES,)).fetchone() is not None
+
+
+def last_build(conn):
+    """(Sources_sha256, Code_sha256) of the last build."""
+    return conn.execute(f'SELECT Sources_sha256, Code_sha256 FROM "{MANIFEST_TABLE}" ORDER BY rowid DESC LIMIT 1').fetchone() or (None, None)
+
+
+class RowHashes:
+    """Hashes of the rows of one table, added a chunk at a time (read from the table, or from its source as it is read), then stored or diffed in SQLite.
+
+    Rows with the same key are told apart by their order: their occurrence number, which SQLite counts once all
+    rows are in (so no chunk needs the keys of the others), is mixed into the low bits of the key hash.
+    """
+
+    def __init__(self, conn, name, keys):
+        self.conn = conn
+        self.name = name
+        self.keys = keys
+        self.rows = 0
+        self._chunk_hashes = f'temp."{name}_chunk_hashes"'
+        conn.execute(f'DROP TABLE IF EXISTS {self._chunk_hashes}')
+        conn.execute(f'CREATE TEMP TABLE "{name}_chunk_hashes" (Row_id INTEGER PRIMARY KEY, Key_hash INTEGER, Row_hash INTEGER)')
+
+    def add(self, chunk, numeric=None, row_ids=None):
+        """Hashes one chunk. Rows are numbered from 1 in the order they are added, unless `row_ids` are given.
+
+        Numeric columns (by default those of a numeric dtype) are hashed as floats, so a column read as
+        integers in one chunk and as floats (because of a missing value) in another hashes the same.
+        """
+        if numeric is None:
+            numeric = [name for name in chunk.columns if pd.api.types.is_numeric_dtype(chunk[name])]
+        if row_ids is None:
+            row_ids = range(self.rows + 1, self.rows + len(chunk) + 1)
+        chunk = pd.DataFrame({name: pd.to_numeric(chunk[name]).astype(float) if name in numeric else chunk[name].astype(object) for name in chunk.columns})
+        key_hashes = pd.util.hash_pandas_object(chunk[self.keys], index=False).to_numpy()
+        row_hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        #SQLITE INTEGERS ARE SIGNED
+        self.conn.executemany(f'INSERT INTO {self._chunk_hashes} VALUES (?, ?, ?)', zip(list(row_ids), key_hashes.view('int64').tolist(), row_hashes.view('int64').tolist()))
+        self.rows += len(chunk)
+
+    def _keyed(self):
+        #KEY HASH XOR OCCURRENCE, WHICH SQLITE (WITHOUT A XOR OPERATOR) WRITES AS (a | b) - (a & b)
+        return ('SELECT Row_id, (Key_hash | Occurrence) - (Key_hash & Occurrence) AS Key_hash, Row_hash FROM '
+                f'(SELECT Row_id, Key_hash, Row_hash, row_number() OVER (PARTITION BY Key_hash ORDER BY Row_id) - 1 AS Occurrence FROM {self._chunk_hashes})')
+
+    def store(self, target=HASH_TABLE):
+        """Writes (Table_name, Row_id, Key_hash, Row_hash) of every row into `target`. Returns the number of rows."""
+        rows = self.conn.execute(f'INSERT INTO {target} SELECT ?, Row_id, Key_hash, Row_hash FROM ({self._keyed()})', (self.name,)).rowcount
+        self.conn.execute(f'DROP TABLE {self._chunk_hashes}')
+        return rows
+
+    def diff(self):
+        """Matches the rows with the stored hashes of the previous build into temp.row_diff, which keeps only the inserted, updated and deleted ones.
+
+        Returns (rows, inserted, updated, deleted).
+        """
+        #ONE SORT OF BOTH VERSIONS BY KEY IN SQLITE, SO THE DIFF NEVER HAS TO FIT IN MEMORY AND ONLY CHANGED ROWS ARE WRITTEN
+        self.conn.execute('DROP TABLE IF EXISTS temp.row_diff')
+        self.conn.execute('CREATE TEMP TABLE row_diff AS '
+                          'SELECT Key_hash, max(Old_id) AS Old_id, max(New_id) AS New_id, max(Old_hash) AS Old_hash, max(New_hash) AS New_hash FROM ('
+                          f'SELECT Key_hash, Row_id AS Old_id, NULL AS New_id, Row_hash AS Old_hash, NULL AS New_hash FROM "{HASH_TABLE}" WHERE Table_name = ? '
+                          f'UNION ALL SELECT Key_hash, NULL, Row_id, NULL, Row_hash FROM ({self._keyed()})'
+                          ') GROUP BY Key_hash HAVING max(Old_hash) IS NOT max(New_hash)', (self.name,))
+        count = lambda rows: self.conn.execute(f'SELECT count(*) FROM temp.row_diff WHERE {rows}').fetchone()[0]
+        return (self.rows, count(INSERTED_ROWS), count(UPDATED_ROWS), count(DELETED_ROWS))
+
+
+def table_hashes(conn, table, schema='main', chunk_rows=HASH_CHUNK_ROWS):
+    """RowHashes of a table (one of SYNC_KEYS), read a chunk at a time."""
+    numeric = [name for name, declared in table_columns(conn, table, schema) if declared in ('INTEGER', 'REAL')]
+    hashes = RowHashes(conn, table, SYNC_KEYS[table])
+    for chunk in pd.read_sql_query(f'SELECT rowid AS Row_id, * FROM {schema}."{table}" ORDER BY rowid', conn, chunksize=chunk_rows):
+        hashes.add(chunk, numeric, chunk.pop('Row_id').tolist())
+    return hashes
+
+
+def insert_rows(conn, table, df, row_ids=None):
+    """Appends the rows of `df` to `table` (qualified, e.g. new."attractions"), missing values as NULL.
+
+    Used instead of to_sql, which only writes into main and commits the transaction of an incremental build.
+    """
+    columns = [f'"{name}"' for name in df.columns]
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    if row_ids is not None:
+        columns.insert(0, 'rowid')
+        rows = ((row_id,) + row for row_id, row in zip(row_ids, rows))
+    conn.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', rows)
+
+
+def create_build_tables(conn):
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{HASH_TABLE}" (Table_name TEXT, Row_id INTEGER, Key_hash INTEGER, Row_hash INTEGER, PRIMARY KEY (Table_name, Row_id))')
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{MANIFEST_TABLE}" (Built_at TEXT, Mode TEXT, Sources_sha256 TEXT, Code_sha256 TEXT, '
+                 'Table_name TEXT, Rows INTEGER, Inserted INTEGER, Updated INTEGER, Deleted INTEGER)')
+
+
+def record_build(conn, mode, sources, code, changes):
+    """`sources` is the checksum of the source files and the build code, `code` of the build code alone."""
+    built_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+    conn.executemany(f'INSERT INTO "{MANIFEST_TABLE}" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(built_at, mode, sources, code, table) + tuple(counts) for table, counts in changes.items()])
+
+
+def record_full_build(conn, sources, code, source_hashes, chunk_rows=HASH_CHUNK_ROWS):
+    """Row hashes and the manifest of a database built from scratch. `source_hashes` are the RowHashes of the source attractions.
+
+    Returns table -> (rows, inserted, updated, deleted).
+    """
+    create_build_tables(conn)
+    changes = {}
+    for table in BUILD_TABLES:
+        rows = conn.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0]
+        changes[table] = (rows, rows, 0, 0)
+    for table in SYNC_KEYS:
+        table_hashes(conn, table, chunk_rows=chunk_rows).store()
+    source_hashes.store()
+    record_build(conn, 'full', sources, code, changes)
+    return changes
+
+
+#ROWS OF row_diff: KEYS ONLY IN THE OLD TABLE, CHANGED ROWS AND KEYS ONLY IN THE NEW TABLE
+DELETED_ROWS = 'New_id IS NULL'
+UPDATED_ROWS = 'Old_id IS NOT NULL AND New_id IS NOT NULL AND Old_hash != New_hash'
+INSERTED_ROWS = 'Old_id IS NULL'
+
+
+def _replace_table(conn, table, hashes):
+    """A table whose columns changed (or which is new) is copied whole."""
+    conn.execute(f'DROP TABLE IF EXISTS main."{table}"')
+    conn.execute(conn.execute("SELECT sql FROM new.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0])
+    quoted = ', '.join(f'"{name}"' for name, _ in table_columns(conn, table, 'new'))
+    rowid = '' if has_rowid_key(conn, table, 'new') else 'rowid, '
+    conn.execute(f'INSERT INTO main."{table}" ({rowid}{quoted}) SELECT {rowid}{quoted} FROM new."{table}" ORDER BY rowid')
+    conn.execute(f'DELETE FROM "{HASH_TABLE}" WHERE Table_name = ?', (table,))
+    hashes.store()
+
+
+def _write_rows(conn, table, name):
+    """Applies temp.row_diff to main.`table`, the new versions of the rows taken from new.`table` by their New_id, and to the hashes of `name`.
+
+    Returns the rowids of the updated and inserted rows.
+    """
+    columns = [column for column, _ in table_columns(conn, table, 'new')]
+    quoted = ', '.join(f'"{column}"' for column in columns)
+    new_columns = ', '.join(f'n."{column}"' for column in columns)
+    if has_rowid_key(conn, table, 'new'):
+        #THE ROWID IS THE KEY COLUMN ITSELF (KEPT BY database_creator.py FOR ROWS WHICH DID NOT CHANGE), SO ROWS ARE COPIED WITH IT
+        removed = f'SELECT Old_id FROM temp.row_diff WHERE {DELETED_ROWS} OR {UPDATED_ROWS}'
+        added = f'{INSERTED_ROWS} OR {UPDATED_ROWS}'
+        conn.execute(f'DELETE FROM main."{table}" WHERE rowid IN ({removed})')
+        conn.execute(f'DELETE FROM "{HASH_TABLE}" WHERE Table_name = ? AND Row_id IN ({removed})', (name,))
+        conn.execute(f'INSERT INTO main."{table}" ({quoted}) SELECT {quoted} FROM new."{table}" WHERE rowid IN (SELECT New_id FROM temp.row_diff WHERE {added})')
+        conn.execute(f'INSERT INTO "{HASH_TABLE}" SELECT ?, New_id, Key_hash, New_hash FROM temp.row_diff WHERE {added}', (name,))
+        return {row[0] for row in conn.execute(f'SELECT New_id FROM temp.row_diff WHERE {added}')}
+
+    deleted = f'SELECT Old_id FROM temp.row_diff WHERE {DELETED_ROWS}'
+    conn.execute(f'DELETE FROM main."{table}" WHERE rowid IN ({deleted})')
+    conn.execute(f'DELETE FROM "{HASH_TABLE}" WHERE Table_name = ? AND Row_id IN ({deleted})', (name,))
+    #UPDATED ROWS KEEP THEIR ROWID, SO THEIR PLACE IN THE TABLE
+    conn.execute(f'INSERT OR REPLACE INTO main."{table}" (rowid, {quoted}) SELECT d.Old_id, {new_columns} '
+                 f'FROM temp.row_diff d JOIN new."{table}" n ON n.rowid = d.New_id WHERE {UPDATED_ROWS}')
+    conn.execute(f'UPDATE "{HASH_TABLE}" SET Row_hash = d.New_hash FROM temp.row_diff d '
+                 f'WHERE "{HASH_TABLE}".Table_name = ? AND "{HASH_TABLE}".Row_id = d.Old_id AND {UPDATED_ROWS}', (name,))
+    #NEW ROWS GO AFTER THE LAST ONE, IN THEIR ORDER IN THE NEW TABLE
+    last_id = conn.execute(f'SELECT coalesce(max(rowid), 0) FROM main."{table}"').fetchone()[0]
+    conn.execute(f'INSERT INTO main."{table}" (rowid, {quoted}) SELECT ? + row_number() OVER (ORDER BY d.New_id), {new_columns} '
+                 f'FROM temp.row_diff d JOIN new."{table}" n ON n.rowid = d.New_id WHERE {INSERTED_ROWS} ORDER BY d.New_id', (last_id,))
+    inserted = conn.execute(f'INSERT INTO "{HASH_TABLE}" SELECT ?, ? + row_number() OVER (ORDER BY New_id), Key_hash, New_hash '
+                            f'FROM temp.row_diff WHERE {INSERTED_ROWS} ORDER BY New_id', (name, last_id)).rowcount
+    written = {row[0] for row in conn.execute(f'SELECT Old_id FROM temp.row_diff WHERE {UPDATED_ROWS}')}
+    return written | set(range(last_id + 1, last_id + inserted + 1))
+
+
+def sync_table(conn, table, chunk_rows=HASH_CHUNK_ROWS):
+    """Applies the inserted, updated and deleted rows of new.`table` (one of SYNC_KEYS, built whole) to main. Returns (rows, inserted, updated, deleted)."""
+    hashes = table_hashes(conn, table, 'new', chunk_rows)
+    if [name for name, _ in table_columns(conn, table)] != [name for name, _ in table_columns(conn, table, 'new')]:
+        old_rows = conn.execute(f'SELECT count(*) FROM "{HASH_TABLE}" WHERE Table_name = ?', (table,)).fetchone()[0]
+        _replace_table(conn, table, hashes)
+        return (hashes.rows, hashes.rows, 0, old_rows)
+    changes = hashes.diff()
+    _write_rows(conn, table, table)
+    return changes
+
+
+def changed_source_rows(conn):
+    """Numbers (from 1) of the inserted and updated source rows, the only ones to map into new."attractions", under the same rowids."""
+    return [row[0] for row in conn.execute(f'SELECT New_id FROM temp.row_diff WHERE {INSERTED_ROWS} OR {UPDATED_ROWS} ORDER BY New_id')]
+
+
+def replaced_rows(conn, table, columns):
+    """`columns` of the rows of main.`table` which the source diff deletes or updates, before they are."""
+    quoted = ', '.join(f'"{column}"' for column in columns)
+    return pd.read_sql_query(f'SELECT {quoted} FROM main."{table}" WHERE rowid IN (SELECT Old_id FROM temp.row_diff WHERE {DELETED_ROWS} OR {UPDATED_ROWS})', conn)
+
+
+def apply_source_rows(conn, table):
+    """Applies the source diff to main.`table`, with the mapped changed rows of new.`table`. Returns the rowids of the updated and inserted rows."""
+    return _write_rows(conn, table, SOURCE_HASHES)
+
+
+def replace_rows(conn, table, df):
+    """Rewrites a small derived table (e.g. attraction_rank_thresholds) if any of its rows changed. Returns (rows, inserted, updated, deleted)."""
+    old = pd.read_sql_query(f'SELECT * FROM main."{table}"', conn)
+    if len(old) == len(df) and list(old.columns) == list(df.columns):
+        updated = int((~((old == df) | (old.isna() & df.isna())).all(axis=1)).sum())
+        changes = (len(df), 0, updated, 0)
+    else:
+        changes = (len(df), len(df), 0, len(old))
+    if sum(changes[1:]):
+        conn.execute(f'DELETE FROM main."{table}"')
+        insert_rows(conn, f'main."{table}"', df)
+    return changes
+
+
+def apply_changes(db_path, sources, code, update):
+    """Runs `update(conn)` on the live database in one transaction, with an empty in-memory database attached as new for the new versions
+    of its tables, and records the build. `update` returns table -> (rows, inserted, updated, deleted), which is returned.
+    """
+    conn = connect_database(db_path, INCREMENTAL_PRAGMAS, isolation_level=None)
+    try:
+        conn.execute("ATTACH DATABASE ':memory:' AS new")
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            create_build_tables(conn)
+            changes = update(conn)
+            create_indexes(conn)
+            record_build(conn, 'incremental', sources, code, changes)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('DETACH DATABASE new')
+        #COPIES THE COMMIT FROM THE -wal FILE INTO THE DATABASE FILE, SO ITS VERSION (MODIFICATION TIME) CHANGES FOR EVERY READER
+        #(A READER IN THE MIDDLE OF A READ CAN KEEP IT FROM FINISHING, database_version THEN SEES THE -wal FILE CHANGE)
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    finally:
+        conn.close()
+    return changes
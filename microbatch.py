@@ -0,0 +1,117 @@
+import asyncio
+
+from recommender import RESULT_COUNTRY_COLUMNS, get_engine
+
+#ASYNCIO FRONT END WHICH FUSES CONCURRENT REQUESTS: REQUESTS ARRIVING WITHIN A SHORT WINDOW ARE SCORED AS ONE BATCH
+#(ONE MATRIX-MATRIX PRODUCT PER GROUP OF PROFILES, SEE RecommenderEngine._recommend_batch) AND EVERY CALLER GETS ITS OWN TOP-N
+#
+#batcher = MicroBatcher(window=0.002, max_batch=64)
+#recommendations = await batcher.recommend('vacation', preferences, weights)
+
+BATCH_WINDOW = 0.002
+MAX_BATCH = 64
+
+
+def score_each(recommend_batch, profiles, top_n, method):
+    """(result, None) or (None, exception) of every profile scored on its own."""
+    outcomes = []
+    for profile in profiles:
+        try:
+            outcomes.append((recommend_batch([profile], top_n, method)[0], None))
+        except Exception as e:
+            outcomes.append((None, e))
+    return outcomes
+
+
+class MicroBatcher:
+    """Collects requests for up to `window` seconds or `max_batch` requests, whichever comes first, and scores them together.
+
+    The batch is scored in `executor` (the default thread pool of the loop if None), so the event
+    loop keeps accepting requests meanwhile. Latency of a request is at most the window plus the
+    time of one batch of `max_batch` profiles.
+    """
+
+    def __init__(self, engine=None, window=BATCH_WINDOW, max_batch=MAX_BATCH, executor=None, method='partition'):
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self.executor = executor
+        self.method = method
+        self.batches = 0
+        self.requests = 0
+        #(MODE, TOP N) -> REQUESTS WAITING FOR THE NEXT BATCH, WITH THE TIMER WHICH FLUSHES THEM
+        self._pending = {}
+        self._timers = {}
+        self._running = set()
+
+    async def recommend(self, mode, preferences, weights, top_n=10):
+        """Recommendations for one request, scored together with the requests around it."""
+        if mode not in RESULT_COUNTRY_COLUMNS:
+            raise ValueError(f"Unknown recommendation mode: {mode}")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (mode, top_n)
+        pending = self._pending.setdefault(key, [])
+        pending.append((preferences, weights, future))
+        if len(pending) >= self.max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await future
+
+    async def vacation(self, preferences, weights, top_n=10):
+        return await self.recommend('vacation', preferences, weights, top_n)
+
+    async def emigration(self, preferences, weights, top_n=10):
+        return await self.recommend('emigration', preferences, weights, top_n)
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, [])
+        if batch:
+            task = asyncio.ensure_future(self._score(key, batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _score(self, key, batch):
+        mode, top_n = key
+        profiles = [(preferences, weights) for preferences, weights, _ in batch]
+        loop = asyncio.get_running_loop()
+        try:
+            engine = self.engine or get_engine()
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        recommend_batch = engine.recommend_vacation_batch if mode == 'vacation' else engine.recommend_emigration_batch
+        try:
+            results = await loop.run_in_executor(self.executor, recommend_batch, profiles, top_n, self.method)
+            outcomes = [(result, None) for result in results]
+        except Exception as e:
+            outcomes = [(None, e)]
+            if len(batch) > 1:
+                #ONE BAD PROFILE (E.G. AN UNKNOWN ORIGIN) FAILS THE WHOLE BATCH, SO EVERY PROFILE IS SCORED ALONE AND ONLY ITS OWN CALLER GETS THE ERROR
+                outcomes = await loop.run_in_executor(self.executor, score_each, recommend_batch, profiles, top_n, self.method)
+        self.batches += 1
+        self.requests += len(batch)
+        for (_, _, future), (result, error) in zip(batch, outcomes):
+            #A CALLER WHICH GAVE UP (E.G. CANCELLED ON TIMEOUT) IS SKIPPED
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    async def close(self):
+        """Scores everything still waiting and waits for the running batches."""
+        for key in list(self._pending):
+            self._flush(key)
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stats(self):
+        return {'batches': self.batches, 'requests': self.requests, 'average_batch': self.requests / self.batches if self.batches else 0.0}
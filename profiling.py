@@ -0,0 +1,157 @@
+import contextlib
+import contextvars
+import time
+import tracemalloc
+
+#OPTIONAL INSTRUMENTATION OF THE RECOMMENDERS: EVERY STAGE OF A REQUEST RECORDS ITS WALL TIME, ROWS AND ALLOCATED MEMORY
+#WHEN PROFILING IS OFF, A STAGE IS ONE CONTEXT VARIABLE LOOKUP AND A SHARED NO-OP CONTEXT MANAGER
+
+_NOTHING = contextlib.nullcontext()
+_active_trace = contextvars.ContextVar('recommendation_trace', default=None)
+_active_session = contextvars.ContextVar('recommendation_profiling', default=None)
+_global_session = None
+#WHETHER enable_profiling STARTED TRACEMALLOC, SO disable_profiling STOPS ONLY WHAT IT STARTED
+_global_started_tracemalloc = False
+
+
+class Trace:
+    """Structured timings of one traced operation (a request, a batch or an engine load).
+
+    Stages can be nested: every stage records its depth and its parent stage, in the order the stages
+    start, and the memory of an outer stage includes the peak of its inner ones. Only stages of depth 0
+    add up to the total.
+    """
+
+    def __init__(self, name, memory=False, **info):
+        self.name = name
+        self.info = info
+        self.memory = memory
+        self.stages = []
+        self.total_seconds = None
+        #OPEN STAGES, INNERMOST LAST: [RECORD, TRACED MEMORY AT THE START, HIGHEST PEAK OF ITS FINISHED INNER STAGES]
+        self._open = []
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        parent = self._open[-1] if self._open else None
+        record = {'stage': name, 'seconds': None, 'rows': rows, 'depth': len(self._open), 'parent': parent[0]['stage'] if parent else None}
+        self.stages.append(record)
+        frame = [record, 0, 0]
+        if self.memory:
+            current_before, peak_before = tracemalloc.get_traced_memory()
+            #THE PEAK IS RESET FOR THIS STAGE, SO THE PEAK OF THE OUTER ONE UP TO HERE IS KEPT IN ITS FRAME
+            if parent:
+                parent[2] = max(parent[2], peak_before)
+            frame[1:] = [current_before, current_before]
+            tracemalloc.reset_peak()
+        self._open.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['seconds'] = time.perf_counter() - started
+            self._open.pop()
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, frame[2])
+                record['allocated_bytes'] = peak - frame[1]
+                record['retained_bytes'] = current - frame[1]
+                if parent:
+                    parent[2] = max(parent[2], peak)
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self._started
+
+    def as_dict(self):
+        return {'name': self.name, 'info': dict(self.info), 'total_seconds': self.total_seconds, 'stages': [dict(stage) for stage in self.stages]}
+
+    def __str__(self):
+        lines = [f"{self.name} {self.info} total {1000 * (self.total_seconds or 0):.3f} ms"]
+        for stage in self.stages:
+            line = f"  {'  ' * stage['depth'] + stage['stage']:<28} {1000 * stage['seconds']:9.3f} ms"
+            line += f" {stage['rows']:>10} rows" if stage['rows'] is not None else " " * 16
+            if 'allocated_bytes' in stage:
+                line += f" {stage['allocated_bytes'] / 1024:10.1f} KiB"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class ProfilingSession:
+    """Collects finished traces and passes each one to an optional sink (any callable)."""
+
+    def __init__(self, sink=None, memory=False, keep=True):
+        self.sink = sink
+        self.memory = memory
+        self.keep = keep
+        self.traces = []
+
+    @contextlib.contextmanager
+    def trace(self, name, **info):
+        trace = Trace(name, memory=self.memory, **info)
+        token = _active_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _active_trace.reset(token)
+            trace.finish()
+            if self.keep:
+                self.traces.append(trace)
+            if self.sink is not None:
+                self.sink(trace)
+
+
+@contextlib.contextmanager
+def profiling(sink=None, memory=False):
+    """Traces every recommendation made inside the block, yields the list the traces are collected in.
+
+    with profiling() as traces:
+        get_vacation_recommendations(preferences, weights)
+    print(traces[0])
+    """
+    session = ProfilingSession(sink, memory)
+    started_tracemalloc = memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    token = _active_session.set(session)
+    try:
+        yield session.traces
+    finally:
+        _active_session.reset(token)
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+
+def enable_profiling(sink=print, memory=False):
+    """Traces every request of the process (e.g. in production) and sends each trace to `sink`."""
+    global _global_session, _global_started_tracemalloc
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _global_started_tracemalloc = True
+    _global_session = ProfilingSession(sink, memory, keep=False)
+
+
+def disable_profiling():
+    global _global_session, _global_started_tracemalloc
+    _global_session = None
+    if _global_started_tracemalloc:
+        tracemalloc.stop()
+        _global_started_tracemalloc = False
+#WHETHER enable_profiling STARTED TRACEMALLOC, SO disable_profiling STOPS ONLY WHAT IT STARTED
+_global_started_tracemalloc = False
+
+
+def traced(name, **info):
+    """Context manager around a whole operation, a no-op unless profiling is on."""
+    session = _active_session.get() or _global_session
+    if session is None or _active_trace.get() is not None:
+        return _NOTHING
+    return session.trace(name, **info)
+
+
+def stage(name, rows=None):
+    """Context manager around one stage of the traced operation, a no-op unless profiling is on."""
+    trace = _active_trace.get()
+    if trace is None:
+        return _NOTHING
+    return trace.stage(name, rows)
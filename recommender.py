@@ -1,6 +1,21 @@
+import numpy as np
 import pandas as pd
-import sqlite3
-import re
+import hashlib
+import os
+import threading
+import warnings
+from collections import OrderedDict, namedtuple
+
+from profiling import stage, traced
+from schema import connect_database
+from snapshot import load_snapshot, snapshot_path, wal_state, write_snapshot
+from geo import ORIGIN_CITIES, SpatialGrid, great_circle_km, unit_vectors
+from skyline import representative_rows, skyband
+from similarity import SimilarityIndex
+
+
+class PreferenceError(ValueError):
+    """Preferences or arguments of a request the engine cannot use (an unknown origin, travel window or factor), the caller's mistake."""
 
 
 #constants
@@ -15,19 +30,23 @@ ALL_ATTRACTION_GROUPS = [
 ]
 
 #ATTRACTIONS POPULARITY
+#(HIGHEST RANK, POINTS): RANKS BELOW 1000 GET 0.1 IF THEY ARE IN THE BETTER HALF OF ALL RANKS, 0.05 OTHERWISE
+POPULARITY_RANK_TIERS = [(1, 1.0), (5, 0.9), (20, 0.8), (50, 0.7), (100, 0.6), (200, 0.5), (500, 0.3), (1000, 0.2)]
+
 def calculate_attraction_popularity_score(rank, max_rank):
     """Non-linear function for scoring attraction popularity."""
     if pd.isna(rank): return 0.0
-    if rank == 1: return 1.0
-    elif rank <= 5: return 0.9
-    elif rank <= 20: return 0.8
-    elif rank <= 50: return 0.7
-    elif rank <= 100: return 0.6
-    elif rank <= 200: return 0.5
-    elif rank <= 500: return 0.3
-    elif rank <= 1000: return 0.2
-    elif rank <= max_rank / 2: return 0.1
-    else: return 0.05
+    for highest_rank, points in POPULARITY_RANK_TIERS:
+        if rank <= highest_rank: return points
+    if rank <= max_rank / 2: return 0.1
+    return 0.05
+
+def attraction_popularity_scores(ranks, max_rank):
+    """Vectorised calculate_attraction_popularity_score for a whole array of ranks."""
+    ranks = np.asarray(ranks, dtype=float)
+    conditions = [ranks <= highest_rank for highest_rank, _ in POPULARITY_RANK_TIERS] + [ranks <= max_rank / 2]
+    points = [points for _, points in POPULARITY_RANK_TIERS] + [0.1]
+    return np.where(np.isnan(ranks), 0.0, np.select(conditions, points, 0.05))
 
 #CUISINE SCORE
 def calculate_cuisine_score(rank, max_rank=100):
@@ -39,233 +58,1483 @@ def calculate_cuisine_score(rank, max_rank=100):
     return score
 
 
-#VACATION CALCULATION
-def get_vacation_recommendations(preferences, weights, top_n=10):
-    #CONNECTING TO TRAVEL_RECOMMENDATION DATABASE
+DB_PATH = "travel_recommendation_final.db"
+
+
+#RECOMMENDER ENGINE
+MONTH_COLUMNS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+BUDGET_COLUMNS = {'Budget': 'Overall_Daily_Cost_Budget_USD', 'MidRange': 'Overall_Daily_Cost_MidRange_USD', 'Luxury': 'Overall_Daily_Cost_Luxury_USD'}
+
+#EVERY FACTOR IS DECLARED ONCE IN FACTOR_REGISTRY, THE FACTORS OF A REQUEST ARE COMPILED INTO ONE SCORING PASS
+#NAME: COLUMN OF THE FACTOR MATRIX, WEIGHT: KEY IN THE WEIGHTS DICTIONARY, SOURCE: DATABASE COLUMN(S)
+#TRANSFORM:
+#   'linear' - MIN-MAX NORMALISED OVER THE DESTINATIONS, 'squared' - NORMALISED AND SQUARED (DISTANCE),
+#   'cuisine' - calculate_cuisine_score OF THE RANK, NOT NORMALISED,
+#   'weather_month' - WEATHER POINTS OF THE CHOSEN MONTH, 'weather_year' - WEATHER POINTS SUMMED FOR THE YEAR AND NORMALISED,
+#   'weather_window' - WEATHER POINTS OF THE CHOSEN MONTHS AGGREGATED WITH aggregate_window,
+#   'attraction_count' / 'attraction_quality' - ATTRACTIONS OF THE CHOSEN GROUPS, 'language' - 1 IF A KNOWN LANGUAGE IS SPOKEN,
+#   'origin_distance' - GREAT-CIRCLE DISTANCE FROM THE CHOSEN ORIGIN, NORMALISED AND SQUARED
+#NAN: 'fill_before' - A MISSING VALUE COUNTS AS 0 WHEN NORMALISING, 'zero_after' - A MISSING VALUE RECEIVES 0 POINTS
+#EQUAL: POINTS OF EVERY DESTINATION IF ALL OF THEM HAVE THE SAME VALUE
+#CHOSEN_BY: (PREFERENCE, VALUE) WHICH TURNS THE FACTOR ON (ANY_VALUE: ANY GIVEN VALUE, NONE: PREFERENCE NOT GIVEN), NONE IF IT ALWAYS COUNTS
+Factor = namedtuple('Factor', ['name', 'weight', 'source', 'higher_is_better', 'transform', 'nan', 'equal', 'modes', 'chosen_by'], defaults=[None])
+VACATION = ('vacation',)
+EMIGRATION = ('emigration',)
+BOTH_MODES = ('vacation', 'emigration')
+ANY_VALUE = '*'
+FACTOR_REGISTRY = [
+    Factor('budget_Budget', 'budget', 'Overall_Daily_Cost_Budget_USD', False, 'linear', 'zero_after', 0.0, VACATION, ('budget', 'Budget')),
+    Factor('budget_MidRange', 'budget', 'Overall_Daily_Cost_MidRange_USD', False, 'linear', 'zero_after', 0.0, VACATION, ('budget', 'MidRange')),
+    Factor('budget_Luxury', 'budget', 'Overall_Daily_Cost_Luxury_USD', False, 'linear', 'zero_after', 0.0, VACATION, ('budget', 'Luxury')),
+    #ROAD DISTANCE FROM LODZ, OR THE GREAT-CIRCLE DISTANCE FROM THE USER'S 'origin' IF THEY GIVE ONE
+    Factor('distance', 'distance', 'Distance_from_Lodz_km_road', False, 'squared', 'zero_after', 0.5, BOTH_MODES, ('origin', None)),
+    Factor('distance', 'distance', ('Latitude', 'Longitude'), False, 'origin_distance', 'zero_after', 0.5, BOTH_MODES, ('origin', ANY_VALUE)),
+    Factor('safety', 'safety', 'Safety_Index', True, 'linear', 'fill_before', 0.0, BOTH_MODES),
+    Factor('attractions_popularity', 'attractions_popularity', 'attraction_popularity_score', True, 'linear', 'fill_before', 0.0, VACATION),
+    Factor('english_level', 'english_level', 'English_EPI_Score', True, 'linear', 'fill_before', 0.5, BOTH_MODES),
+    Factor('cost_of_living', 'cost_of_living', 'CostofLivingPlusRentIndex', False, 'linear', 'fill_before', 0.0, EMIGRATION),
+    Factor('unemployment', 'unemployment', 'Unemployment_Rate_National_Latest_Pct', False, 'linear', 'fill_before', 0.0, EMIGRATION),
+    Factor('inflation', 'inflation', 'Inflation_Rate_National_Latest_Pct', False, 'linear', 'fill_before', 0.0, EMIGRATION),
+    Factor('purchasing_power', 'purchasing_power', 'LocalPurchasingPowerIndex', True, 'linear', 'fill_before', 0.0, EMIGRATION),
+    Factor('hdi', 'hdi', 'HDI_Value_Latest', True, 'linear', 'fill_before', 0.0, EMIGRATION),
+    Factor('life_expectancy', 'life_expectancy', 'Life_Expectancy', True, 'linear', 'fill_before', 0.0, EMIGRATION),
+    Factor('cuisine_quality', 'cuisine_quality', 'Cuisine_Rank', False, 'cuisine', 'zero_after', 0.0, VACATION),
+    #ONE MONTH, OR A TRAVEL WINDOW OF SEVERAL MONTHS IF THE USER GIVES 'months'
+    Factor('weather', 'weather', tuple(MONTH_COLUMNS), True, 'weather_month', 'zero_after', 0.0, VACATION, ('months', None)),
+    Factor('weather', 'weather', tuple(MONTH_COLUMNS), True, 'weather_window', 'zero_after', 0.0, VACATION, ('months', ANY_VALUE)),
+    Factor('weather', 'weather', tuple(MONTH_COLUMNS), True, 'weather_year', 'zero_after', 0.0, EMIGRATION),
+    Factor('attractions_quantity', 'attractions_quantity', 'attractions', True, 'attraction_count', 'zero_after', 0.0, VACATION),
+    Factor('attractions_quality', 'attractions_quality', 'attractions', True, 'attraction_quality', 'zero_after', 0.0, VACATION),
+    Factor('known_languages', 'known_languages', 'Language', True, 'language', 'zero_after', 0.0, BOTH_MODES),
+]
+#THESE TRANSFORMS DO NOT DEPEND ON THE USER, SO THEIR FACTORS ARE NORMALISED ONCE AND KEPT AS COLUMNS OF ONE MATRIX
+STATIC_TRANSFORMS = ('linear', 'squared', 'cuisine')
+STATIC_FACTORS = [factor for factor in FACTOR_REGISTRY if factor.transform in STATIC_TRANSFORMS]
+#FEATURE GROUPS OF THE "MORE LIKE THIS" SIMILARITY INDEX, EACH CAN BE WEIGHTED IN A QUERY
+SIMILARITY_GROUPS = ('weather', 'cost', 'safety', 'attractions', 'cuisine', 'language')
+#DISTANCE VECTORS OF THE MOST RECENT ORIGINS KEPT IN MEMORY
+ORIGIN_CACHE_SIZE = 256
+#THE COUNTRY COLUMN IN THE RESULTS OF EACH MODE
+RESULT_COUNTRY_COLUMNS = {'vacation': 'Country_x', 'emigration': 'Country'}
+
+
+def mode_factors(mode):
+    """Registry entries of the factors one recommendation mode uses."""
+    if mode not in RESULT_COUNTRY_COLUMNS:
+        raise ValueError(f"Unknown recommendation mode: {mode}")
+    return [factor for factor in FACTOR_REGISTRY if mode in factor.modes]
+
+
+def mode_weight_keys(mode):
+    """Weight keys of one mode, in registry order (the budget columns share one key)."""
+    return list(dict.fromkeys(factor.weight for factor in mode_factors(mode)))
+
+
+#HOW MANY DIFFERENT SETS OF ATTRACTION GROUPS KEEP THEIR QUALITY SUMS IN MEMORY
+QUALITY_CACHE_SIZE = 256
+#RECOMMENDATION RESULTS KEPT IN MEMORY, WEIGHTS ON THE STEP OF THE SLIDERS IN app.py SHARE ONE KEY
+RESULT_CACHE_SIZE = 1024
+WEIGHT_STEP = 0.05
+WEIGHT_GRID_TOLERANCE = 1e-9
+#ROWS READ FROM EVERY SORTED FACTOR IN ONE ROUND OF THE THRESHOLD ALGORITHM
+THRESHOLD_BLOCK_SIZE = 256
+#ATTRACTIONS READ AT A TIME WHEN THE ENGINE IS BUILT FROM A DATABASE WITH PER-DESTINATION AGGREGATES
+ATTRACTION_CHUNK_ROWS = 100000
+#ONLY POPULARITY CAN HAVE A NEGATIVE WEIGHT (SOME USERS WANT TO AVOID CROWDS), OTHER FACTORS COUNT ONLY WITH A POSITIVE WEIGHT
+NEGATIVE_WEIGHT_FACTORS = ['attractions_popularity']
+
+
+def min_max_normalize(values, higher_is_better=True, equal_value=0.0):
+    """Column-wise min-max normalisation of a 2D array, NaN values are left as NaN."""
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        lowest = np.nanmin(values, axis=0)
+        highest = np.nanmax(values, axis=0)
+        #ONE NEW ARRAY, EVERYTHING ELSE IS DONE IN PLACE
+        normalized = np.subtract(values, lowest, dtype=float)
+        normalized /= highest - lowest
+    np.subtract(1, normalized, out=normalized, where=~np.asarray(higher_is_better))
+    #IF ALL DESTINATIONS HAVE THE SAME VALUE, EVERY ONE OF THEM GETS THE SAME NUMBER OF POINTS
+    np.copyto(normalized, equal_value, where=~(highest > lowest))
+    return normalized
+
+
+def effective_weight(weights, factor):
+    """Weight of a factor as the scoring uses it: negative weights only count for popularity."""
+    weight = weights.get(factor, 0)
+    if factor in NEGATIVE_WEIGHT_FACTORS or weight > 0:
+        return weight
+    return 0.0
+
+
+def preference_key(factor, preferences):
+    """The part of the preferences the column of a preference-dependent factor depends on."""
+    if factor.transform == 'weather_month':
+        return (preferences.get('month', '')[:3].capitalize(), str(preferences.get('weather', '')).lower())
+    if factor.transform == 'weather_year':
+        return str(preferences['weather']).lower() if 'weather' in preferences else None
+    if factor.transform == 'weather_window':
+        return (travel_window(preferences['months']), preferences.get('window_aggregation', 'mean'), str(preferences.get('weather', '')).lower())
+    if factor.transform in ('attraction_count', 'attraction_quality'):
+        return tuple(preferences.get('attractions', []))
+    if factor.transform == 'language':
+        return frozenset(lang.lower() for lang in preferences.get('known_languages', []))
+    if factor.transform == 'origin_distance':
+        return origin_key(preferences.get('origin'))
+    return ()
+
+
+def origin_key(origin):
+    """Canonical form of an origin: a lowercase city name or coordinates rounded to about 10 m."""
+    if isinstance(origin, str):
+        return origin.strip().lower()
+    return tuple(round(float(coordinate), 4) for coordinate in origin)
+
+
+def factor_chosen(factor, preferences):
+    """Whether the preferences turn the factor on (see CHOSEN_BY in FACTOR_REGISTRY)."""
+    if factor.chosen_by is None:
+        return True
+    preference, value = factor.chosen_by
+    if value == ANY_VALUE:
+        return preferences.get(preference) is not None
+    return preferences.get(preference) == value
+
+
+def chosen_factor(mode, weight, preferences):
+    """The factor of `mode` which scores the weight key for these preferences (e.g. the chosen budget), None if there is none."""
+    return next((factor for factor in mode_factors(mode) if factor.weight == weight and factor_chosen(factor, preferences)), None)
+
+
+def factor_weight(factor, preferences, weights):
+    """Weight of one registry factor for one user, 0 if the factor is not chosen by their preferences."""
+    if not factor_chosen(factor, preferences):
+        return 0.0
+    return effective_weight(weights, factor.weight)
+
+
+def calculate_weather_score(current_weather, preferred_weather, max_allowed_distance=3):
+    """Scores one weather label against the preferred one, using their distance on WEATHER_SCALE."""
+    weather_value = str(current_weather).strip().lower()
     try:
-        conn = sqlite3.connect("travel_recommendation_final.db")
-        df_dest = pd.read_sql_query("SELECT * FROM destinations", conn)
-        df_attr = pd.read_sql_query("SELECT * FROM attractions", conn)
-        conn.close()
-    except Exception as e:
-        print(f"Error loading data from database: {e}")
+        user_index = WEATHER_SCALE.index(str(preferred_weather).lower())
+        current_index = WEATHER_SCALE.index(weather_value)
+    except ValueError:
+        return 0.0
+    distance = abs(user_index - current_index)
+    if distance > max_allowed_distance: return 0.0
+    return 1.0 - (distance / max_allowed_distance)
+
+
+#WEATHER POINTS FOR EVERY (PREFERRED, ACTUAL) PAIR OF WEATHER_SCALE LABELS, SO SCORING IS ONLY ARRAY INDEXING
+WEATHER_SCORE_TABLE = np.array([[calculate_weather_score(current, preferred) for current in WEATHER_SCALE] for preferred in WEATHER_SCALE])
+#LABELS OUTSIDE WEATHER_SCALE ARE ENCODED AS ONE EXTRA CODE WHICH ALWAYS SCORES 0
+UNKNOWN_WEATHER = len(WEATHER_SCALE)
+_WEATHER_LOOKUP = np.pad(WEATHER_SCORE_TABLE, ((0, 1), (0, 1)))
+_WEATHER_CODES = {label: code for code, label in enumerate(WEATHER_SCALE)}
+
+
+def encode_weather(labels):
+    """Encodes weather labels as small integers (positions on WEATHER_SCALE, UNKNOWN_WEATHER otherwise)."""
+    labels = pd.Series(labels, dtype=object).astype(str).str.strip().str.lower()
+    return labels.map(_WEATHER_CODES).fillna(UNKNOWN_WEATHER).to_numpy(dtype=np.int8)
+
+
+def weather_preference_code(preferred_weather):
+    return _WEATHER_CODES.get(str(preferred_weather).lower(), UNKNOWN_WEATHER)
+
+
+#TRAVEL WINDOWS OF SEVERAL MONTHS
+#'mean' - AVERAGE POINTS OF THE MONTHS, 'min' - POINTS OF THE WORST MONTH,
+#'all' - AVERAGE POINTS, BUT ONLY IF THE WEATHER IS ACCEPTABLE (MORE THAN 0 POINTS) IN EVERY MONTH
+WINDOW_AGGREGATIONS = ('mean', 'min', 'all')
+
+def travel_window(months):
+    """Month columns of a travel window, given as a list of months or as a range like 'Jun-Aug' (which may wrap, e.g. 'Dec-Feb')."""
+    if isinstance(months, str):
+        bounds = [month.strip()[:3].capitalize() for month in months.split('-')]
+        if len(bounds) == 1:
+            bounds = bounds * 2
+        if len(bounds) != 2 or not all(month in MONTH_COLUMNS for month in bounds):
+            raise PreferenceError(f"Unknown travel window: {months}")
+        start, end = (MONTH_COLUMNS.index(month) for month in bounds)
+        return tuple(MONTH_COLUMNS[(start + offset) % 12] for offset in range((end - start) % 12 + 1))
+    window = tuple(dict.fromkeys(str(month).strip()[:3].capitalize() for month in months))
+    if not window or not all(month in MONTH_COLUMNS for month in window):
+        raise PreferenceError(f"Unknown travel window: {months}")
+    return window
+
+def aggregate_window(scores, aggregation='mean'):
+    """Weather points of a window from the points of its months (the last axis of `scores`)."""
+    if aggregation == 'mean':
+        return scores.mean(axis=-1)
+    if aggregation == 'min':
+        return scores.min(axis=-1)
+    if aggregation == 'all':
+        return np.where((scores > 0).all(axis=-1), scores.mean(axis=-1), 0.0)
+    raise PreferenceError(f"Unknown window aggregation: {aggregation} (expected one of {WINDOW_AGGREGATIONS})")
+
+def window_label(start, length):
+    """'Jul' for one month, 'Jun-Aug' for a window of several."""
+    if length == 1:
+        return MONTH_COLUMNS[start]
+    return f"{MONTH_COLUMNS[start]}-{MONTH_COLUMNS[(start + length - 1) % 12]}"
+
+
+def pack_group_flags(flags):
+    """Packs a (rows x groups) boolean matrix into one integer bitmask per row, bit i is group i."""
+    flags = np.asarray(flags, dtype=np.int64)
+    return flags @ (np.int64(1) << np.arange(flags.shape[1], dtype=np.int64))
+
+
+def group_bitmask(group_indexes):
+    mask = 0
+    for group in group_indexes:
+        mask |= 1 << group
+    return mask
+
+
+class LRUCache:
+    """Small thread-safe least-recently-used cache with hit/miss counters."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def top_k_indices(scores, k):
+    """Positions of the k highest scores, best first, equal scores in order of position (no full sort of all scores)."""
+    scores = np.asarray(scores)
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')[:k]
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    #EVERYTHING AT LEAST AS GOOD AS THE K-TH BEST SCORE, THEN ONLY THESE FEW ARE SORTED
+    kth_best = -np.partition(-scores, k - 1)[k - 1]
+    candidates = np.flatnonzero(scores >= kth_best)
+    return candidates[np.argsort(-scores[candidates], kind='stable')[:k]]
+
+
+#GROUP TRIPS
+#'average' - MEAN SATISFACTION, 'least_misery' - SATISFACTION OF THE LEAST HAPPY TRAVELLER, 'most_pleasure' - OF THE HAPPIEST ONE,
+#'fairness' - THE LIST IS BUILT SO THE LEAST SATISFIED TRAVELLER SO FAR GAINS THE MOST FROM EVERY NEXT DESTINATION
+GROUP_STRATEGIES = ('average', 'least_misery', 'most_pleasure', 'fairness')
+
+def fair_selection(satisfaction, k):
+    """k rows of a (destinations x travellers) satisfaction matrix picked one by one, each maximising the total of the
+    least satisfied traveller over the list so far (ties: the higher average), so nobody is left out of the whole list."""
+    k = min(k, len(satisfaction))
+    average = satisfaction.mean(axis=1)
+    total = np.zeros(satisfaction.shape[1])
+    available = np.ones(len(satisfaction), dtype=bool)
+    picked = []
+    for _ in range(k):
+        least = np.where(available, (total + satisfaction).min(axis=1), -np.inf)
+        candidates = np.flatnonzero(least == least.max())
+        row = candidates[np.argmax(average[candidates])]
+        picked.append(row)
+        available[row] = False
+        total += satisfaction[row]
+    return np.array(picked, dtype=np.intp)
+
+
+def threshold_top_k(matrix, weights, sorted_index, k, extra=None, extra_weights=None, block_size=None):
+    """Top k rows of `matrix @ weights` (+ `extra @ extra_weights`) with the threshold algorithm.
+
+    Rows are read in the order of every weighted factor (`sorted_index` holds each column sorted
+    from best to worst) and scored only when seen. The search stops once the k-th best score is
+    at least the highest score any unseen row could still reach.
+    """
+    n = matrix.shape[0]
+    block_size = block_size or max(k, THRESHOLD_BLOCK_SIZE)
+    active = np.flatnonzero(weights)
+    #UNSORTED EXTRA COLUMNS ONLY GIVE A LOOSE BOUND: THEIR BEST VALUE
+    extra_bound = 0.0
+    if extra is not None and extra.shape[1]:
+        extra_bound = float(np.sum(np.where(extra_weights > 0, extra.max(axis=0, initial=0), extra.min(axis=0, initial=0)) * extra_weights))
+    #A NEGATIVE WEIGHT READS ITS FACTOR FROM THE WORST END
+    orders = [sorted_index[:, j] if weights[j] > 0 else sorted_index[::-1, j] for j in active]
+
+    seen = np.zeros(n, dtype=bool)
+    best_rows = np.empty(0, dtype=np.intp)
+    best_scores = np.empty(0)
+    depth = 0
+    while depth < n:
+        stop = min(depth + block_size, n)
+        candidates = np.unique(np.concatenate([order[depth:stop] for order in orders])) if orders else np.arange(depth, stop)
+        candidates = candidates[~seen[candidates]]
+        seen[candidates] = True
+        scores = matrix[candidates] @ weights
+        if extra is not None and extra.shape[1]:
+            scores += extra[candidates] @ extra_weights
+        best_rows = np.concatenate([best_rows, candidates])
+        best_scores = np.concatenate([best_scores, scores])
+        keep = top_k_indices(best_scores, k)
+        best_rows, best_scores = best_rows[keep], best_scores[keep]
+        depth = stop
+        if not orders:
+            continue
+        threshold = extra_bound + sum(weights[j] * matrix[order[stop - 1], j] for j, order in zip(active, orders))
+        if len(best_scores) >= k and best_scores[-1] >= threshold:
+            break
+    #EQUAL SCORES IN ORDER OF POSITION, AS IN THE FULL RANKING
+    order = np.lexsort((best_rows, -best_scores))
+    return best_rows[order], best_scores[order]
+
+
+def database_version(db_path=DB_PATH):
+    """Identifies one build of the database (modification time and size of the file and of its write-ahead log), None if it does not exist."""
+    try:
+        stat = os.stat(db_path)
+    except OSError:
         return None
+    #AN INCREMENTAL BUILD WHICH COULD NOT BE CHECKPOINTED (A READER WAS ACTIVE) IS ONLY IN THE -wal FILE
+    return (stat.st_mtime_ns, stat.st_size, wal_state(db_path))
 
-    df_attr['attraction_popularity_rank'] = df_attr['No_votes'].rank(method='max', ascending=False)
-    max_rank = df_attr['attraction_popularity_rank'].max()
-    #ASSIGINNG POINTS FOR POPULARITY
-    df_attr['attraction_popularity_score'] = df_attr['attraction_popularity_rank'].apply(lambda r: calculate_attraction_popularity_score(r, max_rank))
-    #GROUPING BY DESTINATION
-    attr_grouped = df_attr.groupby('Destination').sum()
-    df = pd.merge(df_dest, attr_grouped, on='Destination', how='left')
-    
-    #USER CAN EXCLUDE PLACES IF THEY WANT TO 
-    excluded_places = preferences.get('excluded_places', [])
-    if excluded_places:
-        excluded_lower = [place.lower() for place in excluded_places]
-        df = df[~df['Country_x'].str.lower().isin(excluded_lower)]
-        df = df[~df['Destination'].str.lower().isin(excluded_lower)]
-    
-    df['score'] = 0.0
-    
-    #COEFFICIENT POINTS
-    #1. WEATHER (SHOW THE GRAPH IN EXCEL.)
-    #USER CHOOSES ONE MONTH AND PREFERABLE WEATHER, AND THE WEATHER FOR THIS MONTH IS COMPARED WITH THE DATABASE
-    month_col = preferences.get('month', '')[:3].capitalize()
-    if month_col and month_col in df.columns and weights.get('weather', 0) > 0:
-        def score_weather(current_weather):
-            max_allowed_distance = 3
-            weather_value = str(current_weather).strip().lower()
-            user_pref_lower = preferences.get('weather', '').lower()
+
+class RecommendationCache:
+    """Bounded LRU cache of recommendation results, emptied automatically when the database file changes.
+
+    Requests are keyed on a canonical form of the preferences (lowercase, sorted lists) and of the
+    weights, snapped to `weight_step` when they lie on its grid, so the same slider positions always
+    hit the same entry. Results are always scored with the caller's exact weights.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, weight_step=WEIGHT_STEP, db_path=DB_PATH):
+        self.weight_step = weight_step
+        self.db_path = db_path
+        self.invalidations = 0
+        self._entries = LRUCache(maxsize)
+        self._version = database_version(db_path)
+
+    def quantize(self, weights):
+        """Weights on the grid of the weight step snapped to it (0.1 + 0.2 -> 0.3), other weights kept exact."""
+        if not self.weight_step:
+            return dict(weights)
+        quantized = {}
+        for name, weight in weights.items():
+            snapped = round(weight / self.weight_step) * self.weight_step
+            #A WEIGHT OFF THE GRID KEEPS ITS OWN ENTRY, ROUNDING IT WOULD CHANGE ITS RESULTS
+            quantized[name] = round(snapped, 10) if abs(weight - snapped) <= WEIGHT_GRID_TOLERANCE else weight
+        return quantized
+
+    @staticmethod
+    def canonical_preferences(preferences):
+        canonical = []
+        for name, value in sorted(preferences.items()):
+            if name in ('excluded_places', 'known_languages'):
+                value = tuple(sorted(str(item).lower() for item in value))
+            elif name == 'attractions':
+                #ONLY 'EVERYTHING' AS THE FIRST CHOICE IS SPECIAL, OTHERWISE THE ORDER OF GROUPS DOES NOT MATTER
+                value = ('everything',) if (value and str(value[0]).lower() == 'everything') else tuple(sorted(value))
+            elif name == 'month':
+                value = str(value)[:3].capitalize()
+            elif name == 'weather':
+                value = str(value).lower()
+            elif name == 'origin' and isinstance(value, (str, list, tuple)):
+                value = origin_key(value)
+            elif isinstance(value, (list, tuple)):
+                value = tuple(value)
+            canonical.append((name, value))
+        return tuple(canonical)
+
+    def key(self, mode, preferences, weights, top_n):
+        return (mode, self.canonical_preferences(preferences), tuple(sorted(self.quantize(weights).items())), top_n)
+
+    def _check_version(self):
+        version = database_version(self.db_path)
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+            self.invalidations += 1
+
+    def get_or_compute(self, mode, preferences, weights, top_n, compute):
+        """Cached result of `compute(preferences, weights, top_n)`, a copy the caller can modify."""
+        self._check_version()
+        key = self.key(mode, preferences, weights, top_n)
+        result = self._entries.get(key)
+        if result is None:
+            result = compute(preferences, weights, top_n)
+            if result is None:
+                return None
+            self._entries.put(key, result)
+        return result.copy()
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Counters for monitoring the cache."""
+        return {
+            'hits': self._entries.hits, 'misses': self._entries.misses, 'size': len(self._entries),
+            'maxsize': self._entries.maxsize, 'invalidations': self.invalidations,
+        }
+
+
+#ARRAYS OF THE ENGINE KEPT IN THE BINARY SNAPSHOT, EVERYTHING A REQUEST NEEDS (THE PER-ATTRACTION ARRAYS ARE ONLY USED TO BUILD THEM)
+SNAPSHOT_ARRAYS = [
+    'destination_names', 'country_names', '_destination_lower', '_country_lower', '_language_lower', 'latitude', 'longitude', 'weather_codes',
+    '_mask_destination', '_mask_groups', '_mask_rating_x_votes', '_mask_votes', '_mask_count',
+    '_group_counts', '_group_rating_x_votes', '_group_votes', '_raw_factors', '_raw_country_factors', '_country_factor', '_destination_country',
+    '_factor_present', 'factor_matrix',
+    '_similarity_features', '_similarity_centroids', '_similarity_cells',
+]
+
+
+def snapshot_signature():
+    """Changes whenever the code which builds the snapshot arrays changes, so an older snapshot is not used."""
+    definition = repr((STATIC_FACTORS, POPULARITY_RANK_TIERS, ALL_ATTRACTION_GROUPS, WEATHER_SCALE, SNAPSHOT_ARRAYS))
+    return hashlib.sha256(definition.encode()).hexdigest()
+
+
+def read_optional_table(conn, table):
+    """Reads a whole table (or view), or returns None if the database was built without it."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,)).fetchone()
+    return pd.read_sql_query(f"SELECT * FROM {table}", conn) if exists else None
+
+
+class RecommenderEngine:
+    """Holds the destination and attraction tables in memory, so the database is read once and not on every request.
+
+    All factors which do not depend on the user are normalised once into `factor_matrix`
+    (destinations x factors), so a recommendation is one matrix-vector product with the weights.
+    Factors of the countries table are kept and normalised per country, then broadcast to the destinations.
+    With `snapshot=True` the arrays are memory-mapped from the binary snapshot of the database
+    (see snapshot.py) if it belongs to the current database build, and computed from SQLite otherwise.
+    """
+
+    def __init__(self, db_path=DB_PATH, snapshot=True, chunk_rows=ATTRACTION_CHUNK_ROWS):
+        self.db_path = db_path
+        self.chunk_rows = chunk_rows
+        self.version = database_version(db_path)
+        self.snapshot_dir = None
+        self._tables = {}
+        with traced('engine_load', db_path=db_path):
+            if not (snapshot and self._load_snapshot(snapshot_path(db_path))):
+                self._load()
+
+    #THE TABLES ARE READ FROM SQLITE ONLY WHEN SOMETHING NEEDS THEM, AN ENGINE MAPPED FROM A SNAPSHOT NEVER DOES
+    def _table(self, table, optional=False):
+        if table not in self._tables:
+            conn = connect_database(self.db_path)
             try:
-                user_index = WEATHER_SCALE.index(user_pref_lower)
-                current_index = WEATHER_SCALE.index(weather_value)
-                distance = abs(user_index - current_index)
-                if distance > max_allowed_distance: return 0.0
-                else: return 1.0 - (distance / max_allowed_distance)
-            except ValueError: return 0.0
-        weather_score = df[month_col].apply(score_weather)
-        df['score'] += weights['weather'] * weather_score.fillna(0)
-
-    #2. BUDGET: I FOUND DATA WITH THREE DIFFERENT CATEGORIES OF BUDGET: BUDGET, MIDRANGE AND LUXURY, however, the difference between them is not so big
-    #EVERY DESTINATION HAS THREE CATEGORIES 
-    #NORMALISATION (CHEAPEST PLACE = 1, MOST EXPENSIVE = 0)
-    cost_col_map = {'Budget': 'Overall_Daily_Cost_Budget_USD', 'MidRange': 'Overall_Daily_Cost_MidRange_USD', 'Luxury': 'Overall_Daily_Cost_Luxury_USD'}
-    cost_col = cost_col_map.get(preferences.get('budget'))
-    if cost_col and cost_col in df.columns and df[cost_col].max() > 0 and weights.get('budget', 0) > 0:
-        cost_normalized = (df[cost_col] - df[cost_col].min()) / (df[cost_col].max() - df[cost_col].min())
-        budget_score = 1 - cost_normalized
-        df['score'] += weights['budget'] * budget_score.fillna(0)
+                self._tables[table] = read_optional_table(conn, table) if optional else pd.read_sql_query(f"SELECT * FROM {table}", conn)
+            finally:
+                conn.close()
+        return self._tables[table]
 
-    #3,4 - ATTRACTION QUANTITY AND QUALITY
-    #EVERY ATTRACTION HAS SOME CATEGORIES ASSIGNED TO THEM, AND ATTRACTION QUANTITY COUNTS HOW MANY OF THESE CATEGORIES ALL 30 OF BEST ATTRACTIONS HAVE IN THE DESTINATION
-    #ALL ATTRACTIONS ALSO RECEIVE AN AVERAGE SCORE, WHICH IS THEN COMPUTED FOR ALL 30 OF THEM USING WEIGHTED AVERAGE, WITH NUMBER OF VOTES AS A WEIGHT
-    user_attractions = preferences.get('attractions', [])
-    #USER CAN CHOOSE EVERYTHING
-    attractions_to_score = ALL_ATTRACTION_GROUPS if (user_attractions and user_attractions[0].lower() == 'everything') else user_attractions
-    
-    if attractions_to_score:
-        valid_attractions = [attr for attr in attractions_to_score if attr in df.columns]
-        if valid_attractions:
-            if weights.get('attractions_quantity', 0) > 0:
-                quantity_score = df[valid_attractions].sum(axis=1)
-                if quantity_score.max() > 0:
-                    quantity_score_normalized = quantity_score / quantity_score.max()
-                    df['score'] += weights['attractions_quantity'] * quantity_score_normalized.fillna(0)
-
-            if weights.get('attractions_quality', 0) > 0:
-                mask = df_attr[valid_attractions].sum(axis=1) > 0
-                matching_attractions = df_attr[mask]
-                if not matching_attractions.empty:
-                    matching_attractions.loc[:, 'rating_x_votes'] = matching_attractions['Avg_rating'] * matching_attractions['No_votes']
-                    quality_grouped = matching_attractions.groupby('Destination').agg(rating_x_votes_sum=('rating_x_votes', 'sum'), no_votes_sum=('No_votes', 'sum'))
-                    quality_grouped['quality_score'] = quality_grouped['rating_x_votes_sum'] / quality_grouped['no_votes_sum'].replace(0, 1)
-                    df = pd.merge(df, quality_grouped[['quality_score']], on='Destination', how='left')
-                    if 'quality_score' in df.columns and df['quality_score'].max() > 0:
-                        quality_score_normalized = (df['quality_score'] - df['quality_score'].min()) / (df['quality_score'].max() - df['quality_score'].min())
-                        df['score'] += weights['attractions_quality'] * quality_score_normalized.fillna(0)
-    
-    #5. DISTANCE FROM LODZ
-    #CLOSEST LOCATION TO LODZ RECEIVES 100% OF POINTS (HERE, IT IS WARSAW), AND THE FURTHEST RECEIVES 0 POINTS, INCLUDING THESE, WHICH ARE ISLANDS (CAR TRAVEL)
-    dist_col = 'Distance_from_Lodz_km_road'
-    if dist_col in df.columns and weights.get('distance', 0) > 0:
-        distance_data = df[dist_col].copy()
-        nan_indices = distance_data.isna()
-        max_dist = distance_data[~nan_indices].max()
-        min_dist = distance_data[~nan_indices].min()
-        if max_dist > min_dist:
-            normalized_distance = (distance_data - min_dist) / (max_dist - min_dist)
-            distance_score = (1 - normalized_distance) ** 2
+    def _attraction_chunks(self, columns):
+        """Some columns of the attractions table, `chunk_rows` rows at a time, in table order."""
+        conn = connect_database(self.db_path)
+        try:
+            quoted = ', '.join(f'"{column}"' for column in columns)
+            yield from pd.read_sql_query(f"SELECT {quoted} FROM attractions ORDER BY rowid", conn, chunksize=self.chunk_rows)
+        finally:
+            conn.close()
+
+    @property
+    def destinations(self):
+        return self._table('destinations')
+
+    @property
+    def countries(self):
+        return self._table('countries', optional=True)
+
+    @property
+    def destination_details(self):
+        """Destinations with the statistics of their country in one table, as older databases stored them."""
+        details = self._table('destination_details', optional=True)
+        return self.destinations if details is None else details
+
+    @property
+    def attractions(self):
+        return self._table('attractions')
+
+    @property
+    def attraction_stats(self):
+        return self._table('destination_attraction_stats', optional=True)
+
+    def _load_snapshot(self, directory):
+        """Maps the arrays of a matching snapshot, False if there is none for this database build and these factors."""
+        with stage('snapshot_map'):
+            snapshot = load_snapshot(directory, self.db_path)
+        if snapshot is None:
+            return False
+        arrays, metadata = snapshot
+        if metadata.get('signature') != snapshot_signature():
+            return False
+        for name in SNAPSHOT_ARRAYS:
+            setattr(self, name, arrays.get(name))
+        self.weather_months = metadata['weather_months']
+        self.attraction_groups = metadata['attraction_groups']
+        self.factor_names = metadata['factor_names']
+        self._similarity_groups = metadata.get('similarity_groups')
+        self._similarity_index = None
+        self._factor_index = {name: i for i, name in enumerate(self.factor_names)}
+        self._set_factor_properties()
+        self._set_geography()
+        self._quality_cache = LRUCache(QUALITY_CACHE_SIZE)
+        self._sorted_factor_index = None
+        self.snapshot_dir = directory
+        return True
+
+    def save_snapshot(self, directory=None):
+        """Writes the arrays of this engine as a binary snapshot of its database (database_creator.py does it after every build)."""
+        #THE SIMILARITY INDEX IS BUILT HERE ONCE, SO ENGINES MAPPING THE SNAPSHOT NEVER BUILD IT
+        self.similarity_index()
+        metadata = {
+            'signature': snapshot_signature(), 'weather_months': self.weather_months,
+            'attraction_groups': self.attraction_groups, 'factor_names': self.factor_names,
+            'similarity_groups': self._similarity_groups,
+        }
+        return write_snapshot(directory or snapshot_path(self.db_path), {name: getattr(self, name) for name in SNAPSHOT_ARRAYS}, metadata, self.db_path)
+
+    def _set_geography(self):
+        self._unit_vectors = unit_vectors(self.latitude, self.longitude)
+        self._origin_cache = LRUCache(ORIGIN_CACHE_SIZE)
+        self._spatial_index = None
+
+    def _attraction_arrays(self, chunks, destination_index, key):
+        """(destination row, group flags, votes, rating x votes) of the attractions of known destinations, for every chunk of the attractions table."""
+        for df_attr in chunks:
+            attr_destination = destination_index.get_indexer(df_attr[key])
+            known = attr_destination >= 0
+            votes = df_attr.loc[known, 'No_votes'].to_numpy(dtype=float)
+            yield (attr_destination[known], df_attr.loc[known, self.attraction_groups].to_numpy(dtype=bool),
+                   votes, np.nan_to_num(df_attr.loc[known, 'Avg_rating'].to_numpy(dtype=float) * votes))
+
+    def _set_attraction_masks(self, attraction_arrays):
+        """Rating x votes, votes and number of the attractions of every (destination, group bitmask).
+
+        The group flags of every attraction are packed into one bitmask, so only three numbers per
+        attraction are kept from every chunk until all of them are summed up.
+        """
+        n_groups = len(self.attraction_groups)
+        parts = [(attr_destination.astype(np.int64) << n_groups | pack_group_flags(attr_groups), attr_rating_x_votes, attr_votes)
+                 for attr_destination, attr_groups, attr_votes, attr_rating_x_votes in attraction_arrays]
+        attr_combined, attr_rating_x_votes, attr_votes = (np.concatenate(column) for column in zip(*parts or [(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))]))
+        combined, combined_index = np.unique(attr_combined, return_inverse=True)
+        self._mask_destination = (combined >> n_groups).astype(np.intp)
+        self._mask_groups = combined & ((1 << n_groups) - 1)
+        self._mask_rating_x_votes = np.bincount(combined_index, weights=attr_rating_x_votes, minlength=len(combined))
+        self._mask_votes = np.bincount(combined_index, weights=attr_votes, minlength=len(combined))
+        self._mask_count = np.bincount(combined_index, minlength=len(combined)).astype(float)
+        self._quality_cache = LRUCache(QUALITY_CACHE_SIZE)
+
+    def _set_factor_properties(self):
+        """How every static factor is normalised, taken from the registry."""
+        self._higher_is_better = np.array([factor.higher_is_better for factor in STATIC_FACTORS])
+        self._equal_value = np.array([factor.equal for factor in STATIC_FACTORS])
+        self._squared = np.array([factor.transform == 'squared' for factor in STATIC_FACTORS])
+        self._absolute = np.array([factor.transform == 'cuisine' for factor in STATIC_FACTORS])
+        self._all_factors = np.arange(len(STATIC_FACTORS))
+        #COLUMN OF EVERY STATIC FACTOR IN _raw_factors, OR IN _raw_country_factors FOR THE COUNTRY-LEVEL ONES
+        self._raw_column = np.zeros(len(STATIC_FACTORS), dtype=np.intp)
+        self._raw_column[~self._country_factor] = np.arange((~self._country_factor).sum())
+        self._raw_column[self._country_factor] = np.arange(self._country_factor.sum())
+
+    def _load(self):
+        with stage('sqlite_load'):
+            df_dest = self.destinations
+            df_country = self.countries
+            stats = self.attraction_stats
+        n = len(df_dest)
+        self.destination_names = df_dest['Destination'].to_numpy(dtype=object)
+        self.country_names = df_dest['Country'].to_numpy(dtype=object)
+        self._destination_lower = df_dest['Destination'].str.lower().to_numpy(dtype=object)
+        self._country_lower = df_dest['Country'].str.lower().to_numpy(dtype=object)
+        self._language_lower = df_dest['Language'].fillna('').astype(str).str.lower().to_numpy(dtype=object) if 'Language' in df_dest.columns else None
+        #COORDINATES FOR DISTANCES FROM ANY ORIGIN
+        self.latitude, self.longitude = [pd.to_numeric(df_dest[col], errors='coerce').to_numpy(dtype=float) if col in df_dest.columns else np.full(n, np.nan) for col in ('Latitude', 'Longitude')]
+
+        #MONTHLY WEATHER ENCODED ONCE AS A (DESTINATIONS x 12) MATRIX OF WEATHER_SCALE POSITIONS
+        with stage('weather_encoding', rows=n):
+            self.weather_months = [month_col for month_col in MONTH_COLUMNS if month_col in df_dest.columns]
+            self.weather_codes = np.full((n, len(MONTH_COLUMNS)), UNKNOWN_WEATHER, dtype=np.int8)
+            for month_number, month_col in enumerate(MONTH_COLUMNS):
+                if month_col in df_dest.columns:
+                    self.weather_codes[:, month_number] = encode_weather(df_dest[month_col])
+
+        #EVERY ATTRACTION POINTS TO ITS DESTINATION ROW, ATTRACTIONS OF UNKNOWN DESTINATIONS ARE LEFT OUT
+        with stage('attraction_groups'):
+            conn = connect_database(self.db_path)
+            try:
+                attraction_columns = [row[1] for row in conn.execute('PRAGMA table_info("attractions")')]
+            finally:
+                conn.close()
+            #BY destination_id IN DATABASES WHICH HAVE IT, BY NAME IN OLDER ONES
+            key = 'destination_id' if 'destination_id' in df_dest.columns and 'destination_id' in attraction_columns else 'Destination'
+            self.attraction_groups = [col for col in ALL_ATTRACTION_GROUPS + ['Top_200_Popular'] if col in attraction_columns]
+            destination_index = pd.Index(df_dest[key])
+            if stats is not None:
+                #WITH THE AGGREGATES ONLY THE MASK SUMS NEED THE ATTRACTIONS, SO A FEW COLUMNS ARE READ A CHUNK AT A TIME
+                self._set_attraction_masks(self._attraction_arrays(self._attraction_chunks([key, 'No_votes', 'Avg_rating'] + self.attraction_groups), destination_index, key))
+            else:
+                df_attr = self.attractions
+                attr_destination, attr_groups, attr_votes, attr_rating_x_votes = attraction_arrays = next(self._attraction_arrays([df_attr], destination_index, key))
+                self._set_attraction_masks([attraction_arrays])
+
+        #PER-DESTINATION AGGREGATES ARE WRITTEN BY database_creator.py, OLDER DATABASES WITHOUT THEM ARE AGGREGATED HERE
+        with stage('attraction_aggregates', rows=n):
+            if stats is not None:
+                key = 'destination_id' if 'destination_id' in df_dest.columns and 'destination_id' in stats.columns else 'Destination'
+                stats_rows = pd.Index(stats[key]).get_indexer(df_dest[key])
+                has_stats = stats_rows >= 0
+                def per_destination(columns):
+                    values = np.zeros((n, len(columns)))
+                    values[has_stats] = stats[columns].to_numpy(dtype=float)[stats_rows[has_stats]]
+                    return values
+                #HOW MANY ATTRACTIONS OF EVERY GROUP EACH DESTINATION HAS
+                self._group_counts = per_destination(self.attraction_groups)
+                popularity_sum = per_destination(['Attraction_Popularity_Score'])[:, 0]
+                #RATING X VOTES AND VOTES OF EVERY SINGLE GROUP
+                self._group_rating_x_votes = per_destination([group + '_Rating_x_Votes_Sum' for group in self.attraction_groups])
+                self._group_votes = per_destination([group + '_Votes_Sum' for group in self.attraction_groups])
+            else:
+                #ATTRACTION POPULARITY DOES NOT DEPEND ON THE USER, SO IT IS RANKED ONLY ONCE
+                popularity_rank = df_attr['No_votes'].rank(method='max', ascending=False)
+                popularity_scores = attraction_popularity_scores(popularity_rank, popularity_rank.max())[destination_index.get_indexer(df_attr[key]) >= 0]
+                self._group_counts = np.zeros((n, len(self.attraction_groups)))
+                np.add.at(self._group_counts, attr_destination, attr_groups)
+                popularity_sum = np.bincount(attr_destination, weights=popularity_scores, minlength=n)
+                self._group_rating_x_votes = self._group_votes = None
+
+        #COUNTRY-LEVEL VALUES ARE KEPT ONCE PER COUNTRY AND EVERY DESTINATION POINTS TO ITS COUNTRY ROW,
+        #THE LAST ROW (UNKNOWN VALUES) IS FOR DESTINATIONS WHOSE COUNTRY HAS NO STATISTICS
+        with stage('countries', rows=n):
+            if df_country is None or 'country_id' not in df_dest.columns:
+                #OLDER DATABASES HAVE THE COUNTRY COLUMNS ON EVERY DESTINATION
+                df_country = pd.DataFrame({'country_id': []})
+            self._destination_country = pd.Index(df_country['country_id']).get_indexer(df_dest['country_id']) if len(df_country) else np.zeros(n, dtype=np.intp)
+            self._destination_country[self._destination_country < 0] = len(df_country)
+            self._country_factor = np.array([factor.source in df_country.columns and factor.source not in df_dest.columns for factor in STATIC_FACTORS])
+
+        #RAW VALUES OF THE STATIC FACTORS, NORMALISED FOR THE WHOLE CATALOG
+        with stage('factor_matrix', rows=n):
+            self.factor_names = [factor.name for factor in STATIC_FACTORS]
+            self._factor_index = {name: i for i, name in enumerate(self.factor_names)}
+            self._set_factor_properties()
+            self._raw_factors = np.full((n, (~self._country_factor).sum()), np.nan)
+            self._raw_country_factors = np.full((len(df_country) + 1, self._country_factor.sum()), np.nan)
+            for i, factor in enumerate(STATIC_FACTORS):
+                raw = self._raw_country_factors if self._country_factor[i] else self._raw_factors
+                if factor.source == 'attraction_popularity_score': values = popularity_sum
+                elif factor.source in df_dest.columns or self._country_factor[i]:
+                    source = pd.concat([df_country[factor.source], pd.Series([np.nan])], ignore_index=True) if self._country_factor[i] else df_dest[factor.source]
+                    if factor.transform == 'cuisine': values = source.apply(calculate_cuisine_score).to_numpy(dtype=float)
+                    else: values = pd.to_numeric(source, errors='coerce').to_numpy(dtype=float)
+                else: continue
+                raw[:, self._raw_column[i]] = np.nan_to_num(values) if factor.nan == 'fill_before' else values
+            self._factor_present = np.array([factor.source == 'attraction_popularity_score' or factor.source in df_dest.columns for factor in STATIC_FACTORS]) | self._country_factor
+            self._set_geography()
+            self.factor_matrix = self._normalize_rows(None, self._all_factors)
+            self._sorted_factor_index = None
+        #BUILT ON FIRST USE (OR BY save_snapshot)
+        self._similarity_features = self._similarity_centroids = self._similarity_cells = self._similarity_groups = None
+        self._similarity_index = None
+
+    def _normalize_factors(self, raw, columns):
+        """Points of the static factors `columns` for the rows of `raw` (already holding only these columns), all in one pass."""
+        normalized = min_max_normalize(raw, self._higher_is_better[columns], self._equal_value[columns])
+        np.square(normalized, out=normalized, where=self._squared[columns])
+        #CUISINE ALREADY HAS ITS OWN CURVE AND IS NOT NORMALISED
+        absolute = self._absolute[columns]
+        normalized[:, absolute] = raw[:, absolute]
+        #DESTINATIONS WITHOUT DATA (E.G. ISLANDS HAVE NO ROAD DISTANCE) RECEIVE 0 POINTS
+        normalized[np.isnan(raw) | np.isnan(normalized)] = 0.0
+        normalized[:, ~self._factor_present[columns]] = 0.0
+        return normalized
+
+    def _normalize_rows(self, rows, columns):
+        """Points of the static factors `columns` for the destinations `rows` (None: all of them), normalised over these destinations.
+
+        Country-level factors are normalised once per country, over the countries of these destinations
+        (which have the same lowest and highest values), and broadcast to the destinations.
+        """
+        columns = np.asarray(columns)
+        country = self._country_factor[columns]
+        countries = self._destination_country if rows is None else self._destination_country[rows]
+        normalized = np.empty((len(countries), len(columns)))
+        local = columns[~country]
+        raw = self._raw_factors[:, self._raw_column[local]] if rows is None else self._raw_factors[np.ix_(rows, self._raw_column[local])]
+        normalized[:, ~country] = self._normalize_factors(raw, local)
+        if country.any():
+            shared = columns[country]
+            present = np.bincount(countries, minlength=len(self._raw_country_factors)) > 0
+            per_country = np.zeros((len(self._raw_country_factors), len(shared)))
+            per_country[present] = self._normalize_factors(self._raw_country_factors[np.ix_(present, self._raw_column[shared])], shared)
+            normalized[:, country] = per_country[countries]
+        return normalized
+
+    def _raw_factor_values(self, columns):
+        """Raw values of the static factors `columns` for every destination, the country-level ones taken from its country."""
+        values = np.empty((len(self._destination_country), len(columns)))
+        for j, column in enumerate(columns):
+            if self._country_factor[column]:
+                values[:, j] = self._raw_country_factors[self._destination_country, self._raw_column[column]]
+            else:
+                values[:, j] = self._raw_factors[:, self._raw_column[column]]
+        return values
+
+    def _selected_rows(self, preferences):
+        """Row numbers of destinations left after the user's exclusions."""
+        excluded_places = preferences.get('excluded_places', [])
+        if not excluded_places:
+            return None
+        excluded_lower = [place.lower() for place in excluded_places]
+        excluded = np.isin(self._country_lower, excluded_lower) | np.isin(self._destination_lower, excluded_lower)
+        return np.flatnonzero(~excluded)
+
+    def _factor_rows(self, rows, columns=None):
+        """Static factor columns (all by default) for the selected rows, normalised again only if some destinations were excluded."""
+        columns = self._all_factors if columns is None else columns
+        if rows is None:
+            return self.factor_matrix if columns is self._all_factors else self.factor_matrix[:, columns]
+        return self._normalize_rows(rows, columns)
+
+    def compile_factors(self, mode, profiles):
+        """Compiles the factors of `mode` which any of the (preferences, weights) profiles weights into one scoring plan.
+
+        Returns the static factors (column positions in the factor matrix), the preference
+        dependent factors (registry entries) and the weights (static + dependent factors x profiles).
+        """
+        static, dependent, weight_rows = [], [], []
+        for factor in mode_factors(mode):
+            factor_weights = [factor_weight(factor, preferences, weights) for preferences, weights in profiles]
+            if not any(factor_weights):
+                continue
+            if factor.transform in STATIC_TRANSFORMS:
+                static.append(self._factor_index[factor.name])
+                weight_rows.insert(len(static) - 1, factor_weights)
+            else:
+                dependent.append(factor)
+                weight_rows.append(factor_weights)
+        return np.array(static, dtype=np.intp), dependent, np.array(weight_rows, dtype=float).reshape(len(weight_rows), len(profiles))
+
+    def _language_scores(self, preferences, rows):
+        user_languages = preferences.get('known_languages', [])
+        if self._language_lower is None or not user_languages:
+            return None
+        languages = self._language_lower if rows is None else self._language_lower[rows]
+        return np.isin(languages, [lang.lower() for lang in user_languages]).astype(float)
+
+    def monthly_weather_scores(self, preferred_weather, cache=None):
+        """Weather points of every destination in every month (destinations x 12) for one preferred weather."""
+        code = weather_preference_code(preferred_weather)
+        if cache is not None and code in cache:
+            return cache[code]
+        scores = _WEATHER_LOOKUP[code][self.weather_codes]
+        if cache is not None:
+            cache[code] = scores
+        return scores
+
+    #WHEN TO GO: EVERY WINDOW OF THE YEAR SCORED AT ONCE FROM THE (DESTINATIONS x 12) WEATHER MATRIX
+    def window_weather_scores(self, preferred_weather, length=1, aggregation='mean', cache=None):
+        """Weather points of the `length`-month window starting in every month (destinations x 12)."""
+        if not 1 <= length <= 12:
+            raise PreferenceError(f"A travel window has 1 to 12 months, not {length}")
+        weather = self.monthly_weather_scores(preferred_weather, cache)
+        #(DESTINATIONS x 12 STARTS x LENGTH) POINTS, WINDOWS WRAP AROUND THE NEW YEAR
+        starts = (np.arange(12)[:, None] + np.arange(length)[None, :]) % 12
+        return aggregate_window(weather[:, starts], aggregation)
+
+    def weather_calendar(self, preferred_weather, length=1, aggregation='mean'):
+        """Calendar of every destination: one column of weather points per window ('Jan', ... or 'Jan-Mar', ...)."""
+        scores = self.window_weather_scores(preferred_weather, length, aggregation)
+        calendar = pd.DataFrame(scores, columns=[window_label(start, length) for start in range(12)])
+        calendar.insert(0, 'Destination', self.destination_names)
+        calendar.insert(1, 'Country', self.country_names)
+        return calendar
+
+    def best_travel_months(self, preferred_weather, length=1, aggregation='mean'):
+        """Best window(s) of every destination for the preferred weather, ties included, none if no window scores any points."""
+        scores = self.window_weather_scores(preferred_weather, length, aggregation)
+        best_score = scores.max(axis=1)
+        best = (scores == best_score[:, None]) & (best_score[:, None] > 0)
+        labels = np.array([window_label(start, length) for start in range(12)], dtype=object)
+        return pd.DataFrame({
+            'Destination': self.destination_names, 'Country': self.country_names,
+            'best_months': [list(labels[row]) for row in best], 'score': best_score,
+        })
+
+    def _attraction_groups_to_score(self, preferences):
+        user_attractions = preferences.get('attractions', [])
+        #USER CAN CHOOSE EVERYTHING
+        attractions_to_score = ALL_ATTRACTION_GROUPS if (user_attractions and user_attractions[0].lower() == 'everything') else user_attractions
+        return [self.attraction_groups.index(attr) for attr in attractions_to_score if attr in self.attraction_groups]
+
+    def _quality_sums(self, group_indexes):
+        """Per-destination (rating x votes, votes, attractions) sums over the attractions in any of the groups, cached by group set."""
+        key = frozenset(group_indexes)
+        sums = self._quality_cache.get(key)
+        if sums is not None:
+            return sums
+        if len(key) == 1 and self._group_votes is not None:
+            #ONE GROUP: THE SUMS ARE ALREADY IN THE AGGREGATES TABLE
+            group = group_indexes[0]
+            sums = (self._group_rating_x_votes[:, group], self._group_votes[:, group], self._group_counts[:, group])
         else:
-            distance_score = pd.Series(0.5, index=distance_data.index)
-        distance_score[nan_indices] = 0.0
-        df['score'] += weights['distance'] * distance_score.fillna(0)
+            #AN ATTRACTION COUNTS IF IT BELONGS TO ANY OF THE CHOSEN GROUPS
+            matching = (self._mask_groups & group_bitmask(group_indexes)) != 0
+            n = len(self.destination_names)
+            destination = self._mask_destination[matching]
+            sums = (
+                np.bincount(destination, weights=self._mask_rating_x_votes[matching], minlength=n),
+                np.bincount(destination, weights=self._mask_votes[matching], minlength=n),
+                np.bincount(destination, weights=self._mask_count[matching], minlength=n),
+            )
+        self._quality_cache.put(key, sums)
+        return sums
 
-    df.fillna(0, inplace=True)
+    def _quality_scores(self, group_indexes, rows):
+        """Vote-weighted average rating of the attractions matching any of the chosen groups, NaN if a destination has none."""
+        rating_x_votes_sum, votes_sum, count = self._quality_sums(group_indexes)
+        if not count.any():
+            return None
+        quality = rating_x_votes_sum / np.where(votes_sum == 0, 1, votes_sum)
+        quality[count == 0] = np.nan
+        return quality if rows is None else quality[rows]
 
-    #6. SAFETY INDEX NORMALISED
-    if 'Safety_Index' in df.columns and weights.get('safety', 0) > 0:
-        safety_normalized = (df['Safety_Index'] - df['Safety_Index'].min()) / (df['Safety_Index'].max() - df['Safety_Index'].min())
-        df['score'] += weights['safety'] * safety_normalized
-        
-    #7. POPULARITY OF ALL ATTRACTIONS SUMMED UP, NORMALISED AND RANKED
-    pop_col_name = 'attraction_popularity_score'
-    if pop_col_name in df.columns and df[pop_col_name].max() > 0 and weights.get('attractions_popularity', 0) != 0:
-        pop_score_normalized = (df[pop_col_name] - df[pop_col_name].min()) / (df[pop_col_name].max() - df[pop_col_name].min())
-        df['score'] += weights['attractions_popularity'] * pop_score_normalized
-
-    #8. ENGLISH LEVEL (NORMALISED AS WELL)
-    epi_col = 'English_EPI_Score'
-    if epi_col in df.columns and weights.get('english_level', 0) > 0:
-        if df[epi_col].max() > df[epi_col].min():
-            epi_normalized = (df[epi_col] - df[epi_col].min()) / (df[epi_col].max() - df[epi_col].min())
-        else: epi_normalized = 0.5
-        df['score'] += weights['english_level'] * epi_normalized.fillna(0)
-        
-    #9. ADDITIONAL POINTS IF USER WANTS TO "USE" THE LANGUAGE THEY KNOW (EXCLUDING ENGLISH)
-    user_languages = preferences.get('known_languages', [])
-    if 'Language' in df.columns and user_languages and weights.get('known_languages', 0) > 0:
-        df['score'] += weights['known_languages'] * df['Language'].apply(lambda lang: 1.0 if str(lang).lower() in [l.lower() for l in user_languages] else 0.0)
+    #TRANSFORMS OF THE FACTORS WHICH DEPEND ON THE PREFERENCES, EACH RETURNS ONE COLUMN OF POINTS OR NONE FOR 0 POINTS EVERYWHERE
+    def _weather_month_column(self, factor, preferences, rows, cache):
+        #1. WEATHER: USER CHOOSES ONE MONTH AND PREFERABLE WEATHER, AND THE WEATHER FOR THIS MONTH IS COMPARED WITH THE DATABASE
+        month_col = preferences.get('month', '')[:3].capitalize()
+        if month_col not in self.weather_months:
+            return None
+        weather = self.monthly_weather_scores(preferences.get('weather', ''), cache)[:, MONTH_COLUMNS.index(month_col)]
+        return weather if rows is None else weather[rows]
+
+    def _weather_window_column(self, factor, preferences, rows, cache):
+        #1. WEATHER OVER A TRAVEL WINDOW (E.G. JUN-AUG), THE POINTS OF ITS MONTHS ARE AGGREGATED INTO ONE
+        months = [MONTH_COLUMNS.index(month) for month in travel_window(preferences['months'])]
+        weather = self.monthly_weather_scores(preferences.get('weather', ''), cache)
+        if rows is not None:
+            weather = weather[rows]
+        return aggregate_window(weather[:, months], preferences.get('window_aggregation', 'mean'))
+
+    def _weather_year_column(self, factor, preferences, rows, cache):
+        #1. WEATHER, BUT HERE, POINTS ARE SUMMED FOR THE WHOLE YEAR
+        if 'weather' not in preferences:
+            return None
+        #MONTHS MISSING FROM THE DATABASE ARE ENCODED AS UNKNOWN, SO THEY ADD 0 POINTS
+        total_weather_score = self.monthly_weather_scores(preferences['weather'], cache).sum(axis=1)
+        if rows is not None:
+            total_weather_score = total_weather_score[rows]
+        if np.max(total_weather_score, initial=0) > 0:
+            return np.nan_to_num(min_max_normalize(total_weather_score, factor.higher_is_better, factor.equal))
+        return None
+
+    #3,4 - ATTRACTION QUANTITY AND QUALITY
+    def _attraction_count_column(self, factor, preferences, rows, cache):
+        #QUANTITY COUNTS HOW MANY ATTRACTIONS OF THE CHOSEN GROUPS THE DESTINATION HAS
+        group_indexes = self._attraction_groups_to_score(preferences)
+        if not group_indexes:
+            return None
+        counts = self._group_counts if rows is None else self._group_counts[rows]
+        quantity = counts[:, group_indexes].sum(axis=1)
+        if len(quantity) and quantity.max() > 0:
+            return quantity / quantity.max()
+        return None
+
+    def _attraction_quality_column(self, factor, preferences, rows, cache):
+        #QUALITY IS THE AVERAGE RATING WEIGHTED BY NUMBER OF VOTES
+        group_indexes = self._attraction_groups_to_score(preferences)
+        if not group_indexes:
+            return None
+        quality = self._quality_scores(group_indexes, rows)
+        if quality is not None and np.nanmax(quality, initial=0) > 0:
+            return np.nan_to_num(min_max_normalize(quality, factor.higher_is_better, factor.equal))
+        return None
+
+    def _language_column(self, factor, preferences, rows, cache):
+        #9. ADDITIONAL POINTS IF USER WANTS TO "USE" THE LANGUAGE THEY KNOW (EXCLUDING ENGLISH)
+        return self._language_scores(preferences, rows)
+
+    def _origin_distance_column(self, factor, preferences, rows, cache):
+        #2. DISTANCE FROM THE USER'S OWN ORIGIN, SCORED LIKE THE ROAD DISTANCE FROM LODZ
+        distances = self.origin_distances(preferences['origin'])
+        if rows is not None:
+            distances = distances[rows]
+        normalized = min_max_normalize(distances, factor.higher_is_better, factor.equal) ** 2
+        #DESTINATIONS WITHOUT COORDINATES RECEIVE 0 POINTS
+        return np.nan_to_num(normalized)
+
+    def _preference_column(self, factor, preferences, rows, cache):
+        """Column of one preference-dependent factor, None if no destination gets points."""
+        transforms = {
+            'weather_month': self._weather_month_column, 'weather_year': self._weather_year_column, 'weather_window': self._weather_window_column,
+            'attraction_count': self._attraction_count_column, 'attraction_quality': self._attraction_quality_column,
+            'language': self._language_column, 'origin_distance': self._origin_distance_column,
+        }
+        with stage(factor.name):
+            return transforms[factor.transform](factor, preferences, rows, cache)
+
+    def _preference_columns(self, mode, preferences, rows, needed, cache):
+        """Columns of the factors of `mode` named in `needed` which depend on the preferences (weather, attractions, languages)."""
+        columns = {}
+        for factor in mode_factors(mode):
+            if factor.transform in STATIC_TRANSFORMS or factor.name not in needed:
+                continue
+            column = self._preference_column(factor, preferences, rows, cache)
+            if column is not None:
+                columns[factor.name] = column
+        return columns
+
+    #DISTANCES FROM ANY ORIGIN: A CITY FROM ORIGIN_CITIES, A DESTINATION OF THE CATALOG OR (LATITUDE, LONGITUDE)
+    def resolve_origin(self, origin):
+        """(latitude, longitude) of an origin, PreferenceError if it is unknown."""
+        if isinstance(origin, str):
+            name = origin.strip().lower()
+            for city, coordinates in ORIGIN_CITIES.items():
+                if city.lower() == name:
+                    return coordinates
+            row = np.flatnonzero(self._destination_lower == name)
+            if len(row) and not np.isnan(self.latitude[row[0]]):
+                return (float(self.latitude[row[0]]), float(self.longitude[row[0]]))
+            raise PreferenceError(f"Unknown origin: {origin}")
+        try:
+            latitude, longitude = (float(coordinate) for coordinate in origin)
+        except (TypeError, ValueError):
+            raise PreferenceError(f"Origin must be a city name or (latitude, longitude): {origin!r}")
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise PreferenceError(f"Origin coordinates out of range: {origin!r}")
+        return (latitude, longitude)
+
+    def origin_distances(self, origin):
+        """Great-circle distances in km from the origin to every destination, cached for the most recent origins."""
+        key = origin_key(origin)
+        distances = self._origin_cache.get(key)
+        if distances is None:
+            distances = great_circle_km(self._unit_vectors, *self.resolve_origin(origin))
+            self._origin_cache.put(key, distances)
+        return distances
+
+    def spatial_index(self):
+        """Grid index over the destination coordinates, built on first use."""
+        if self._spatial_index is None:
+            self._spatial_index = SpatialGrid(self.latitude, self.longitude)
+        return self._spatial_index
+
+    def _distance_results(self, rows, distances):
+        return pd.DataFrame({'Destination': self.destination_names[rows], 'Country': self.country_names[rows], 'distance_km': distances}, index=rows)
+
+    def destinations_within(self, origin, radius_km):
+        """Destinations at most `radius_km` (great-circle) from the origin, nearest first."""
+        return self._distance_results(*self.spatial_index().within(*self.resolve_origin(origin), radius_km))
+
+    def nearest_destinations(self, origin, k=10):
+        """The k destinations nearest to the origin."""
+        return self._distance_results(*self.spatial_index().nearest(*self.resolve_origin(origin), k))
+
+    def sorted_factor_index(self):
+        """Every column of the factor matrix sorted from the best to the worst destination, built on first use."""
+        if self._sorted_factor_index is None:
+            self._sorted_factor_index = np.argsort(-self.factor_matrix, axis=0, kind='stable')
+        return self._sorted_factor_index
+
+    def _dependent_columns(self, dependent, group, dependent_weights, rows, cache):
+        """(destinations x distinct preferences) columns of every dependent factor and the column each profile uses, column 0 gives no points."""
+        n_rows = len(self.destination_names) if rows is None else len(rows)
+        dependent_columns = []
+        for i, factor in enumerate(dependent):
+            variants = {}
+            columns = [np.zeros(n_rows)]
+            variant = np.zeros(len(group), dtype=np.intp)
+            for j, (preferences, _) in enumerate(group):
+                if dependent_weights[i, j] == 0:
+                    continue
+                key = preference_key(factor, preferences)
+                if key not in variants:
+                    column = self._preference_column(factor, preferences, rows, cache)
+                    variants[key] = 0 if column is None else len(columns)
+                    if column is not None:
+                        columns.append(column)
+                variant[j] = variants[key]
+            dependent_columns.append((np.column_stack(columns), variant))
+        return dependent_columns
+
+    def _score_profiles(self, rows, static, weights, dependent_columns):
+        """(destinations x profiles) scores: one product for the static factors plus the chosen column of every dependent factor."""
+        n_static = len(static)
+        with stage('normalization', rows=None if rows is None else len(rows)):
+            factors = self._factor_rows(rows, static)
+        with stage('scoring', rows=len(factors)):
+            scores = factors @ weights[:n_static]
+            for i, (matrix, variant) in enumerate(dependent_columns):
+                scores += matrix[:, variant] * weights[n_static + i]
+        return scores
+
+    def _recommend_batch(self, mode, profiles, top_n, method='partition'):
+        """Scores many (preferences, weights) profiles together, profiles with the same exclusions share one score matrix.
+
+        The static factors of a group are one (destinations x factors) @ (factors x profiles) product.
+        Every preference-dependent factor is computed once per distinct preference (e.g. once per
+        month and weather) and added to the profiles choosing it with their weights.
+        `method` is 'partition' (score everything, partial top-k selection) or 'threshold' (threshold
+        algorithm over the sorted factor columns, skipping destinations which cannot reach the top).
+        """
+        if method not in ('partition', 'threshold'):
+            raise ValueError(f"Unknown top-k method: {method}")
+        groups = {}
+        for position, (preferences, _) in enumerate(profiles):
+            excluded = tuple(sorted(place.lower() for place in preferences.get('excluded_places', [])))
+            groups.setdefault(excluded, []).append(position)
+
+        selections = [None] * len(profiles)
+        weather_cache = {}
+        for positions in groups.values():
+            group = [profiles[position] for position in positions]
+            #USER CAN EXCLUDE PLACES IF THEY WANT TO
+            with stage('exclusions'):
+                rows = self._selected_rows(group[0][0])
+            n_rows = len(self.destination_names) if rows is None else len(rows)
+            static, dependent, weights = self.compile_factors(mode, group)
+            n_static = len(static)
+            dependent_columns = self._dependent_columns(dependent, group, weights[n_static:], rows, weather_cache)
+
+            #THE SORTED FACTOR COLUMNS ONLY HOLD FOR THE WHOLE CATALOG, EXCLUSIONS ARE SCORED IN FULL
+            if method == 'threshold' and rows is None:
+                static_weights = np.zeros((len(self.factor_names), len(group)))
+                static_weights[static] = weights[:n_static]
+                for j, position in enumerate(positions):
+                    extra = np.column_stack([matrix[:, variant[j]] for matrix, variant in dependent_columns]) if dependent_columns else np.empty((n_rows, 0))
+                    with stage('threshold_top_k', rows=n_rows):
+                        top_rows, top_scores = threshold_top_k(self.factor_matrix, static_weights[:, j], self.sorted_factor_index(), top_n, extra, weights[n_static:, j])
+                    selections[position] = (top_rows, top_scores)
+                continue
+
+            scores = self._score_profiles(rows, static, weights, dependent_columns)
+            with stage('top_k', rows=n_rows):
+                for j, position in enumerate(positions):
+                    top_rows = top_k_indices(scores[:, j], top_n)
+                    selections[position] = (top_rows if rows is None else rows[top_rows], scores[top_rows, j])
+        with stage('results', rows=len(profiles)):
+            return self._results_batch(selections, RESULT_COUNTRY_COLUMNS[mode])
+
+    #MORE LIKE THIS: NEAREST DESTINATIONS IN A SPACE OF NORMALISED FEATURES
+    def _similarity_feature_matrix(self):
+        """(destinations x features) values from 0 to 1, NaN if unknown, and the columns of every group of SIMILARITY_GROUPS."""
+        def normalized_raw(names):
+            return min_max_normalize(self._raw_factor_values([self._factor_index[name] for name in names]))
+        #MONTHLY WEATHER AS POSITIONS ON WEATHER_SCALE
+        weather = self.weather_codes / (len(WEATHER_SCALE) - 1)
+        weather[self.weather_codes == UNKNOWN_WEATHER] = np.nan
+        #SHARE OF EVERY ATTRACTION GROUP AMONG THE ATTRACTIONS OF THE DESTINATION
+        counts = self._group_counts[:, [self.attraction_groups.index(group) for group in ALL_ATTRACTION_GROUPS if group in self.attraction_groups]]
+        total = counts.sum(axis=1, keepdims=True)
+        attractions = np.where(total > 0, counts / np.where(total > 0, total, 1), np.nan)
+        #ONE COLUMN PER LANGUAGE
+        language_lower = self._language_lower if self._language_lower is not None else np.full(len(self.destination_names), '')
+        languages = np.array(sorted(set(language_lower) - {''}), dtype=object)
+        blocks = {
+            'weather': weather,
+            'cost': normalized_raw(['budget_Budget', 'budget_MidRange', 'budget_Luxury']),
+            'safety': normalized_raw(['safety']),
+            'attractions': attractions,
+            'cuisine': self.factor_matrix[:, [self._factor_index['cuisine_quality']]],
+            'language': (language_lower[:, None] == languages[None, :]).astype(float),
+        }
+        groups, first = {}, 0
+        for group in SIMILARITY_GROUPS:
+            groups[group] = (first, first + blocks[group].shape[1])
+            first += blocks[group].shape[1]
+        return np.column_stack([blocks[group] for group in SIMILARITY_GROUPS]), groups
+
+    def similarity_index(self):
+        """The similarity index, mapped from the snapshot if the ETL built one, otherwise built on first use."""
+        if self._similarity_index is None:
+            if self._similarity_features is None:
+                with stage('similarity_index', rows=len(self.destination_names)):
+                    features, groups = self._similarity_feature_matrix()
+                    index = SimilarityIndex.build(features, groups)
+                self._similarity_features, self._similarity_centroids, self._similarity_cells = index.features, index.centroids, index.cells
+                self._similarity_groups = groups
+            else:
+                index = SimilarityIndex(self._similarity_features, self._similarity_groups, self._similarity_centroids, self._similarity_cells)
+            self._similarity_index = index
+        return self._similarity_index
+
+    def similar_destinations(self, destination, k=10, metric='cosine', weights=None, preferences=None, approximate=None):
+        """Destinations most like `destination`, by cosine similarity or weighted Euclidean distance of their features.
+
+        `weights` weights the feature groups (SIMILARITY_GROUPS, 1 each by default) and places excluded
+        in `preferences` are left out. Large catalogs are searched approximately unless `approximate=False`.
+        """
+        with traced('similar_destinations', k=k, metric=metric):
+            matches = np.flatnonzero(self._destination_lower == str(destination).strip().lower())
+            if not len(matches):
+                raise PreferenceError(f"Unknown destination: {destination}")
+            excluded = None
+            if preferences and preferences.get('excluded_places'):
+                excluded = np.ones(len(self.destination_names), dtype=bool)
+                excluded[self._selected_rows(preferences)] = False
+            with stage('similarity_query'):
+                rows, values = self.similarity_index().query(matches[0], k, metric, weights, excluded, approximate)
+            return pd.DataFrame({
+                'Destination': self.destination_names[rows], 'Country': self.country_names[rows],
+                'similarity' if metric == 'cosine' else 'distance': values,
+            }, index=rows)
+
+    #GROUP TRIPS: ONE RANKING FOR SEVERAL TRAVELLERS
+    def recommend_group(self, mode, profiles, strategy='average', top_n=10):
+        """Joint top destinations for several travellers' (preferences, weights) profiles.
+
+        Every traveller is scored in one batched pass and their scores are rescaled to 0..1, so each
+        traveller counts the same. They are combined with one of GROUP_STRATEGIES. A place any
+        traveller excludes is excluded for the whole group. The results hold every traveller's points.
+        """
+        if strategy not in GROUP_STRATEGIES:
+            raise PreferenceError(f"Unknown group strategy: {strategy} (expected one of {GROUP_STRATEGIES})")
+        profiles = list(profiles)
+        if not profiles:
+            raise PreferenceError("A group needs at least one traveller")
+        with traced(mode + '_group', travellers=len(profiles), strategy=strategy, top_n=top_n):
+            with stage('exclusions'):
+                excluded = sorted({place for preferences, _ in profiles for place in preferences.get('excluded_places', [])})
+                rows = self._selected_rows({'excluded_places': excluded})
+            static, dependent, weights = self.compile_factors(mode, profiles)
+            dependent_columns = self._dependent_columns(dependent, profiles, weights[len(static):], rows, {})
+            scores = self._score_profiles(rows, static, weights, dependent_columns)
+            with stage('aggregation', rows=len(scores)):
+                #A TRAVELLER WHO DOES NOT MIND (SAME SCORE EVERYWHERE) IS HAPPY WITH EVERY DESTINATION
+                satisfaction = min_max_normalize(scores, True, 1.0)
+                average = satisfaction.mean(axis=1)
+                if strategy == 'fairness':
+                    order = fair_selection(satisfaction, top_n)
+                else:
+                    group_scores = {'average': average, 'least_misery': satisfaction.min(axis=1), 'most_pleasure': satisfaction.max(axis=1)}[strategy]
+                    order = top_k_indices(group_scores, top_n)
+            with stage('results', rows=len(order)):
+                results = self._results((average if strategy == 'fairness' else group_scores)[order], order, rows, RESULT_COUNTRY_COLUMNS[mode])
+                for traveller in range(len(profiles)):
+                    results[f'traveller_{traveller + 1}'] = satisfaction[order, traveller]
+            return results
+
+    #SKYLINE: DESTINATIONS NO OTHER DESTINATION BEATS IN EVERY CHOSEN FACTOR, NO WEIGHTS NEEDED
+    def factor_columns(self, mode, preferences, factors=None):
+        """Selected rows, names and (destinations x factors) points of the chosen weight keys (all of the mode by default).
+
+        Factors the preferences leave out (e.g. no budget) or which give no points anywhere are skipped.
+        """
+        known = mode_weight_keys(mode)
+        unknown = [name for name in factors or [] if name not in known]
+        if unknown:
+            raise PreferenceError(f"Unknown {mode} factors: {unknown}")
+        rows = self._selected_rows(preferences)
+        names, columns = [], []
+        cache = {}
+        for name in factors or known:
+            factor = chosen_factor(mode, name, preferences)
+            if factor is None:
+                continue
+            if factor.transform in STATIC_TRANSFORMS:
+                column = self._factor_rows(rows, [self._factor_index[factor.name]])[:, 0]
+            else:
+                column = self._preference_column(factor, preferences, rows, cache)
+            if column is not None:
+                names.append(name)
+                columns.append(column)
+        n_rows = len(self.destination_names) if rows is None else len(rows)
+        return rows, names, np.column_stack(columns) if columns else np.empty((n_rows, 0))
+
+    def skyline(self, mode, preferences, factors=None, k=1, representatives=None):
+        """Pareto-optimal destinations over the chosen factors, with the points of every factor and how many destinations dominate each.
+
+        k > 1 gives the k-skyband (destinations dominated by fewer than k others) and `representatives`
+        keeps only that many destinations, spread over the trade-offs. 'score' is the unweighted sum.
+        """
+        with traced(mode + '_skyline', k=k, representatives=representatives):
+            with stage('factors'):
+                rows, names, points = self.factor_columns(mode, preferences, factors)
+            with stage('skyline', rows=len(points)):
+                positions, counts = skyband(points, k)
+            if representatives is not None:
+                with stage('representatives', rows=len(positions)):
+                    picked = representative_rows(points[positions], representatives)
+                positions, counts = positions[picked], counts[picked]
+            with stage('results', rows=len(positions)):
+                results = self._results(points[positions].sum(axis=1), positions, rows, RESULT_COUNTRY_COLUMNS[mode])
+                for name, column in zip(names, points[positions].T):
+                    results[name] = column
+                results['dominated_by'] = counts
+            return results
+
+    def _results(self, top_scores, order, rows, country_col):
+        index = order if rows is None else rows[order]
+        return pd.DataFrame({'Destination': self.destination_names[index], country_col: self.country_names[index], 'score': top_scores}, index=index)
+
+    def _results_batch(self, selections, country_col):
+        """One DataFrame per (destination rows, scores) selection, all cut from a single frame because building frames is slow."""
+        if len(selections) == 1:
+            return [self._results(selections[0][1], selections[0][0], None, country_col)]
+        index = np.concatenate([top_rows for top_rows, _ in selections]) if selections else np.empty(0, dtype=np.intp)
+        frame = self._results(np.concatenate([top_scores for _, top_scores in selections]) if selections else np.empty(0), index, None, country_col)
+        bounds = np.cumsum([0] + [len(top_rows) for top_rows, _ in selections])
+        return [frame.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    #VACATION CALCULATION
+    def recommend_vacation(self, preferences, weights, top_n=10, method='partition'):
+        return self.recommend_vacation_batch([(preferences, weights)], top_n, method)[0]
+
+    def recommend_vacation_batch(self, profiles, top_n=10, method='partition'):
+        """Top `top_n` vacation destinations for every (preferences, weights) pair in `profiles`."""
+        #BUDGET, DISTANCE, SAFETY, POPULARITY, ENGLISH LEVEL AND CUISINE ARE ALREADY NORMALISED IN THE FACTOR MATRIX
+        profiles = list(profiles)
+        with traced('vacation', profiles=len(profiles), top_n=top_n, method=method):
+            return self._recommend_batch('vacation', profiles, top_n, method)
+
+    #EMIGRATION RECOMMENDATION
+    def recommend_emigration(self, preferences, weights, top_n=10, method='partition'):
+        return self.recommend_emigration_batch([(preferences, weights)], top_n, method)[0]
 
-    #10. CUSINE QUALITY RANKING 
-    if 'Cuisine_Rank' in df.columns and weights.get('cuisine_quality', 0) > 0:
-        cuisine_score = df['Cuisine_Rank'].apply(calculate_cuisine_score)
-        df['score'] += weights['cuisine_quality'] * cuisine_score
+    def recommend_emigration_batch(self, profiles, top_n=10, method='partition'):
+        """Top `top_n` emigration destinations for every (preferences, weights) pair in `profiles`."""
+        #DISTANCE, COST OF LIVING, UNEMPLOYMENT, INFLATION, PURCHASING POWER, SAFETY, HDI, LIFE EXPECTANCY AND ENGLISH
+        profiles = list(profiles)
+        with traced('emigration', profiles=len(profiles), top_n=top_n, method=method):
+            return self._recommend_batch('emigration', profiles, top_n, method)
 
-    results = df.sort_values(by='score', ascending=False)
-    display_cols = ['Destination', 'Country_x', 'score']
-    
-    return results[display_cols].head(top_n)
+
+_engine = None
+_result_cache = RecommendationCache()
+
+def get_engine():
+    """Returns the shared engine, building it from the database on the first call and again whenever the database file changes."""
+    global _engine
+    if _engine is None or _engine.version != database_version(_engine.db_path):
+        _engine = RecommenderEngine(DB_PATH if _engine is None else _engine.db_path)
+    return _engine
+
+def use_engine(engine):
+    """Makes `engine` (and its database) the one behind get_engine and the get_*_recommendations functions, with an empty result cache."""
+    global _engine, _result_cache
+    _engine = engine
+    _result_cache = RecommendationCache(db_path=engine.db_path)
+
+def recommendation_cache_stats():
+    """Hit/miss counters of the recommendation result cache."""
+    return _result_cache.stats()
+
+
+#VACATION CALCULATION
+def get_vacation_recommendations(preferences, weights, top_n=10):
+    with traced('vacation', top_n=top_n):
+        return _get_vacation_recommendations(preferences, weights, top_n)
+
+def _get_vacation_recommendations(preferences, weights, top_n):
+    #CONNECTING TO TRAVEL_RECOMMENDATION DATABASE (ONLY ONCE, THE ENGINE KEEPS THE DATA IN MEMORY)
+    try:
+        engine = get_engine()
+    except Exception as e:
+        print(f"Error loading data from database: {e}")
+        return None
+    #THE SAME SLIDER POSITIONS ARE ANSWERED FROM THE RESULT CACHE
+    return _result_cache.get_or_compute('vacation', preferences, weights, top_n, engine.recommend_vacation)
 
 #EMIGRATION RECOMMENDATION
 def get_emigration_recommendations(preferences, weights, top_n=10):
-    #CONNECTING AS BEFORE
+    with traced('emigration', top_n=top_n):
+        return _get_emigration_recommendations(preferences, weights, top_n)
+
+def _get_emigration_recommendations(preferences, weights, top_n):
     try:
-        conn = sqlite3.connect("travel_recommendation_final.db")
-        df = pd.read_sql_query("SELECT * FROM destinations", conn)
-        conn.close()
+        engine = get_engine()
     except Exception as e:
         print(f"Error loading data from database: {e}")
         return None
+    return _result_cache.get_or_compute('emigration', preferences, weights, top_n, engine.recommend_emigration)
 
-    excluded_places = preferences.get('excluded_places', [])
-    if excluded_places:
-        excluded_lower = [place.lower() for place in excluded_places]
-        df = df[~df['Country'].str.lower().isin(excluded_lower)]
-        df = df[~df['Destination'].str.lower().isin(excluded_lower)]
-        
-    df['score'] = 0.0
-    
-    #1. WEATHER, BUT HERE, POINTS ARE SUMMED FOR THE WHOLE YEAR
-    if weights.get('weather', 0) > 0 and 'weather' in preferences:
-        month_cols = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        df['total_weather_score'] = 0.0
-        def score_weather(current_weather):
-            max_allowed_distance = 3
-            weather_value = str(current_weather).strip().lower()
-            user_pref_lower = preferences['weather'].lower()
-            try:
-                user_index = WEATHER_SCALE.index(user_pref_lower)
-                current_index = WEATHER_SCALE.index(weather_value)
-                distance = abs(user_index - current_index)
-                if distance > max_allowed_distance: return 0.0
-                else: return 1.0 - (distance / max_allowed_distance)
-            except ValueError: return 0.0
-        for month_col in month_cols:
-            if month_col in df.columns:
-                monthly_score = df[month_col].apply(score_weather)
-                df['total_weather_score'] += monthly_score.fillna(0)
-        if df['total_weather_score'].max() > 0:
-            weather_score_normalized = (df['total_weather_score'] - df['total_weather_score'].min()) / (df['total_weather_score'].max() - df['total_weather_score'].min())
-            df['score'] += weights['weather'] * weather_score_normalized
-        
-    #2.Distance from Lodz (SAME AS IN TOURISM)
-    dist_col = 'Distance_from_Lodz_km_road'
-    if dist_col in df.columns and weights.get('distance', 0) > 0:
-        distance_data = df[dist_col].copy()
-        nan_indices = distance_data.isna()
-        max_dist = distance_data[~nan_indices].max()
-        min_dist = distance_data[~nan_indices].min()
-        if max_dist > min_dist:
-            normalized_distance = (distance_data - min_dist) / (max_dist - min_dist)
-            distance_score = (1 - normalized_distance) ** 2
+#MORE LIKE THIS
+def get_similar_destinations(destination, k=10, metric='cosine', weights=None, preferences=None):
+    try:
+        engine = get_engine()
+    except Exception as e:
+        print(f"Error loading data from database: {e}")
+        return None
+    return engine.similar_destinations(destination, k, metric, weights, preferences)
+
+#GROUP TRIPS
+def get_group_recommendations(profiles, strategy='average', top_n=10, mode='vacation'):
+    try:
+        engine = get_engine()
+    except Exception as e:
+        print(f"Error loading data from database: {e}")
+        return None
+    return engine.recommend_group(mode, profiles, strategy, top_n)
+
+#SKYLINE (NO WEIGHTS)
+def get_skyline_recommendations(mode, preferences, factors=None, k=1, representatives=None):
+    try:
+        engine = get_engine()
+    except Exception as e:
+        print(f"Error loading data from database: {e}")
+        return None
+    return engine.skyline(mode, preferences, factors, k, representatives)
+
+#WHEN TO GO
+def get_best_travel_months(preferred_weather, length=1, aggregation='mean'):
+    """Best month (or `length`-month window) of every destination for the preferred weather."""
+    with traced('best_travel_months', length=length, aggregation=aggregation):
+        try:
+            engine = get_engine()
+        except Exception as e:
+            print(f"Error loading data from database: {e}")
+            return None
+        return engine.best_travel_months(preferred_weather, length, aggregation)
+
+#INCREMENTAL RESCORING FOR ONE USER (E.G. ONE STREAMLIT SESSION)
+class RecommendationSession:
+    """Keeps one user's per-factor score columns between requests.
+
+    A request which differs from the previous one only in some weights moves the total score by
+    (new weight - old weight) x the kept factor column, and a changed month, weather, budget,
+    attraction or language choice recomputes only the factor that depends on it. Exclusions,
+    a rebuilt database or every FULL_REFRESH_EVERY-th update start from scratch.
+    """
+
+    FULL_REFRESH_EVERY = 64
+
+    def __init__(self, mode='vacation', engine=None):
+        if mode not in ('vacation', 'emigration'):
+            raise ValueError(f"Unknown recommendation mode: {mode}")
+        self.mode = mode
+        self.engine = engine
+        #NAMES OF THE FACTORS RECOMPUTED BY THE LAST REQUEST
+        self.last_recomputed = []
+        self._reset(None, None)
+
+    def _reset(self, engine, excluded):
+        self._state_engine = engine
+        self._excluded = excluded
+        self._rows = None
+        self._factors = None
+        self._columns = {}
+        self._keys = {}
+        self._weights = {}
+        self._scores = None
+        self._updates = 0
+        self._weather_cache = {}
+
+    def _factor_names(self):
+        return mode_weight_keys(self.mode)
+
+    def _dependency_key(self, name, preferences):
+        """The part of the preferences a factor column depends on."""
+        factor = chosen_factor(self.mode, name, preferences)
+        if factor is None or factor.transform in STATIC_TRANSFORMS:
+            return factor and factor.name
+        return (factor.transform, preference_key(factor, preferences))
+
+    def _column(self, engine, name, preferences):
+        factor = chosen_factor(self.mode, name, preferences)
+        if factor is None:
+            return None
+        if factor.transform in STATIC_TRANSFORMS:
+            return self._factors[:, engine._factor_index[factor.name]]
+        return engine._preference_column(factor, preferences, self._rows, self._weather_cache)
+
+    def recommend(self, preferences, weights, top_n=10):
+        with traced(self.mode + '_session', top_n=top_n):
+            return self._recommend(preferences, weights, top_n)
+
+    def _recommend(self, preferences, weights, top_n):
+        try:
+            engine = self.engine or get_engine()
+        except Exception as e:
+            print(f"Error loading data from database: {e}")
+            return None
+
+        excluded = tuple(sorted(place.lower() for place in preferences.get('excluded_places', [])))
+        if engine is not self._state_engine or excluded != self._excluded or self._updates >= self.FULL_REFRESH_EVERY:
+            self._reset(engine, excluded)
+            #USER CAN EXCLUDE PLACES IF THEY WANT TO
+            with stage('exclusions'):
+                self._rows = engine._selected_rows(preferences)
+            with stage('normalization', rows=None if self._rows is None else len(self._rows)):
+                self._factors = engine._factor_rows(self._rows)
+            self._scores = np.zeros(len(self._factors))
         else:
-            distance_score = pd.Series(0.5, index=distance_data.index)
-        distance_score[nan_indices] = 0.0
-        df['score'] += weights['distance'] * distance_score.fillna(0)
-
-    df.fillna(0, inplace=True)
-    
-    #3,4,5. COST OF LIVING INDEX, UNEMPLOYMENT, INFLATION, THE LOWER THE BETTER, NORMALISED
-    for col, weight in [('CostofLivingPlusRentIndex', 'cost_of_living'), ('Unemployment_Rate_National_Latest_Pct', 'unemployment'), ('Inflation_Rate_National_Latest_Pct', 'inflation')]:
-        if col in df.columns and weights.get(weight, 0) > 0:
-            if df[col].max() > df[col].min():
-                normalized = (df[col] - df[col].min()) / (df[col].max() - df[col].min())
-                df['score'] += weights[weight] * (1 - normalized)
-
-    #6,7,8,9 PURCHASING POWER, SAFETY INDEX, HDI, LIFE EXPECTANCY, THE HIGHER THE BETTER
-    for col, weight in [('LocalPurchasingPowerIndex', 'purchasing_power'), ('Safety_Index', 'safety'), ('HDI_Value_Latest', 'hdi'), ('Life_Expectancy', 'life_expectancy')]:
-        if col in df.columns and weights.get(weight, 0) > 0:
-            if df[col].max() > df[col].min():
-                normalized = (df[col] - df[col].min()) / (df[col].max() - df[col].min())
-                df['score'] += weights[weight] * normalized
-
-    #10. ENGLISH (SAME AS BEFORE)
-    epi_col = 'English_EPI_Score'
-    if epi_col in df.columns and weights.get('english_level', 0) > 0:
-        if df[epi_col].max() > df[epi_col].min():
-            epi_normalized = (df[epi_col] - df[epi_col].min()) / (df[epi_col].max() - df[epi_col].min())
-        else: epi_normalized = 0.5
-        df['score'] += weights['english_level'] * epi_normalized.fillna(0)
-    #ADDITIONAL LANGUAGES (SAME AS BEFORE)   
-    user_languages = preferences.get('known_languages', [])
-    if 'Language' in df.columns and user_languages and weights.get('known_languages', 0) > 0:
-        df['score'] += weights['known_languages'] * df['Language'].apply(lambda lang: 1.0 if str(lang).lower() in [l.lower() for l in user_languages] else 0.0)
-
-    results = df.sort_values(by='score', ascending=False)
-    display_cols = ['Destination', 'Country', 'score']
-    
-    return results[display_cols].head(top_n)
+            self._updates += 1
+
+        self.last_recomputed = []
+        for name in self._factor_names():
+            old_weight = self._weights.get(name, 0.0)
+            new_weight = effective_weight(weights, name)
+            old_column = self._columns.get(name)
+            column = old_column
+            key = self._dependency_key(name, preferences)
+            #A FACTOR IS (RE)COMPUTED ONLY IF ITS PREFERENCES CHANGED, OR IT GETS A WEIGHT FOR THE FIRST TIME
+            if new_weight != 0 and (key != self._keys.get(name) or name not in self._columns):
+                column = self._column(engine, name, preferences)
+                self._columns[name] = column
+                self._keys[name] = key
+                self.last_recomputed.append(name)
+            elif key != self._keys.get(name):
+                #STALE COLUMN WITHOUT A WEIGHT, IT WILL BE COMPUTED WHEN IT IS NEEDED AGAIN
+                self._columns.pop(name, None)
+                self._keys.pop(name, None)
+                column = None
+
+            if column is old_column:
+                if column is not None and new_weight != old_weight:
+                    self._scores += (new_weight - old_weight) * column
+            else:
+                if old_column is not None and old_weight != 0:
+                    self._scores -= old_weight * old_column
+                if column is not None and new_weight != 0:
+                    self._scores += new_weight * column
+            self._weights[name] = new_weight
+
+        with stage('top_k', rows=len(self._scores)):
+            top_rows = top_k_indices(self._scores, top_n)
+        with stage('results', rows=len(top_rows)):
+            return engine._results(self._scores[top_rows], top_rows, self._rows, RESULT_COUNTRY_COLUMNS[self.mode])
+
+
+#BATCH CALCULATION (E.G. OFFLINE CAMPAIGNS FOR MANY USER PROFILES AT ONCE)
+def get_vacation_recommendations_batch(profiles, top_n=10):
+    """Vacation recommendations for a list of (preferences, weights) pairs, one DataFrame per pair."""
+    try:
+        engine = get_engine()
+    except Exception as e:
+        print(f"Error loading data from database: {e}")
+        return None
+    return engine.recommend_vacation_batch(profiles, top_n)
+
+def get_emigration_recommendations_batch(profiles, top_n=10):
+    """Emigration recommendations for a list of (preferences, weights) pairs, one DataFrame per pair."""
+    try:
+        engine = get_engine()
+    except Exception as e:
+        print(f"Error loading data from database: {e}")
+        return None
+    return engine.recommend_emigration_batch(profiles, top_n)
 
 #MAIN FUNCTION
 if __name__ == "__main__":
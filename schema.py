@@ -0,0 +1,81 @@
+import sqlite3
+
+import pandas as pd
+
+#SCHEMA OF THE DATABASE BUILT BY database_creator.py: INTEGER KEYS, FOREIGN KEYS FROM THE ATTRACTIONS, INDEXES AND PRAGMAS
+#destinations.destination_id AND countries.country_id ARE THE ROWIDS OF THEIR TABLES, SO A LOOKUP BY THEM IS ONE B-TREE SEARCH
+#COUNTRY STATISTICS ARE STORED ONCE PER COUNTRY, THE destination_details VIEW JOINS THEM BACK TO EVERY DESTINATION
+
+#THE PAGE SIZE CAN ONLY BE SET BEFORE THE FIRST TABLE IS WRITTEN, AND NOT ANY MORE ONCE THE DATABASE IS IN WAL MODE
+#WAL LETS THE RECOMMENDER READ WHILE AN INCREMENTAL BUILD WRITES
+WRITE_PRAGMAS = (('journal_mode', 'WAL'), ('synchronous', 'NORMAL'))
+BUILD_PRAGMAS = (('page_size', 8192),) + WRITE_PRAGMAS
+#READERS MAP THE FILE INSTEAD OF COPYING PAGES INTO THEIR OWN CACHE
+READ_PRAGMAS = (('mmap_size', 256 * 2 ** 20),)
+
+#(TABLE, COLUMNS) OF EVERY INDEX: COUNTRIES AND DESTINATIONS BY NAME, DESTINATIONS BY COUNTRY, ATTRACTIONS OF ONE DESTINATION BY VOTES, ALL ATTRACTIONS BY VOTES,
+#AND THE VOTES OF THE ATTRACTIONS OF ONE DESTINATION NAME (ITS POPULARITY, WHICH AN INCREMENTAL BUILD RECOUNTS ONLY FOR THE NAMES IT CHANGED)
+INDEXES = {
+    'countries_country': ('countries', ('Country',)),
+    'destinations_destination': ('destinations', ('Destination',)),
+    'destinations_country': ('destinations', ('country_id',)),
+    'attractions_destination_votes': ('attractions', ('destination_id', 'No_votes')),
+    'attractions_votes': ('attractions', ('No_votes',)),
+    'attractions_name_votes': ('attractions', ('Destination', 'No_votes')),
+}
+
+
+def connect_database(db_path, pragmas=READ_PRAGMAS, **kwargs):
+    conn = sqlite3.connect(db_path, **kwargs)
+    for name, value in pragmas:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def column_type(dtype):
+    """SQLite type of a pandas column, as to_sql declares it."""
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    return 'TEXT'
+
+
+def create_table(conn, table, df, primary_key=None, foreign_keys=None, schema='main'):
+    """Creates `table` with the columns of `df`, typed like to_sql would, plus the keys pandas cannot declare.
+
+    `foreign_keys` maps a column to the (table, column) it references. Rows are then appended with to_sql
+    (or, in another schema than main, with incremental.insert_rows).
+    """
+    foreign_keys = foreign_keys or {}
+    columns = []
+    for name, dtype in df.dtypes.items():
+        column = f'"{name}" {column_type(dtype)}'
+        if name == primary_key:
+            column += ' PRIMARY KEY'
+        if name in foreign_keys:
+            column += ' REFERENCES "{}" ("{}")'.format(*foreign_keys[name])
+        columns.append(column)
+    conn.execute(f'DROP TABLE IF EXISTS {schema}."{table}"')
+    conn.execute(f'CREATE TABLE {schema}."{table}" (\n  ' + ',\n  '.join(columns) + '\n)')
+
+
+def create_indexes(conn, schema='main'):
+    """Creates the indexes which are missing, of the tables which exist."""
+    for index, (table, columns) in INDEXES.items():
+        existing = {row[1] for row in conn.execute(f'PRAGMA {schema}.table_info("{table}")')}
+        if set(columns) <= existing:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}."{index}" ON "{table}" (' + ', '.join(f'"{column}"' for column in columns) + ')')
+
+
+def create_destination_details(conn, destination_columns, country_columns):
+    """The destination_details view: every destination with the statistics of its country, columns in the order of the old flat table."""
+    keys = ['destination_id', 'country_id', 'Destination', 'Country']
+    columns = [f'd."{column}"' for column in keys]
+    columns += [f'c."{column}"' for column in country_columns if column not in keys]
+    columns += [f'd."{column}"' for column in destination_columns if column not in keys]
+    conn.execute('DROP VIEW IF EXISTS destination_details')
+    conn.execute('CREATE VIEW destination_details AS SELECT ' + ', '.join(columns)
+                 + ' FROM destinations d LEFT JOIN countries c ON c.country_id = d.country_id ORDER BY d.destination_id')
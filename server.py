@@ -0,0 +1,290 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chatbot import chatbot_context, get_chatbot_response, load_top_attractions
+from recommender import DB_PATH, RESULT_COUNTRY_COLUMNS, PreferenceError, RecommendationCache, RecommenderEngine, database_version
+
+#JSON RECOMMENDATION SERVICE FOR OTHER INTERNAL SERVICES, ONLY THE STANDARD LIBRARY AND THE PROJECT PACKAGES
+#python server.py --port 8000 --workers 4 --timeout 5
+#
+#POST /vacation    {"preferences": {...}, "weights": {...}, "top_n": 10}   (SAME DICTIONARIES AS get_vacation_recommendations)
+#POST /emigration  {"preferences": {...}, "weights": {...}, "top_n": 10}
+#                  "months" IN THE VACATION PREFERENCES: A TRAVEL WINDOW ("Jun-Aug" OR A LIST) SCORED INSTEAD OF ONE "month"
+#                  "origin" IN THE PREFERENCES: A CITY NAME OR [LATITUDE, LONGITUDE], DISTANCES ARE MEASURED FROM LODZ WITHOUT IT
+#POST /chatbot     {"question": "Tell me about Warsaw"}
+#GET  /health
+#
+#EVERY WORKER PROCESS LOADS THE DATA ONCE WHEN IT STARTS (FROM THE SNAPSHOT IF THERE IS ONE), REQUESTS NEVER QUERY THE DATABASE.
+#A REBUILT DATABASE IS PICKED UP BY EVERY WORKER ON ITS NEXT REQUEST.
+
+MAX_BODY_BYTES = 2 ** 20
+MAX_TOP_N = 1000
+#PREFERENCES CHECKED BEFORE A REQUEST IS SENT TO A WORKER
+STRING_PREFERENCES = ('budget', 'weather', 'month')
+LIST_PREFERENCES = ('excluded_places', 'known_languages', 'attractions')
+
+
+#WORKER PROCESSES
+_worker = {}
+
+def _init_worker(db_path):
+    """Runs once in every worker process, before its first request."""
+    _worker['db_path'] = db_path
+    _worker['cache'] = RecommendationCache(db_path=db_path)
+    _load_worker_data()
+
+def _load_worker_data():
+    engine = RecommenderEngine(_worker['db_path'])
+    _worker['engine'] = engine
+    #ONLY THE MOST VOTED ATTRACTION OF EVERY DESTINATION, SO A WORKER DOES NOT HOLD THEM ALL
+    _worker['chatbot'] = chatbot_context(engine.destination_details, load_top_attractions(_worker['db_path']))
+
+def _worker_engine():
+    if _worker['engine'].version != database_version(_worker['db_path']):
+        _load_worker_data()
+    return _worker['engine']
+
+def recommend_task(mode, preferences, weights, top_n):
+    """Top destinations as JSON-ready rows."""
+    engine = _worker_engine()
+    compute = engine.recommend_vacation if mode == 'vacation' else engine.recommend_emigration
+    results = _worker['cache'].get_or_compute(mode, preferences, weights, top_n, compute)
+    return [
+        {'rank': rank, 'destination': row.Destination, 'country': getattr(row, RESULT_COUNTRY_COLUMNS[mode]), 'score': float(row.score)}
+        for rank, row in enumerate(results.itertuples(index=False), start=1)
+    ]
+
+def chatbot_task(question):
+    _worker_engine()
+    return get_chatbot_response(question, *_worker['chatbot'])
+
+def health_task():
+    engine = _worker_engine()
+    return {'pid': os.getpid(), 'destinations': len(engine.destination_names), 'snapshot': engine.snapshot_dir is not None}
+
+
+class WorkerPool:
+    """A pool of warm worker processes, replaced as a whole if one of them dies or a request in it times out.
+
+    The new pool is started before the old one is killed, so requests keep being served meanwhile. Requests
+    still running in the old pool when it is killed fail.
+    """
+
+    def __init__(self, workers, db_path=DB_PATH):
+        self.workers = workers
+        self.db_path = db_path
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._executor = self._start()
+
+    def _start(self):
+        #FORKSERVER: WORKERS ARE NOT FORKED FROM THE MULTI-THREADED HTTP SERVER
+        executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('forkserver'), initializer=_init_worker, initargs=(self.db_path,))
+        #ONE TASK PER WORKER, SO ALL OF THEM START AND LOAD THE DATA BEFORE THE FIRST REQUEST
+        for future in [executor.submit(health_task) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def run(self, timeout, function, *args):
+        """Result of `function(*args)` in a worker, TimeoutError if it takes longer than `timeout` seconds."""
+        executor = self._executor
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            self._restart(executor)
+            future = self._executor.submit(function, *args)
+        except RuntimeError:
+            #THE POOL WAS SHUT DOWN BECAUSE ANOTHER REQUEST JUST REPLACED IT
+            if self._executor is executor:
+                raise
+            future = self._executor.submit(function, *args)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            #A TASK STILL WAITING IN THE QUEUE IS DROPPED. A RUNNING ONE CANNOT BE STOPPED INSIDE ITS WORKER,
+            #SO THE POOL IS REPLACED, OTHERWISE A FEW HUNG REQUESTS WOULD KEEP EVERY WORKER BUSY
+            if not future.cancel() and future.running():
+                self._restart(executor)
+            raise TimeoutError(f"Request took longer than {timeout} s")
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def _restart(self, old):
+        with self._lock:
+            if self._executor is old:
+                self._executor = self._start()
+                self.restarts += 1
+                _terminate(old)
+
+    def shutdown(self):
+        _terminate(self._executor)
+
+
+def _terminate(executor):
+    """Shuts a pool down without waiting for its tasks, and kills its worker processes (a hung task never ends on its own)."""
+    #ProcessPoolExecutor HAS NO PUBLIC WAY TO STOP A RUNNING TASK BEFORE PYTHON 3.14
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+#HTTP SERVER
+class RequestError(Exception):
+    """Invalid request, answered with a 4xx status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def recommendation_arguments(mode, body):
+    preferences = body.get('preferences', {})
+    weights = body.get('weights', {})
+    top_n = body.get('top_n', 10)
+    if not isinstance(preferences, dict) or not isinstance(weights, dict):
+        raise RequestError(400, "'preferences' and 'weights' must be JSON objects")
+    #JSON NaN AND Infinity ARE PARSED AS FLOATS TOO
+    if not all(isinstance(weight, (int, float)) and not isinstance(weight, bool) and math.isfinite(weight) for weight in weights.values()):
+        raise RequestError(400, "Every weight must be a finite number")
+    if not isinstance(top_n, int) or isinstance(top_n, bool) or not 1 <= top_n <= MAX_TOP_N:
+        raise RequestError(400, f"'top_n' must be an integer from 1 to {MAX_TOP_N}")
+    for name in STRING_PREFERENCES:
+        #NULL IS THE SAME AS A PREFERENCE NOT GIVEN
+        if preferences.get(name) is not None and not isinstance(preferences[name], str):
+            raise RequestError(400, f"'{name}' must be a string")
+    for name in LIST_PREFERENCES:
+        if name in preferences and not (isinstance(preferences[name], list) and all(isinstance(item, str) for item in preferences[name])):
+            raise RequestError(400, f"'{name}' must be a list of strings")
+    months = preferences.get('months')
+    if months is not None and not isinstance(months, str) and not (isinstance(months, list) and all(isinstance(month, str) for month in months)):
+        raise RequestError(400, "'months' must be a range like \"Jun-Aug\" or a list of months")
+    origin = preferences.get('origin')
+    if origin is not None and not isinstance(origin, str) and not (isinstance(origin, list) and len(origin) == 2):
+        raise RequestError(400, "'origin' must be a city name or [latitude, longitude]")
+    return mode, preferences, weights, top_n
+
+
+class RecommendationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool, timeout, quiet=False):
+        super().__init__(address, RecommendationHandler)
+        self.pool = pool
+        self.request_timeout = timeout
+        self.quiet = quiet
+        self.started = time.time()
+        self.counters = {'served': 0, 'failed': 0, 'timed_out': 0}
+        self._counters_lock = threading.Lock()
+
+    def count(self, name):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    server_version = 'TravelRecommender/1.0'
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self._reply(404, {'error': f"Unknown endpoint: {self.path}"})
+        server = self.server
+        #ONE ROUND TRIP THROUGH THE POOL: A WORKER ANSWERS WITHIN THE TIMEOUT AND HAS THE DATA LOADED
+        try:
+            worker = server.pool.run(server.request_timeout, health_task)
+            status, state = 200, 'ok'
+        except Exception as e:
+            worker, status, state = None, 503, f"unavailable: {e}"
+        self._reply(status, {
+            'status': state, 'worker': worker, 'pool_size': server.pool.workers, 'pool_restarts': server.pool.restarts,
+            'uptime_s': time.time() - server.started, **server.counters,
+        })
+
+    def do_POST(self):
+        server = self.server
+        try:
+            body = self._read_json()
+            if self.path in ('/vacation', '/emigration'):
+                result = {'results': server.pool.run(server.request_timeout, recommend_task, *recommendation_arguments(self.path[1:], body))}
+            elif self.path == '/chatbot':
+                question = body.get('question')
+                if not isinstance(question, str) or not question.strip():
+                    raise RequestError(400, "'question' must be a non-empty string")
+                result = {'answer': server.pool.run(server.request_timeout, chatbot_task, question)}
+            else:
+                raise RequestError(404, f"Unknown endpoint: {self.path}")
+        except RequestError as e:
+            server.count('failed')
+            return self._reply(e.status, {'error': str(e)})
+        except PreferenceError as e:
+            #E.G. AN UNKNOWN ORIGIN, RAISED BY THE ENGINE IN THE WORKER (ANY OTHER ERROR OF THE ENGINE IS A 500)
+            server.count('failed')
+            return self._reply(400, {'error': str(e)})
+        except TimeoutError as e:
+            server.count('timed_out')
+            return self._reply(504, {'error': str(e)})
+        except Exception as e:
+            server.count('failed')
+            return self._reply(500, {'error': f"{type(e).__name__}: {e}"})
+        server.count('served')
+        self._reply(200, result)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, "Request body is too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            raise RequestError(400, "Request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise RequestError(400, "Request body must be a JSON object")
+        return body
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON recommendation server with a pool of warm worker processes.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument('--timeout', type=float, default=5.0, help="seconds before a request is answered with 504")
+    parser.add_argument('--db', default=DB_PATH, help="database built by database_creator.py")
+    parser.add_argument('--quiet', action='store_true', help="do not log every request")
+    args = parser.parse_args()
+
+    print(f"Starting {args.workers} workers...")
+    pool = WorkerPool(args.workers, args.db)
+    server = RecommendationServer((args.host, args.port), pool, args.timeout, args.quiet)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import warnings
+
+import numpy as np
+
+#"MORE LIKE THIS": THE K DESTINATIONS NEAREST TO ONE DESTINATION IN A SPACE OF NORMALISED FEATURES
+#THE FEATURE COLUMNS COME IN GROUPS (E.G. 12 WEATHER MONTHS), EVERY GROUP HAS ONE WEIGHT, SPREAD OVER ITS COLUMNS
+#FOR LARGE CATALOGS THE INDEX IS ALSO AN INVERTED FILE (IVF): ROWS ARE SPLIT INTO K-MEANS CELLS AND AN
+#APPROXIMATE QUERY ONLY SCORES THE ROWS OF THE CELLS NEAREST TO THE QUERY
+
+SIMILARITY_METRICS = ('cosine', 'euclidean')
+#CATALOGS SMALLER THAN THIS ARE ALWAYS SEARCHED EXACTLY, LARGER ONES GET ABOUT SQRT(ROWS) CELLS
+IVF_MIN_ROWS = 1000
+#CELLS SCORED BY AN APPROXIMATE QUERY
+IVF_PROBES = 8
+KMEANS_ITERATIONS = 10
+#THE CELLS ARE TRAINED ON AT MOST THIS MANY POINTS PER CELL, THEN EVERY POINT IS ASSIGNED TO ONE
+KMEANS_SAMPLE_PER_CELL = 64
+#POINTS WHOSE DISTANCES TO THE CENTROIDS ARE COMPUTED AT A TIME
+NEAREST_BLOCK_ROWS = 4096
+
+
+def kmeans(points, n_cells, iterations=KMEANS_ITERATIONS, seed=0):
+    """Centroids and the cell of every point after a few Lloyd iterations on a sample (seeded, so a rebuild gives the same cells)."""
+    rng = np.random.default_rng(seed)
+    sample = points
+    if len(points) > n_cells * KMEANS_SAMPLE_PER_CELL:
+        sample = points[rng.choice(len(points), n_cells * KMEANS_SAMPLE_PER_CELL, replace=False)]
+    centroids = sample[rng.choice(len(sample), n_cells, replace=False)].copy()
+    for _ in range(iterations):
+        cells = nearest_centroids(sample, centroids, 1)[:, 0]
+        counts = np.bincount(cells, minlength=n_cells)
+        sums = np.column_stack([np.bincount(cells, weights=sample[:, column], minlength=n_cells) for column in range(sample.shape[1])])
+        #AN EMPTY CELL KEEPS ITS CENTROID
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids, nearest_centroids(points, centroids, 1)[:, 0]
+
+
+def nearest_centroids(points, centroids, n):
+    """The n centroids nearest to every point (rows x n), nearest first."""
+    if len(points) > NEAREST_BLOCK_ROWS:
+        #THE (ROWS x CELLS) DISTANCES OF A WHOLE CATALOG WOULD GROW FASTER THAN THE CATALOG, SO THEY ARE COMPUTED A BLOCK OF ROWS AT A TIME
+        return np.concatenate([nearest_centroids(points[first:first + NEAREST_BLOCK_ROWS], centroids, n) for first in range(0, len(points), NEAREST_BLOCK_ROWS)])
+    #|P - C|^2 = |P|^2 - 2 P.C + |C|^2, WITHOUT THE (ROWS x CELLS x FEATURES) DIFFERENCES
+    distances = (points ** 2).sum(axis=1)[:, None] - 2 * points @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+    if n == 1:
+        return np.argmin(distances, axis=1)[:, None]
+    n = min(n, len(centroids))
+    nearest = np.argpartition(distances, n - 1, axis=1)[:, :n]
+    return np.take_along_axis(nearest, np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1), axis=1)
+
+
+class SimilarityIndex:
+    """Normalised feature vectors of every destination, with IVF cells for approximate queries on large catalogs.
+
+    `build` takes features from 0 to 1 (NaN for unknown values, replaced by the column average)
+    and `groups`, which maps every feature group to its (first, last + 1) columns.
+    """
+
+    def __init__(self, features, groups, centroids=None, cells=None):
+        self.features = features
+        self.groups = groups
+        self.centroids = centroids
+        self.cells = cells
+        self._members = None
+
+    @classmethod
+    def build(cls, features, groups, n_cells=None):
+        features = np.array(features, dtype=float)
+        #UNKNOWN VALUES TAKE THE AVERAGE, THEN EVERY COLUMN IS CENTRED SO COSINE COMPARES DEVIATIONS FROM THE AVERAGE DESTINATION
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            means = np.nan_to_num(np.nanmean(features, axis=0))
+        features = np.where(np.isnan(features), means, features) - means
+        if n_cells is None:
+            n_cells = int(np.sqrt(len(features))) if len(features) >= IVF_MIN_ROWS else 0
+        centroids = cells = None
+        if n_cells:
+            #CELLS OF THE SPACE WITH THE DEFAULT WEIGHTS, THE CENTROIDS ARE KEPT UNWEIGHTED SO A QUERY CAN WEIGHT THEM ITS OWN WAY
+            scale = np.sqrt(cls._column_weights(groups, features.shape[1], None))
+            centroids, cells = kmeans(features * scale, min(n_cells, len(features)))
+            centroids = centroids / np.where(scale > 0, scale, 1.0)
+        return cls(features, groups, centroids, cells)
+
+    @staticmethod
+    def _column_weights(groups, n_columns, weights):
+        """Weight of every column: the weight of its group (1 by default) split equally over the group's columns."""
+        column_weights = np.zeros(n_columns)
+        weights = weights or {}
+        unknown = [group for group in weights if group not in groups]
+        if unknown:
+            raise ValueError(f"Unknown feature groups: {unknown} (expected some of {list(groups)})")
+        for group, (first, last) in groups.items():
+            weight = weights.get(group, 1.0)
+            if weight < 0:
+                raise ValueError(f"Feature group weights cannot be negative: {group}")
+            column_weights[first:last] = weight / max(last - first, 1)
+        return column_weights
+
+    def _cell_members(self):
+        """Rows of every IVF cell, as one array sorted by cell and the start of every cell in it."""
+        if self._members is None:
+            order = np.argsort(self.cells, kind='stable')
+            starts = np.searchsorted(self.cells[order], np.arange(len(self.centroids) + 1))
+            self._members = (order, starts)
+        return self._members
+
+    def _candidates(self, query, scale, probes):
+        order, starts = self._cell_members()
+        cells = nearest_centroids(query[None, :], self.centroids * scale, probes)[0]
+        return np.concatenate([order[starts[cell]:starts[cell + 1]] for cell in cells])
+
+    def query(self, row, k=10, metric='cosine', weights=None, excluded=None, approximate=None, probes=IVF_PROBES):
+        """The k rows most similar to `row` and their cosine similarities (highest first) or weighted Euclidean distances (lowest first).
+
+        `weights` maps feature groups to weights, `excluded` is a boolean mask of rows never returned
+        (the row itself is always left out). `approximate` (the default if the index has IVF cells)
+        scores only the rows of the `probes` cells nearest to the query, more if they hold fewer than k rows.
+        """
+        if metric not in SIMILARITY_METRICS:
+            raise ValueError(f"Unknown similarity metric: {metric} (expected one of {SIMILARITY_METRICS})")
+        scale = np.sqrt(self._column_weights(self.groups, self.features.shape[1], weights))
+        query = self.features[row] * scale
+        allowed = np.ones(len(self.features), dtype=bool) if excluded is None else ~np.asarray(excluded, dtype=bool)
+        allowed[row] = False
+        if approximate is None:
+            approximate = self.centroids is not None
+        if approximate and self.centroids is None:
+            raise ValueError("This similarity index has no IVF cells, build it with n_cells for approximate queries")
+        candidates = None
+        if approximate:
+            while candidates is None and probes < len(self.centroids):
+                probed = self._candidates(query, scale, probes)
+                probed = probed[allowed[probed]]
+                if len(probed) >= k:
+                    candidates = np.sort(probed)
+                probes *= 2
+        if candidates is None:
+            candidates = np.flatnonzero(allowed)
+        vectors = self.features[candidates] * scale
+        if metric == 'cosine':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scores = np.nan_to_num(vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)))
+        else:
+            scores = -np.linalg.norm(vectors - query, axis=1)
+        k = min(k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k] if 0 < k < len(scores) else np.arange(len(scores))[:k]
+        best = best[np.lexsort((candidates[best], -scores[best]))]
+        return candidates[best], scores[best] if metric == 'cosine' else -scores[best]
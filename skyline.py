@@ -0,0 +1,81 @@
+import numpy as np
+
+#PARETO-OPTIMAL ROWS OF A (ROWS x FACTORS) MATRIX OF POINTS, HIGHER IS BETTER IN EVERY FACTOR
+#A ROW DOMINATES ANOTHER IF IT IS AT LEAST AS GOOD IN EVERY FACTOR AND BETTER IN ONE OF THEM
+
+#ROWS COMPARED AT ONCE AGAINST THE ROWS KEPT SO FAR
+SKYLINE_BLOCK_SIZE = 256
+
+
+def dominance_counts(points, candidates):
+    """How many of `points` dominate each of `candidates` (both rows x factors)."""
+    counts = np.zeros(len(candidates), dtype=np.int64)
+    #IN SLICES OF POINTS, ONE (POINTS x CANDIDATES) COMPARISON PER FACTOR
+    step = max(1, 2 ** 20 // max(1, len(candidates)))
+    for start in range(0, len(points), step):
+        block = points[start:start + step]
+        at_least = np.ones((len(block), len(candidates)), dtype=bool)
+        better = np.zeros((len(block), len(candidates)), dtype=bool)
+        for factor in range(points.shape[1]):
+            at_least &= block[:, factor, None] >= candidates[None, :, factor]
+            better |= block[:, factor, None] > candidates[None, :, factor]
+        counts += (at_least & better).sum(axis=0)
+    return counts
+
+
+def skyband(points, k=1, block_size=SKYLINE_BLOCK_SIZE):
+    """Rows dominated by fewer than k other rows (k=1: the skyline) and their dominance counts, with sort-filter-skyline.
+
+    Rows are presorted by the sum of their points (ties broken by the points themselves), so a row
+    can only be dominated by rows before it. The rows are then filtered block by block against the
+    rows kept so far: every dominator of a kept row is itself kept, so nothing else has to be compared.
+    The rows kept from the first block filter all the others at once, which leaves few blocks.
+    """
+    points = np.asarray(points, dtype=float)
+    n, n_factors = points.shape
+    if n == 0 or n_factors == 0:
+        return np.arange(n), np.zeros(n, dtype=np.int64)
+    keys = [-points[:, factor] for factor in range(n_factors - 1, -1, -1)] + [-points.sum(axis=1)]
+    order = np.lexsort(keys)
+    kept_rows = []
+    kept_counts = []
+    kept_points = np.empty((0, n_factors))
+    for start in range(0, n, block_size):
+        rows = order[start:start + block_size]
+        block = points[rows]
+        #DOMINATORS AMONG THE ROWS KEPT SO FAR AND AMONG THE ROWS OF THE BLOCK ITSELF
+        counts = dominance_counts(kept_points, block) + dominance_counts(block, block)
+        keep = counts < k
+        kept_rows.append(rows[keep])
+        kept_counts.append(counts[keep])
+        kept_points = np.concatenate([kept_points, block[keep]])
+        if start == 0:
+            #THE ROWS OF THE FIRST BLOCK DOMINATE MOST OF THE OTHERS, WHICH ARE DROPPED IN ONE PASS
+            rest = order[block_size:]
+            order = np.concatenate([order[:block_size], rest[dominance_counts(kept_points, points[rest]) < k]])
+    return np.concatenate(kept_rows), np.concatenate(kept_counts)
+
+
+def skyline(points, block_size=SKYLINE_BLOCK_SIZE):
+    """Rows no other row dominates, in order of the sum of their points."""
+    return skyband(points, 1, block_size)[0]
+
+
+def representative_rows(points, m):
+    """m rows spread over `points` (positions into it), picked greedily: the best sum first, then always the row farthest from those picked.
+
+    This is the distance-based representative skyline: every row of `points` is close to one of the
+    m picked, so a few rows show the whole range of trade-offs.
+    """
+    points = np.asarray(points, dtype=float)
+    if m >= len(points):
+        return np.arange(len(points))
+    if m <= 0:
+        return np.empty(0, dtype=np.intp)
+    picked = [int(np.argmax(points.sum(axis=1)))]
+    distance = np.linalg.norm(points - points[picked[0]], axis=1)
+    for _ in range(m - 1):
+        farthest = int(np.argmax(distance))
+        picked.append(farthest)
+        distance = np.minimum(distance, np.linalg.norm(points - points[farthest], axis=1))
+    return np.array(picked)
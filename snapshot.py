@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+#BINARY SNAPSHOT OF THE RECOMMENDER ARRAYS, WRITTEN BY database_creator.py NEXT TO THE DATABASE
+#EVERY ARRAY IS ONE .npy FILE, SO IT CAN BE MEMORY-MAPPED: NOTHING IS PARSED ON LOAD AND ALL PROCESSES SHARE THE SAME PAGES
+#THE SQLITE DATABASE STAYS THE SOURCE OF TRUTH, manifest.json TIES THE SNAPSHOT TO ONE BUILD OF IT
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = 'manifest.json'
+
+
+def snapshot_path(db_path):
+    """Default snapshot directory of a database: travel_recommendation_final.db -> travel_recommendation_final.snapshot"""
+    return os.path.splitext(db_path)[0] + '.snapshot'
+
+
+def file_sha256(path, chunk_size=2 ** 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def wal_state(db_path):
+    """(modification time, size) of the write-ahead log of a database, None if it has none or it is empty.
+
+    In WAL mode a commit can stay in the -wal file until a checkpoint, without touching the database file.
+    """
+    try:
+        stat = os.stat(db_path + '-wal')
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size] if stat.st_size else None
+
+
+def write_snapshot(directory, arrays, metadata, db_path):
+    """Writes `arrays` (name -> numpy array, None is skipped) and `metadata` (JSON) tied to the current build of `db_path`.
+
+    The snapshot is written next to the old one and swapped in with renames, so a reader sees either
+    the old or the new one. Processes which still map the old files keep them until they exit.
+    """
+    stat = os.stat(db_path)
+    temporary = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    files = {}
+    for name, array in arrays.items():
+        if array is None:
+            continue
+        #OBJECT ARRAYS (NAMES) WOULD NEED PICKLE, FIXED-WIDTH UNICODE CAN BE MAPPED
+        array = np.asarray(array)
+        if array.dtype == object:
+            array = array.astype(str)
+        np.save(os.path.join(temporary, name + '.npy'), np.ascontiguousarray(array), allow_pickle=False)
+        files[name] = file_sha256(os.path.join(temporary, name + '.npy'))
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'database': {'sha256': file_sha256(db_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'wal': wal_state(db_path)},
+        'files': files,
+        'metadata': metadata,
+    }
+    with open(os.path.join(temporary, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    old = f"{directory}.old-{os.getpid()}"
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(temporary, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def matches_database(manifest, db_path):
+    """Whether the snapshot was built from this database file.
+
+    The size and modification time are checked first, the checksum only if the file was touched
+    (e.g. copied or checked out again) without changing its size. Commits still in the write-ahead
+    log are a different build as well.
+    """
+    try:
+        stat = os.stat(db_path)
+    except OSError:
+        return False
+    database = manifest.get('database', {})
+    if stat.st_size != database.get('size') or wal_state(db_path) != database.get('wal'):
+        return False
+    if stat.st_mtime_ns == database.get('mtime_ns'):
+        return True
+    return file_sha256(db_path) == database.get('sha256')
+
+
+def load_snapshot(directory, db_path, verify=False):
+    """Memory-mapped arrays and metadata of a snapshot, or None if it is missing, of another format or of another database build.
+
+    `verify=True` also checks the checksum of every array file (this reads all of them).
+    """
+    manifest = read_manifest(directory)
+    if manifest is None or manifest.get('format') != SNAPSHOT_FORMAT or not matches_database(manifest, db_path):
+        return None
+    arrays = {}
+    try:
+        for name, checksum in manifest['files'].items():
+            path = os.path.join(directory, name + '.npy')
+            if verify and file_sha256(path) != checksum:
+                return None
+            arrays[name] = np.load(path, mmap_mode='r', allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    return arrays, manifest['metadata']
@@ -0,0 +1,225 @@
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from attraction_aggregates import VoteRanks, add_partial_sums, destination_attraction_stats, rank_thresholds
+from geo import ORIGIN_CITIES, haversine_km
+from recommender import ALL_ATTRACTION_GROUPS, MONTH_COLUMNS, WEATHER_SCALE
+from schema import create_destination_details, create_indexes, create_table
+
+#SYNTHETIC CATALOGS WITH THE SAME SCHEMA AS travel_recommendation_final.db (AND AS THE SOURCE CSV FILES OF database_creator.py)
+#USED TO SEE HOW THE RECOMMENDERS AND THE ETL BEHAVE WITH MUCH BIGGER CATALOGS THAN THE REAL 104 DESTINATIONS
+
+#DETAILED TRIPADVISOR TYPES (AS IN database_creator.py) WITH THE GROUPS THEY ARE MAPPED TO
+ATTRACTION_TYPES = {
+    'Points of Interest': ['Landmark'], 'Historic Sites': ['Historic_Heritage'], 'Beaches': ['Beach', 'Nature_Recreation'],
+    'Architectural Buildings': ['Culture_Art'], 'History Museums': ['Museums', 'Historic_Heritage'],
+    'Art Museums': ['Museums', 'Culture_Art'], 'Churches': ['Religion', 'Culture_Art'], 'Neighborhoods': ['Shopping_Urban'],
+    'Castles': ['Historic_Heritage', 'Landmark'], 'Parks': ['Nature_Recreation'], 'Mountains': ['Mountains_and_trails', 'Nature_Recreation'],
+    'Theme Parks': ['Entertainment_Leisure'], 'Street Markets': ['Shopping_Urban'], 'Ski': ['Winter_Sports', 'Nature_Recreation'],
+    'Bridges': ['Scenic_Transport', 'Landmark'], 'Science Museums': ['Museums', 'Science_Technology'],
+    'Wineries': ['Food_Drink', 'Nature_Recreation'], 'Hiking Trails': ['Mountains_and_trails', 'Nature_Recreation'],
+    'Theaters': ['Culture_Art'], 'Scenic Railroads': ['Scenic_Transport'], 'Observatories': ['Science_Technology', 'Entertainment_Leisure'],
+}
+LANGUAGES = ['English', 'German', 'French', 'Spanish', 'Italian', 'Polish', 'Dutch', 'Portuguese', 'Czech', 'Greek', 'Swedish', 'Croatian']
+DESTINATIONS_PER_COUNTRY = 25
+#ATTRACTIONS FLAGGED Top_200_Popular, AS IN database_creator.py
+TOP_200 = 200
+LODZ = ORIGIN_CITIES['Lodz']
+
+_TYPE_NAMES = np.array(list(ATTRACTION_TYPES), dtype=object)
+_TYPE_GROUPS = np.array([[group in groups for group in ALL_ATTRACTION_GROUPS] for groups in ATTRACTION_TYPES.values()])
+
+
+def generate_country_statistics(n_countries, rng):
+    """Country_Statistics.csv: one row of national indicators per country."""
+    return pd.DataFrame({
+        'Country': [f"Country {i:05d}" for i in range(n_countries)],
+        'HDI_Value_Latest': rng.uniform(0.70, 0.97, n_countries).round(3),
+        'Life_Expectancy': rng.uniform(72, 84, n_countries).round(1),
+        'GNI_per_capita_PPP': np.where(rng.random(n_countries) < 0.05, np.nan, rng.uniform(12000, 80000, n_countries).round()),
+        'Inflation_Rate_National_Latest_Pct': rng.uniform(0.5, 12, n_countries).round(1),
+        'Crime_Index': rng.uniform(15, 60, n_countries).round(1),
+        'Safety_Index': rng.uniform(40, 85, n_countries).round(1),
+        'Unemployment_Rate_National_Latest_Pct': rng.uniform(1.5, 18, n_countries).round(2),
+        'English_EPI_Score': rng.integers(450, 650, n_countries),
+        'Cuisine_Rank': rng.integers(1, 101, n_countries),
+    })
+
+
+def generate_destination_statistics(first, count, countries, rng):
+    """Destination_Statistics.csv rows (raw column names) for destinations first .. first + count - 1."""
+    ids = np.arange(first, first + count)
+    country = countries[np.minimum(ids // DESTINATIONS_PER_COUNTRY, len(countries) - 1)]
+    latitude = rng.uniform(35, 70, count)
+    longitude = rng.uniform(-10, 35, count)
+    #WEATHER: WARMER IN THE SOUTH AND IN SUMMER
+    base = np.clip(np.round((70 - latitude) / 6), 0, len(WEATHER_SCALE) - 1)
+    season = np.cos(2 * np.pi * (np.arange(12) - 6.5) / 12)
+    codes = np.clip(np.round(base[:, None] - 1 + 2.5 * season[None, :] * rng.uniform(0.6, 1.2, (count, 1))), 0, len(WEATHER_SCALE) - 1).astype(int)
+    weather = np.array(WEATHER_SCALE, dtype=object)[codes]
+    #ROAD DISTANCE IS ABOUT 1.3 TIMES THE GREAT-CIRCLE DISTANCE, ISLANDS HAVE NONE
+    great_circle = haversine_km(latitude, longitude, *LODZ)
+    distance = np.where(rng.random(count) < 0.15, np.nan, (great_circle * 1.3).round(-1))
+    budget = rng.integers(35, 160, count)
+    cost_of_living = rng.uniform(30, 110, count).round(1)
+    rent = rng.uniform(10, 90, count).round(1)
+    df = pd.DataFrame({'Destination': [f"Destination {i:07d}" for i in ids], 'Country': country})
+    for month_number, month_col in enumerate(MONTH_COLUMNS):
+        df[month_col] = weather[:, month_number]
+    df['Distance_from_Lodz_km_road'] = distance
+    df['Overall_Daily_Cost_Budget_USD'] = budget
+    df['Overall_Daily_Cost_MidRange_USD'] = (budget * rng.uniform(2.0, 2.6, count)).astype(int)
+    df['Overall_Daily_Cost_Luxury_USD'] = (budget * rng.uniform(4.5, 6.0, count)).astype(int)
+    df['Language'] = np.array(LANGUAGES, dtype=object)[(ids // DESTINATIONS_PER_COUNTRY) % len(LANGUAGES)]
+    df['Number_of_ratings'] = 0
+    df['Cost of Living Index'] = cost_of_living
+    df['Rent Index'] = rent
+    df['Cost of Living Plus Rent Index'] = ((cost_of_living + rent) / 2).round(1)
+    df['Groceries Index'] = rng.uniform(30, 110, count).round(1)
+    df['Restaurant Price Index'] = rng.uniform(25, 120, count).round(1)
+    df['Local Purchasing Power Index'] = rng.uniform(30, 140, count).round(1)
+    df['Latitude'] = latitude.round(4)
+    df['Longitude'] = longitude.round(4)
+    return df
+
+
+def generate_attractions(destinations, countries, per_destination, rng, with_types=False):
+    """Attractions of the given destinations: group flags, and optionally the raw 'Attraction type' strings."""
+    m = len(destinations) * per_destination
+    destination = np.repeat(np.asarray(destinations, dtype=object), per_destination)
+    df = pd.DataFrame({
+        'Destination': destination,
+        'Country': np.repeat(np.asarray(countries, dtype=object), per_destination),
+        'Name': pd.Series(destination).str.cat(pd.Series(np.tile(np.arange(per_destination), len(destinations))).astype(str), sep=' attraction ').to_numpy(dtype=object),
+        'Avg_rating': rng.uniform(3.0, 5.0, m).round(1),
+        'No_votes': np.maximum(1, rng.lognormal(6.5, 1.6, m)).astype(np.int64),
+    })
+    #EVERY ATTRACTION HAS ONE TO THREE DETAILED TYPES
+    types = rng.integers(0, len(_TYPE_NAMES), (m, 3))
+    type_count = rng.integers(1, 4, m)
+    used = np.arange(3)[None, :] < type_count[:, None]
+    flags = (_TYPE_GROUPS[types] & used[:, :, None]).any(axis=1)
+    if with_types:
+        names = [pd.Series(_TYPE_NAMES[types[:, k]]) for k in range(3)]
+        joined = names[0]
+        for k in (1, 2):
+            joined = joined.where(~used[:, k], joined + '\x95' + names[k])
+        df['Attraction type'] = joined.to_numpy(dtype=object)
+        return df
+    for group_number, group in enumerate(ALL_ATTRACTION_GROUPS):
+        df[group] = flags[:, group_number].astype(np.int64)
+    df['Top_200_Popular'] = 0
+    return df
+
+
+def countries_table(country_stats):
+    """The 'countries' table as database_creator.py builds it from the source files."""
+    df = country_stats.copy()
+    df.insert(0, 'country_id', np.arange(1, len(df) + 1))
+    return df
+
+
+def destinations_table(dest_stats, countries, attractions, first):
+    """The 'destinations' table as database_creator.py builds it from the source files (destination ids from first + 1, country statistics in 'countries')."""
+    df = dest_stats.copy()
+    votes = attractions.groupby('Destination', sort=False)['No_votes'].sum()
+    df['Number_of_ratings'] = df['Destination'].map(votes).fillna(0).astype(np.int64)
+    df.insert(0, 'destination_id', np.arange(first + 1, first + 1 + len(df)))
+    df.insert(1, 'country_id', countries.set_index('Country')['country_id'].reindex(df['Country']).to_numpy())
+    df['Popularity_TripAdvisor_Count'] = df['Number_of_ratings']
+    df.columns = [col.replace(' ', '') for col in df.columns]
+    return df
+
+
+def _chunks(n_destinations, chunk_size):
+    for first in range(0, n_destinations, chunk_size):
+        yield first, min(chunk_size, n_destinations - first)
+
+
+def write_database(db_path, n_destinations, per_destination=30, seed=0, chunk_size=20000):
+    """Writes a synthetic travel_recommendation_final.db-compatible database, chunk by chunk to bound memory.
+
+    It has the per-destination aggregates and rank thresholds of database_creator.py too, so the recommender
+    is loaded the same way as from a real build.
+    """
+    rng = np.random.default_rng(seed)
+    country_stats = generate_country_statistics(max(1, -(-n_destinations // DESTINATIONS_PER_COUNTRY)), rng)
+    countries = country_stats['Country'].to_numpy(dtype=object)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    top_votes = np.empty(0, dtype=np.int64)
+    vote_histogram = None
+    try:
+        countries_frame = countries_table(country_stats)
+        create_table(conn, 'countries', countries_frame, primary_key='country_id')
+        countries_frame.to_sql('countries', conn, if_exists='append', index=False)
+        for first, count in _chunks(n_destinations, chunk_size):
+            dest_stats = generate_destination_statistics(first, count, countries, rng)
+            attractions = generate_attractions(dest_stats['Destination'], dest_stats['Country'], per_destination, rng)
+            destinations = destinations_table(dest_stats, countries_frame, attractions, first)
+            attractions.insert(0, 'destination_id', np.repeat(destinations['destination_id'].to_numpy(), per_destination))
+            if first == 0:
+                create_table(conn, 'destinations', destinations, primary_key='destination_id', foreign_keys={'country_id': ('countries', 'country_id')})
+                create_table(conn, 'attractions', attractions, foreign_keys={'destination_id': ('destinations', 'destination_id')})
+            destinations.to_sql('destinations', conn, if_exists='append', index=False)
+            attractions.to_sql('attractions', conn, if_exists='append', index=False, chunksize=100000)
+            #THE 200 MOST VOTED ATTRACTIONS SO FAR, FOR THE Top_200_Popular FLAG
+            top_votes = np.sort(np.concatenate([top_votes, attractions['No_votes'].to_numpy()]))[-TOP_200:]
+            vote_histogram = add_partial_sums(vote_histogram, attractions['No_votes'].value_counts())
+        create_indexes(conn)
+        create_destination_details(conn, destinations.columns, countries_frame.columns)
+        if len(top_votes):
+            conn.execute("UPDATE attractions SET Top_200_Popular = 1 WHERE No_votes >= ?", (int(top_votes[0]),))
+            #THE SAME SECOND PASS OVER THE ATTRACTIONS AS IN database_creator.py
+            vote_ranks = VoteRanks(vote_histogram, n_destinations * per_destination)
+            destination_names = pd.read_sql_query("SELECT destination_id, Destination FROM destinations", conn).set_index('destination_id')['Destination']
+            stats = destination_attraction_stats(conn, vote_ranks, ALL_ATTRACTION_GROUPS + ['Top_200_Popular'], destination_names, chunk_size * per_destination)
+            create_table(conn, 'destination_attraction_stats', stats, primary_key='destination_id', foreign_keys={'destination_id': ('destinations', 'destination_id')})
+            stats.to_sql('destination_attraction_stats', conn, if_exists='append', index=False)
+            rank_thresholds(vote_ranks, TOP_200, int(top_votes[0])).to_sql('attraction_rank_thresholds', conn, if_exists='replace', index=False)
+        conn.commit()
+    finally:
+        conn.close()
+    return db_path
+
+
+def write_source_csvs(directory, n_destinations, per_destination=30, seed=0, chunk_size=20000):
+    """Writes the four source CSV files database_creator.py reads, under their usual names."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, "destinations_important_14_07_wersja_python_1.xlsx - ")
+    country_stats = generate_country_statistics(max(1, -(-n_destinations // DESTINATIONS_PER_COUNTRY)), rng)
+    countries = country_stats['Country'].to_numpy(dtype=object)
+    country_stats.to_csv(prefix + "Country_Statistics.csv", sep=';', index=False, encoding='latin-1')
+    for chunk_number, (first, count) in enumerate(_chunks(n_destinations, chunk_size)):
+        dest_stats = generate_destination_statistics(first, count, countries, rng)
+        attractions = generate_attractions(dest_stats['Destination'], dest_stats['Country'], per_destination, rng, with_types=True)
+        dest_stats['Number_of_ratings'] = dest_stats['Destination'].map(attractions.groupby('Destination')['No_votes'].sum()).fillna(0).astype(np.int64)
+        options = dict(sep=';', index=False, encoding='latin-1', mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0)
+        dest_stats[['Destination', 'Country']].to_csv(prefix + "Destination_Countries.csv", **options)
+        dest_stats.to_csv(prefix + "Destination_Statistics.csv", **options)
+        attractions.to_csv(prefix + "Attractions.csv", **options)
+    return directory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic travel catalog.")
+    parser.add_argument('--destinations', type=int, default=1000)
+    parser.add_argument('--attractions-per-destination', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="database file to write")
+    parser.add_argument('--csv-dir', default=None, help="directory for the source CSV files of database_creator.py")
+    args = parser.parse_args()
+    if not args.output and not args.csv_dir:
+        args.output = f"synthetic_{args.destinations}.db"
+    if args.output:
+        write_database(args.output, args.destinations, args.attractions_per_destination, args.seed)
+        print(f"Synthetic database written to: {args.output}")
+    if args.csv_dir:
+        write_source_csvs(args.csv_dir, args.destinations, args.attractions_per_destination, args.seed)
+        print(f"Synthetic source files written to: {args.csv_dir}")